@@ -0,0 +1,53 @@
+"""
+`airtime.py`
+======================================================
+LoRa time-on-air, following Semtech AN1200.13.
+No MicroPython modules are imported, so the network server (gur_server)
+uses the same calculator; the duty-cycle budget is in duty_cycle.py.
+"""
+
+
+def parse_datarate(datarate):
+    """ Spreading factor and bandwidth (Hz) of a data rate name, e.g. SF7BW125.
+    """
+    b = datarate.index("B")
+    return int(datarate[2:b]), int(datarate[b + 2:]) * 1000
+
+
+def time_on_air_us(payload_length, spreading_factor, bandwidth, coding_rate=5,
+                   preamble_length=8, enable_CRC=True, implicit_header=False,
+                   low_data_rate=None):
+    """ Time-on-air of one LoRa packet, in microseconds.
+    :param int payload_length: PHYPayload length in bytes.
+    :param int bandwidth: in Hz.
+    :param int coding_rate: denominator of the coding rate, 5 (4/5) to 8 (4/8).
+    :param bool low_data_rate: LowDataRateOptimize, defaults to symbol time > 16 ms.
+    """
+    symbol_us = (1 << spreading_factor) * 1000000 // bandwidth
+    if low_data_rate is None:
+        low_data_rate = symbol_us > 16000
+    de = 2 if low_data_rate else 0
+    bits = 8 * payload_length - 4 * spreading_factor + 28 - (20 if implicit_header else 0)
+    if enable_CRC:
+        bits += 16
+    step = 4 * (spreading_factor - de)
+    payload_symbols = 8
+    if bits > 0:
+        payload_symbols += ((bits + step - 1) // step) * coding_rate
+    # preamble lasts preamble_length + 4.25 symbols
+    return (4 * preamble_length + 17) * symbol_us // 4 + payload_symbols * symbol_us
+
+
+def packet_time_on_air_us(payload_length, parameters, datarate=None):
+    """ time_on_air_us() for the lora_parameters of config.py.
+    """
+    if datarate is None:
+        datarate = parameters['signal_bandwidth']
+    sf, bw = parse_datarate(datarate)
+    return time_on_air_us(
+        payload_length, sf, bw,
+        parameters['coding_rate'],
+        parameters['preamble_length'],
+        parameters['enable_CRC'],
+        parameters['implicit_header'],
+    )
@@ -0,0 +1,270 @@
+"""
+`codec.py`
+======================================================
+Application payload codecs shared by the end node and the servers.
+The registry is keyed by direction and fPort; every version of a payload
+stays registered and versions are told apart by their length. Formats
+are compiled once into a Struct and always carry an explicit byte order,
+so MicroPython and CPython agree byte for byte. Variable length formats
+(DeltaCodec) have no size and carry their version in the first byte.
+"""
+import struct
+from array import array
+
+UPLINK = 0
+DOWNLINK = 1
+
+try:
+    Struct = struct.Struct
+except AttributeError:
+    class Struct:
+        """ struct.Struct for MicroPython ports built without it.
+        """
+
+        def __init__(self, format):
+            self.format = format
+            self.size = struct.calcsize(format)
+
+        def pack(self, *values):
+            return struct.pack(self.format, *values)
+
+        def pack_into(self, buffer, offset, *values):
+            struct.pack_into(self.format, buffer, offset, *values)
+
+        def unpack_from(self, buffer, offset=0):
+            return struct.unpack_from(self.format, buffer, offset)
+
+
+class Codec:
+    """ One version of the payload carried on an fPort.
+    :param int direction: UPLINK or DOWNLINK.
+    :param int version: bumped on every change of format.
+    :param str format: struct format, starting with '<', '>' or '!'.
+    :param tuple fields: names of the packed values, in order.
+    """
+
+    def __init__(self, name, direction, fport, version, format, fields):
+        if format[0] not in "<>!":
+            raise ValueError("Payload formats need an explicit byte order")
+        self.name = name
+        self.direction = direction
+        self.fport = fport
+        self.version = version
+        self.format = format
+        self.fields = fields
+        self._struct = Struct(format)
+        self.size = self._struct.size
+
+    def encode(self, *values):
+        return self._struct.pack(*values)
+
+    def encode_into(self, buffer, offset, *values):
+        """ Packs values into a preallocated buffer, no allocation.
+        """
+        self._struct.pack_into(buffer, offset, *values)
+
+    def decode(self, buffer, offset=0):
+        """ Tuple of values, buffer may be a memoryview.
+        """
+        return self._struct.unpack_from(buffer, offset)
+
+    def decode_dict(self, buffer, offset=0):
+        return dict(zip(self.fields, self._struct.unpack_from(buffer, offset)))
+
+    def decode_many(self, payloads):
+        """ Tuples of many payloads, None for the ones of another length.
+        """
+        unpack = self._struct.unpack_from
+        size = self.size
+        return [unpack(p) if len(p) == size else None for p in payloads]
+
+    def decode_stream(self, buffer):
+        """ Tuples of back-to-back payloads in one buffer.
+        """
+        unpack = self._struct.unpack_from
+        size = self.size
+        return [unpack(buffer, offset) for offset in range(0, len(buffer) - size + 1, size)]
+
+
+def _zigzag(value):
+    return value << 1 if value >= 0 else ((-value) << 1) - 1
+
+
+def _unzigzag(value):
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+def _varint_length(value):
+    n = 1
+    while value > 0x7F:
+        value >>= 7
+        n += 1
+    return n
+
+
+class DeltaCodec:
+    """ Batched (epoch, value) readings of one sensor, variable length.
+    A version byte, then one pair of zigzag varints per reading: the first
+    reading in full, the next ones as the change of the sampling interval
+    and of the value, so a steady period and a slow sensor cost 2 bytes.
+    :param int max_length: longest payload the node sends.
+    """
+
+    size = None
+
+    def __init__(self, name, direction, fport, version, fields, max_length):
+        self.name = name
+        self.direction = direction
+        self.fport = fport
+        self.version = version
+        self.fields = fields
+        self.max_length = max_length
+
+    def ring(self, capacity):
+        """ ReadingRing of capacity readings, sent with this codec.
+        """
+        return ReadingRing(self, capacity)
+
+    def decode(self, buffer, offset=0):
+        """ List of (epoch, value) tuples, buffer may be a memoryview.
+        """
+        if buffer[offset] != self.version:
+            raise ValueError("Unknown batch version")
+        fields = []
+        value = shift = 0
+        for i in range(offset + 1, len(buffer)):
+            value |= (buffer[i] & 0x7F) << shift
+            shift += 7
+            if not buffer[i] & 0x80:
+                fields.append(_unzigzag(value))
+                value = shift = 0
+        if shift or len(fields) & 1:
+            raise ValueError("Truncated batch")
+        readings = []
+        epoch = interval = reading = 0
+        for i in range(0, len(fields), 2):
+            if i:
+                interval += fields[i]
+                epoch += interval
+            else:
+                epoch = fields[0]
+            reading += fields[i + 1]
+            readings.append((epoch, reading))
+        return readings
+
+    def decode_dict(self, buffer, offset=0):
+        return [dict(zip(self.fields, r)) for r in self.decode(buffer, offset)]
+
+
+class ReadingRing:
+    """ Preallocated ring of readings waiting for the next batch uplink;
+    when full the oldest reading is overwritten.
+    """
+
+    def __init__(self, codec, capacity):
+        self.codec = codec
+        self.capacity = capacity
+        self.count = 0
+        self._start = 0
+        self._epochs = array("L", [0] * capacity)
+        self._values = array("h", [0] * capacity)
+
+    def add(self, epoch, value):
+        i = self._start + self.count
+        if i >= self.capacity:
+            i -= self.capacity
+        self._epochs[i] = epoch
+        self._values[i] = value
+        if self.count < self.capacity:
+            self.count += 1
+        else:
+            self._start = i + 1 if i + 1 < self.capacity else 0
+
+    def encode_into(self, buffer, limit=None):
+        """ Packs the oldest readings that fit in limit bytes (default
+        len(buffer)) into buffer and drops them from the ring, no allocation.
+        Returns the payload length.
+        """
+        if limit is None:
+            limit = len(buffer)
+        buffer[0] = self.codec.version
+        offset = 1
+        sent = 0
+        i = self._start
+        epoch = interval = value = 0
+        while sent < self.count:
+            if sent:
+                step = self._epochs[i] - epoch
+                t = _zigzag(step - interval)
+            else:
+                step = 0
+                t = _zigzag(self._epochs[i])
+            v = _zigzag(self._values[i] - value)
+            if offset + _varint_length(t) + _varint_length(v) > limit:
+                break
+            for field in (t, v):
+                while field > 0x7F:
+                    buffer[offset] = (field & 0x7F) | 0x80
+                    field >>= 7
+                    offset += 1
+                buffer[offset] = field
+                offset += 1
+            epoch = self._epochs[i]
+            value = self._values[i]
+            interval = step
+            sent += 1
+            i = i + 1 if i + 1 < self.capacity else 0
+        self._start = i
+        self.count -= sent
+        return offset
+
+
+_registry = {}
+
+
+def register(codec):
+    versions = _registry.setdefault((codec.direction, codec.fport), {})
+    for other in versions.values():
+        if other.size == codec.size:
+            raise ValueError("Versions of one fPort must differ in length")
+    versions[codec.version] = codec
+    return codec
+
+
+def lookup(direction, fport, length=None, version=None):
+    """ Codec of a payload: by version, by length, or the latest one.
+    """
+    versions = _registry.get((direction, fport))
+    if not versions:
+        return None
+    if version is not None:
+        return versions.get(version)
+    if length is None:
+        return versions[max(versions)]
+    for codec in versions.values():
+        if codec.size == length or codec.size is None:
+            return codec
+    return None
+
+
+def decode(direction, fport, payload):
+    """ (codec, values) of a received payload, (None, None) if unknown.
+    """
+    codec = lookup(direction, fport, len(payload))
+    if codec is None:
+        return None, None
+    return codec, codec.decode(payload)
+
+
+# Uplinks
+TEMPERATURE = register(Codec("temperature", UPLINK, 1, 1, "<Qh", ("epoch", "temperature")))
+# up to 36 bytes: a full FOpts still fits the driver's 64-byte frame and DR0-2 (N = 51)
+TEMPERATURE_BATCH = register(DeltaCodec("temperature_batch", UPLINK, 3, 1, ("epoch", "temperature"), 36))
+GAME_THEORY = register(Codec("game_theory", UPLINK, 2, 1, "<BBBBBH",
+                             ("node_id", "state", "last_sat", "p_rew", "action", "period")))
+
+# Downlinks: v1 is the satisfaction byte alone (gur_server.py), v2 adds the overload flag,
+# v3 the uplink period (s) recommended by the server's rate controller
+SATISFACTION_V1 = register(Codec("satisfaction", DOWNLINK, 2, 1, "<B", ("satisfaction",)))
+SATISFACTION_V2 = register(Codec("satisfaction", DOWNLINK, 2, 2, "<BB", ("satisfaction", "overload")))
+SATISFACTION = register(Codec("satisfaction", DOWNLINK, 2, 3, "<BBH", ("satisfaction", "overload", "period")))
@@ -29,6 +29,10 @@ device_config = {
 app_config = {
     'loop': 200,
     'sleep': 100,
+    'max_rate': False,
+    # readings per uplink: 1 sends every reading as it is taken (TEMPERATURE),
+    # more buffers them and sends one delta encoded TEMPERATURE_BATCH frame
+    'batch': 1,
 }
 
 lora_parameters = {
@@ -53,4 +57,5 @@ ttn_config = {
     'nwkey': bytearray([0x56, 0x6B, 0x54, 0xED, 0x53, 0x05, 0x06, 0x2D, 0x86, 0xB4, 0xFB, 0x51, 0xD6, 0x9A, 0xDC, 0x84]),
     'app': bytearray([0x8A, 0x6B, 0xBD, 0xD1, 0x73, 0x45, 0x53, 0xFC, 0xC6, 0xDD, 0x97, 0x42, 0x26, 0x84, 0x85, 0xCC]),
     'country': 'AU',
+    'sub_band': 2,
 }
\ No newline at end of file
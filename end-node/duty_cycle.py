@@ -0,0 +1,91 @@
+"""
+`duty_cycle.py`
+======================================================
+Duty-cycle budget. DutyCycle keeps one token bucket of airtime per
+regulatory sub-band (ttn.regions bands), filled at 1/n of the elapsed
+time, so uplinks can be scheduled at the earliest legal instant instead
+of at a fixed, conservative period.
+"""
+import utime
+
+# ETSI duty cycle is measured over one hour
+DUTY_CYCLE_WINDOW_MS = 3600000
+
+
+class DutyCycle:
+    """ Airtime token buckets, one per duty cycle sub-band.
+    :param tuple bands: (from Hz, to Hz, n) for a 1/n duty cycle, n = 1 is unlimited.
+    :param int window_ms: averaging window, sets the bucket size (window / n).
+    """
+
+    def __init__(self, bands, window_ms=DUTY_CYCLE_WINDOW_MS):
+        count = len(bands)
+        self._divisors = tuple(band[2] for band in bands)
+        # budgets in us of airtime, buckets start full
+        self._capacity = tuple(window_ms * 1000 // n for n in self._divisors)
+        self._tokens = list(self._capacity)
+        # remainder of the refill, in us of elapsed time
+        self._carry = [0] * count
+        self._last = [utime.ticks_ms()] * count
+
+    def _refill(self, band):
+        now = utime.ticks_ms()
+        elapsed = utime.ticks_diff(now, self._last[band])
+        if elapsed <= 0:
+            return
+        self._last[band] = now
+        n = self._divisors[band]
+        earned = elapsed * 1000 + self._carry[band]
+        tokens = self._tokens[band] + earned // n
+        self._carry[band] = earned % n
+        if tokens >= self._capacity[band]:
+            tokens = self._capacity[band]
+            self._carry[band] = 0
+        self._tokens[band] = tokens
+
+    def wait_ms(self, band, time_on_air):
+        """ ms until a packet of time_on_air us may be sent on band.
+        """
+        if self._divisors[band] == 1:
+            return 0
+        self._refill(band)
+        missing = time_on_air - self._tokens[band]
+        if missing <= 0:
+            return 0
+        if time_on_air > self._capacity[band]:
+            raise ValueError("Packet longer than the duty cycle budget")
+        # tokens come in at 1/n us per us
+        return (missing * self._divisors[band] + 999) // 1000
+
+    def earliest(self, bands, time_on_air):
+        """ (wait in ms, band) of the band of bands free the soonest.
+        """
+        best = None
+        for band in bands:
+            wait = self.wait_ms(band, time_on_air)
+            if best is None or wait < best[0]:
+                best = (wait, band)
+                if wait == 0:
+                    break
+        return best
+
+    def consume(self, band, time_on_air):
+        """ Charges a transmission of time_on_air us to band.
+        """
+        if self._divisors[band] == 1:
+            return
+        self._refill(band)
+        self._tokens[band] -= time_on_air
+
+    def min_interval_ms(self, bands, time_on_air):
+        """ Shortest sustainable uplink period when hopping over bands.
+        Adaptive periods (e.g. the game theory period) should stay above it.
+        """
+        rate = 0
+        for band in bands:
+            if self._divisors[band] == 1:
+                return 0
+            # packets per ms sustained by this band, times time_on_air
+            rate += 1000000 // self._divisors[band]
+        # time_on_air (us) * n / number of bands, as ms
+        return (time_on_air * 1000 + rate - 1) // rate
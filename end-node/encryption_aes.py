@@ -23,13 +23,52 @@
 
 from ucryptolib import aes
 
+# message direction, byte 5 of the A and B0 blocks
+UPLINK = 0
+DOWNLINK = 1
+
+# MHDR message types
+MTYPE_UNCONFIRMED_UP = 0x40
+MTYPE_UNCONFIRMED_DOWN = 0x60
+MTYPE_CONFIRMED_UP = 0x80
+MTYPE_CONFIRMED_DOWN = 0xA0
+
+# MHDR(1) + FHDR(7) + MIC(4)
+MIN_FRAME_LENGTH = 12
+MAX_FRAME_LENGTH = 255
+# frames further than this ahead of the last frame counter are rejected
+MAX_FCNT_GAP = 16384
+
 class AES:
-    
+
     def __init__(self, device_address, app_key, network_key, frame_counter):
         self._app_key = app_key
         self._device_address = device_address
         self._network_key = network_key
         self.frame_counter = frame_counter
+        # last accepted FCnt of received frames, None until the first one
+        self.frame_counter_down = None
+        self.frame_counter_up = None
+
+        # AES contexts, working blocks and CMAC subkeys are kept for the
+        # whole session so no frame allocates them again
+        self._app_aes = aes(self._app_key, 1)
+        self._network_aes = aes(self._network_key, 1)
+        self._block_a = bytearray(16)
+        self._block_s = bytearray(16)
+        self._key_k1 = bytearray(16)
+        self._key_k2 = bytearray(16)
+        self._mic_generate_keys(self._key_k1, self._key_k2)
+        self._mic = bytearray(4)
+
+        # fields of the last frame accepted by decrypt_payload()
+        self._payload = bytearray(MAX_FRAME_LENGTH)
+        self._payload_view = memoryview(self._payload)
+        self.mtype = 0
+        self.fctrl = 0
+        self.fopts = bytearray(15)
+        self.fopts_length = 0
+        self.fport = None
 
     def encrypt(self, aes_data):
         """Performs AES Encryption routine with data.
@@ -38,147 +77,212 @@ class AES:
         self.encrypt_payload(aes_data)
         return aes_data
 
-    def decrypt_payload(self, cipher):
-        _aes = aes(self._app_key, 1)
-        print(cipher)
-        return cipher
+    def decrypt_payload(self, packet, packet_length=None, direction=DOWNLINK):
+        """Parses, authenticates and decrypts a received PHYPayload.
+        DevAddr, frame counter and MIC are checked before FRMPayload is
+        decrypted into a buffer owned by this object, so the returned view
+        is only valid until the next call. MHDR, FCtrl, FOpts and FPort of
+        the frame are kept in mtype, fctrl, fopts/fopts_length and fport.
+        :param bytearray packet: PHYPayload, MHDR up to MIC.
+        :param int packet_length: PHYPayload length, defaults to len(packet).
+        :param int direction: DOWNLINK on the node, UPLINK on a server.
+        :return: FRMPayload memoryview, or None if the frame was rejected.
+        """
+        if packet_length is None:
+            packet_length = len(packet)
+        if packet_length < MIN_FRAME_LENGTH:
+            return None
+
+        # MHDR
+        mtype = packet[0] & 0xE0
+        if direction == DOWNLINK:
+            if mtype != MTYPE_UNCONFIRMED_DOWN and mtype != MTYPE_CONFIRMED_DOWN:
+                return None
+        elif mtype != MTYPE_UNCONFIRMED_UP and mtype != MTYPE_CONFIRMED_UP:
+            return None
+
+        # FHDR: DevAddr (LSB first), FCtrl, FCnt, FOpts
+        if packet[1] != self._device_address[3] or \
+           packet[2] != self._device_address[2] or \
+           packet[3] != self._device_address[1] or \
+           packet[4] != self._device_address[0]:
+            return None
+        fctrl = packet[5]
+        fopts_length = fctrl & 0x0F
+        port_index = 8 + fopts_length
+        mic_index = packet_length - 4
+        if port_index > mic_index:
+            return None
+
+        # rebuild the 32 bit counter from the 16 LSB sent over the air
+        last = self.frame_counter_down if direction == DOWNLINK else self.frame_counter_up
+        frame_counter = packet[6] | (packet[7] << 8)
+        if last is not None:
+            frame_counter |= last & 0xFFFF0000
+            if frame_counter <= last:
+                frame_counter += 0x10000
+
+        # MIC over MHDR | FHDR | FPort | FRMPayload, then the counter policy,
+        # so only an authentic frame is ever judged on its FCnt
+        mic = self._compute_mic(packet, mic_index, direction, frame_counter, self._mic)
+        for i in range(4):
+            if mic[i] != packet[mic_index + i]:
+                return None
+        if last is not None and frame_counter - last > MAX_FCNT_GAP:
+            return None
+
+        if direction == DOWNLINK:
+            self.frame_counter_down = frame_counter
+        else:
+            self.frame_counter_up = frame_counter
+        self.mtype = mtype
+        self.fctrl = fctrl
+        self.fopts_length = fopts_length
+        for i in range(fopts_length):
+            self.fopts[i] = packet[8 + i]
+
+        # no FPort means no FRMPayload
+        if port_index == mic_index:
+            self.fport = None
+            return self._payload_view[0:0]
 
-    def encrypt_payload(self, data):
+        self.fport = packet[port_index]
+        length = mic_index - port_index - 1
+        payload = self._payload
+        for i in range(length):
+            payload[i] = packet[port_index + 1 + i]
+        # FPort 0 carries MAC commands, encrypted with the network key
+        self._cipher(
+            payload, length,
+            self._network_aes if self.fport == 0 else self._app_aes,
+            direction, frame_counter
+        )
+        return self._payload_view[0:length]
+
+    def encrypt_payload(self, data, direction=UPLINK, frame_counter=None):
         """Encrypts data payload.
         :param bytearray data: Data to-be-encrypted.
+        :param int direction: UPLINK or DOWNLINK.
+        :param int frame_counter: defaults to the uplink frame counter.
         """
-        _aes = aes(self._app_key, 1)
+        if frame_counter is None:
+            frame_counter = self.frame_counter
+        self._cipher(data, len(data), self._app_aes, direction, frame_counter)
 
-        block_a = bytearray(16)
-        # calculate required number of blocks
-        num_blocks = len(data) // 16
-        incomplete_block_size = len(data) % 16
-        if incomplete_block_size != 0:
-            num_blocks += 1
-        # k = data ptr
+    def _cipher(self, data, length, cipher, direction, frame_counter):
+        """XORs data with the LoRaWAN AES-CTR keystream, in place.
+        """
+        block_a = self._block_a
+        block_s = self._block_s
+        block_a[0] = 0x01
+        block_a[1] = 0x00
+        block_a[2] = 0x00
+        block_a[3] = 0x00
+        block_a[4] = 0x00
+        block_a[5] = direction
+        # block from device_address, MSB first
+        block_a[6] = self._device_address[3]
+        block_a[7] = self._device_address[2]
+        block_a[8] = self._device_address[1]
+        block_a[9] = self._device_address[0]
+        # block from frame counter
+        block_a[10] = frame_counter & 0xFF
+        block_a[11] = (frame_counter >> 8) & 0xFF
+        block_a[12] = (frame_counter >> 16) & 0xFF
+        block_a[13] = (frame_counter >> 24) & 0xFF
+        block_a[14] = 0x00
+        # k = data ptr, i = block counter
         k = 0
         i = 1
-        while i <= num_blocks:
-            block_a[0] = 0x01
-            block_a[1] = 0x00
-            block_a[2] = 0x00
-            block_a[3] = 0x00
-            block_a[4] = 0x00
-            block_a[5] = 0x00
-            # block from device_address, MSB first
-            block_a[6] = self._device_address[3]
-            block_a[7] = self._device_address[2]
-            block_a[8] = self._device_address[1]
-            block_a[9] = self._device_address[0]
-            # block from frame counter
-            block_a[10] = self.frame_counter & 0x00FF
-            block_a[11] = (self.frame_counter >> 8) & 0x00FF
-            block_a[12] = 0x00
-            block_a[13] = 0x00
-            block_a[14] = 0x00
+        while k < length:
             block_a[15] = i
             # calculate S
-            #self._aes_encrypt(block_a, self._app_key)
-            block_a = bytearray(_aes.encrypt(block_a))
-            # check for last block
-            if i != num_blocks:
-                for j in range(16):
-                    data[k] ^= block_a[j]
-                    k += 1
-            else:
-                if incomplete_block_size == 0:
-                    incomplete_block_size = 16
-                for j in range(incomplete_block_size):
-                    data[k] ^= block_a[j]
-                    k += 1
+            cipher.encrypt(block_a, block_s)
+            n = length - k
+            if n > 16:
+                n = 16
+            for j in range(n):
+                data[k] ^= block_s[j]
+                k += 1
             i += 1
 
-
-    def calculate_mic(self, lora_packet, lora_packet_length, mic):
+    def calculate_mic(self, lora_packet, lora_packet_length, mic, direction=UPLINK, frame_counter=None):
         """Calculates the validity of data messages, generates a message integrity check bytearray.
         """
-        _aes = aes(self._network_key, 1)
-        block_b = bytearray(16)
-        key_k1 = bytearray(16)
-        key_k2 = bytearray(16)
-        old_data = bytearray(16)
-        new_data = bytearray(16)
-        block_b[0] = 0x49
-        block_b[6] = self._device_address[3]
-        block_b[7] = self._device_address[2]
-        block_b[8] = self._device_address[1]
-        block_b[9] = self._device_address[0]
-        block_b[10] = self.frame_counter & 0x00FF
-        block_b[11] = (self.frame_counter >> 8) & 0x00FF
-        block_b[15] = lora_packet_length
+        if frame_counter is None:
+            frame_counter = self.frame_counter
+        return self._compute_mic(lora_packet, lora_packet_length, direction, frame_counter, mic)
+
+    def _compute_mic(self, lora_packet, lora_packet_length, direction, frame_counter, mic):
+        """AES-CMAC over B0 | lora_packet, first 4 bytes copied into mic.
+        """
+        _aes = self._network_aes
+        old_data = self._block_s
+        new_data = self._block_a
+        new_data[0] = 0x49
+        new_data[1] = 0x00
+        new_data[2] = 0x00
+        new_data[3] = 0x00
+        new_data[4] = 0x00
+        new_data[5] = direction
+        new_data[6] = self._device_address[3]
+        new_data[7] = self._device_address[2]
+        new_data[8] = self._device_address[1]
+        new_data[9] = self._device_address[0]
+        new_data[10] = frame_counter & 0xFF
+        new_data[11] = (frame_counter >> 8) & 0xFF
+        new_data[12] = (frame_counter >> 16) & 0xFF
+        new_data[13] = (frame_counter >> 24) & 0xFF
+        new_data[14] = 0x00
+        new_data[15] = lora_packet_length
         # calculate num. of blocks and blocksz of last block
         num_blocks = lora_packet_length // 16
         incomplete_block_size = lora_packet_length % 16
         if incomplete_block_size != 0:
             num_blocks += 1
-        # generate keys
-        self._mic_generate_keys(key_k1, key_k2)
         # aes encryption on block_b
-        block_b = bytearray(_aes.encrypt(block_b))
+        _aes.encrypt(new_data, old_data)
 
-        # copy block_b to old_data
-        for i in range(16):
-            old_data[i] = block_b[i]
         block_counter = 1
         # calculate until n-1 packet blocks
         k = 0  # ptr
         while block_counter < num_blocks:
-            # copy data into array
+            # copy data into array, XOR with old_data
             for i in range(16):
-                new_data[i] = lora_packet[k]
+                new_data[i] = lora_packet[k] ^ old_data[i]
                 k += 1
-            # XOR new_data with old_data
-            self._xor_data(new_data, old_data)
-            # aes encrypt new_data
-            new_data = bytearray(_aes.encrypt(new_data))
-            # copy new_data to old_data
-            for i in range(16):
-                old_data[i] = new_data[i]
-            # increase block_counter
+            # aes encrypt new_data into old_data
+            _aes.encrypt(new_data, old_data)
             block_counter += 1
         # perform calculation on last block
         if incomplete_block_size == 0:
+            # xor with key 1 and with old data
             for i in range(16):
-                new_data[i] = lora_packet[k]
+                new_data[i] = lora_packet[k] ^ self._key_k1[i] ^ old_data[i]
                 k += 1
-            # xor with key 1
-            self._xor_data(new_data, key_k1)
-            # xor with old data
-            self._xor_data(new_data, old_data)
-            # aes routine
-            new_data = bytearray(_aes.encrypt(new_data))
         else:
-            # copy the remaining data
+            # copy the remaining data, padded, xor with key 2 and old data
             for i in range(16):
                 if i < incomplete_block_size:
                     new_data[i] = lora_packet[k]
                     k += 1
-                if i == incomplete_block_size:
+                elif i == incomplete_block_size:
                     new_data[i] = 0x80
-                if i > incomplete_block_size:
+                else:
                     new_data[i] = 0x00
-            # perform xor with key 2
-            self._xor_data(new_data, key_k2)
-            # perform xor with old data
-            self._xor_data(new_data, old_data)
-            new_data = bytearray(_aes.encrypt(new_data))
+                new_data[i] ^= self._key_k2[i] ^ old_data[i]
+        _aes.encrypt(new_data, old_data)
         # load MIC[] with data
-        mic[0] = new_data[0]
-        mic[1] = new_data[1]
-        mic[2] = new_data[2]
-        mic[3] = new_data[3]
+        mic[0] = old_data[0]
+        mic[1] = old_data[1]
+        mic[2] = old_data[2]
+        mic[3] = old_data[3]
         # return message integrity check array to calling method
         return mic
 
     def _mic_generate_keys(self, key_1, key_2):
         # encrypt the 0's in k1 with network key
-        _aes = aes(self._network_key, 1)
-        key_1 = bytearray(_aes.encrypt(key_1))
+        self._network_aes.encrypt(bytearray(16), key_1)
         # perform gen_key on key_1
         # check if key_1's msb is 1
         msb_key = (key_1[0] & 0x80) == 0x80
@@ -218,4 +322,4 @@ class AES:
         :param bytearray old_data: data to be xor'd.
         """
         for i in range(16):
-            new_data[i] ^= old_data[i]
\ No newline at end of file
+            new_data[i] ^= old_data[i]
@@ -0,0 +1,124 @@
+"""
+`machine.py`
+======================================================
+Host shim of the MicroPython machine module, just Pin and SPI.
+Pins and SPI buses are wired to emulated devices (see sx127x_emu.py)
+through attach_pin() and attach_spi().
+"""
+import utime
+
+_pins = {}
+_pin_listeners = {}
+_spi_devices = {}
+
+
+def attach_pin(pin_id, listener):
+    """ listener(value) is called when the MCU drives pin_id.
+    """
+    _pin_listeners[pin_id] = listener
+
+
+def attach_spi(unit, device):
+    """ device.spi_transfer(data) -> bytes is called for SPI transfers.
+    """
+    _spi_devices[unit] = device
+
+
+def reset_wiring():
+    _pins.clear()
+    _pin_listeners.clear()
+    _spi_devices.clear()
+
+
+def unique_id():
+    return b"\xe6\x61\x41\x04\x03\x5b\x2c\x28"
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __new__(cls, pin_id, *args, **kwargs):
+        # the same pin id always maps to the same pin, as on the MCU
+        pin = _pins.get(pin_id)
+        if pin is None:
+            pin = object.__new__(cls)
+            pin._id = pin_id
+            pin._value = 0
+            pin._handler = None
+            pin._trigger = 0
+            _pins[pin_id] = pin
+        return pin
+
+    def __init__(self, pin_id, mode=-1, pull=-1, value=None):
+        if value is not None:
+            self.value(value)
+
+    def value(self, value=None):
+        if value is None:
+            return self._value
+        self._value = 1 if value else 0
+        listener = _pin_listeners.get(self._id)
+        if listener is not None:
+            listener(self._value)
+        return None
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING):
+        self._handler = handler
+        self._trigger = trigger
+
+    def drive(self, value):
+        """ Driven by an emulated device, fires the IRQ handler on edges.
+        """
+        value = 1 if value else 0
+        old = self._value
+        self._value = value
+        if self._handler is None or old == value:
+            return
+        if (value and self._trigger & Pin.IRQ_RISING) or \
+           (not value and self._trigger & Pin.IRQ_FALLING):
+            self._handler(self)
+
+
+class SPI:
+    MSB = 0
+    LSB = 1
+
+    def __init__(self, unit, baudrate=1000000, polarity=0, phase=0, bits=8,
+                 firstbit=MSB, sck=None, mosi=None, miso=None):
+        self._unit = unit
+        self.baudrate = baudrate
+
+    def _transfer(self, data):
+        device = _spi_devices.get(self._unit)
+        # clock the bytes out at the bus rate
+        utime.advance(len(data) * 8 * 1000000 // self.baudrate)
+        if device is None:
+            return bytes(len(data))
+        return device.spi_transfer(bytes(data))
+
+    def write(self, buf):
+        self._transfer(buf)
+
+    def read(self, nbytes, write=0x00):
+        return self._transfer(bytes([write]) * nbytes)
+
+    def readinto(self, buf, write=0x00):
+        buf[0:len(buf)] = self._transfer(bytes([write]) * len(buf))
+
+    def write_readinto(self, write_buf, read_buf):
+        read_buf[0:len(write_buf)] = self._transfer(write_buf)
+
+    def deinit(self):
+        pass
@@ -0,0 +1,342 @@
+"""
+`run_host.py`
+======================================================
+Runs the end node stack on the host, with the shims in this directory
+standing in for machine / utime / urandom / ubinascii / ucryptolib and
+an emulated SX127x on the SPI bus.
+
+    python run_host.py              golden vectors + uplink / downlink checks
+    python run_host.py bench [n]    frames built per second
+    python run_host.py main [n]     runs main.py until n uplinks were sent
+"""
+import sys
+
+HOST_DIR = __file__.rsplit("/", 1)[0] if "/" in __file__ else "."
+NODE_DIR = HOST_DIR + "/.."
+sys.path.insert(0, HOST_DIR)
+sys.path.insert(1, NODE_DIR)
+
+try:
+    from time import perf_counter
+except ImportError:
+    import time
+
+    def perf_counter():
+        return time.ticks_us() / 1000000
+
+import machine
+import ucryptolib
+from sx127x_emu import SX127xEmulator, StopEmulation
+import sx127x
+import encryption_aes
+from encryption_aes import AES, UPLINK, DOWNLINK
+from airtime import time_on_air_us
+from duty_cycle import DutyCycle
+from codec import TEMPERATURE, TEMPERATURE_BATCH
+from sx127x_emu import time_on_air_us as emulator_time_on_air_us
+
+# LoRaWAN 1.0 frame used by most LoRaWAN stacks as a reference
+VECTOR_DEVADDR = bytes.fromhex("49be7df1")
+VECTOR_NWKSKEY = bytes.fromhex("44024241ed4ce9a68c6a8bc055233fd3")
+VECTOR_APPSKEY = bytes.fromhex("ec925802ae430ca77fd3dd73cb2cc588")
+VECTOR_UPLINK = bytes.fromhex("40f17dbe4900020001954378762b11ff0d")  # FCnt 2, "test"
+
+PINS = {
+    'spi_unit': 0,
+    'miso': 4,
+    'mosi': 3,
+    'ss': 5,
+    'sck': 2,
+    'dio_0': 9,
+    'reset': 8,
+    'led': 25,
+}
+
+LORA_PARAMETERS = {
+    'tx_power_level': 2,
+    'signal_bandwidth': 'SF7BW125',
+    'spreading_factor': 7,
+    'coding_rate': 5,
+    'sync_word': 0x34,
+    'implicit_header': False,
+    'preamble_length': 8,
+    'enable_CRC': True,
+    'invert_IQ': False,
+}
+
+
+def _check(name, ok):
+    print("{:<48} {}".format(name, "ok" if ok else "FAIL"))
+    return ok
+
+
+def cmac(key, message):
+    """ Reference AES-CMAC (RFC 4493), independent from encryption_aes.
+    """
+    cipher = ucryptolib.aes(key, 1)
+
+    def double(block):
+        value = int.from_bytes(block, "big") << 1
+        if value >> 128:
+            value = (value ^ 0x87) & ((1 << 128) - 1)
+        return value.to_bytes(16, "big")
+
+    k1 = double(cipher.encrypt(bytes(16)))
+    k2 = double(k1)
+    blocks = [message[i:i + 16] for i in range(0, len(message), 16)] or [b""]
+    last = blocks.pop()
+    if len(last) == 16:
+        last = bytes(a ^ b for a, b in zip(last, k1))
+    else:
+        last = bytes(a ^ b for a, b in zip(last + b"\x80" + bytes(15 - len(last)), k2))
+    state = bytes(16)
+    for block in blocks + [last]:
+        state = cipher.encrypt(bytes(a ^ b for a, b in zip(state, block)))
+    return state
+
+
+def lorawan_b0(devaddr, direction, frame_counter, length):
+    return (bytes([0x49, 0, 0, 0, 0, direction]) + bytes(reversed(devaddr)) +
+            frame_counter.to_bytes(4, "little") + bytes([0, length]))
+
+
+def make_radio(devaddr=VECTOR_DEVADDR, nwkskey=VECTOR_NWKSKEY, appskey=VECTOR_APPSKEY,
+               country="EU", max_frames=None, channel=0):
+    """ Emulator + SX127x driver wired together.
+    """
+    machine.reset_wiring()
+    emulator = SX127xEmulator(PINS, max_frames=max_frames)
+    spi = machine.SPI(PINS['spi_unit'], baudrate=10000000)
+    ttn = sx127x.TTN(bytearray(devaddr), bytearray(nwkskey), bytearray(appskey), country=country)
+    lora = sx127x.SX127x(spi, pins=PINS, ttn_config=ttn, channel=channel,
+                         lora_parameters=dict(LORA_PARAMETERS))
+    return emulator, lora
+
+
+def run_vectors():
+    sx127x.__DEBUG__ = False
+    ok = True
+
+    # AES, FIPS-197 appendix C.1
+    ok &= _check("AES-128 FIPS-197 C.1", ucryptolib.aes(bytes(range(16)), 1).encrypt(
+        bytes.fromhex("00112233445566778899aabbccddeeff")).hex() == "69c4e0d86a7b0430d8cdb78070b4c55a")
+
+    # AES-CMAC, RFC 4493 section 4
+    key = bytes.fromhex("2b7e151628aed2a6abf7158809cf4f3c")
+    message = bytes.fromhex(
+        "6bc1bee22e409f96e93d7e117393172aae2d8a571e03ac9c9eb76fac45af8e51"
+        "30c81c46a35ce411e5fbc1191a0a52eff69f2445df4f9b17ad2b417be66c3710")
+    for length, tag in ((0, "bb1d6929e95937287fa37d129b756746"),
+                        (16, "070a16b46b4d4144f79bdd9dd04a287c"),
+                        (40, "dfa66747de9ae63030ca32611497c827"),
+                        (64, "51f0bebf7e3b9d92fc49741779363cfe")):
+        ok &= _check("AES-CMAC RFC 4493, {} bytes".format(length),
+                     cmac(key, message[:length]).hex() == tag)
+
+    # MIC of every length against the reference CMAC over B0 | msg
+    aes = AES(VECTOR_DEVADDR, VECTOR_APPSKEY, VECTOR_NWKSKEY, 0x1234)
+    good = True
+    for length in range(1, 65):
+        for direction in (UPLINK, DOWNLINK):
+            packet = bytearray((i * 7 + length) & 0xFF for i in range(length))
+            mic = aes.calculate_mic(packet, length, bytearray(4), direction, 0x11234)
+            ref = cmac(VECTOR_NWKSKEY, lorawan_b0(VECTOR_DEVADDR, direction, 0x11234, length) + packet)
+            good &= bytes(mic) == ref[:4]
+    ok &= _check("MIC vs reference CMAC, 1..64 bytes, up/down", good)
+
+    # uplink decode, server side direction
+    aes = AES(VECTOR_DEVADDR, VECTOR_APPSKEY, VECTOR_NWKSKEY, 0)
+    payload = aes.decrypt_payload(bytearray(VECTOR_UPLINK), direction=UPLINK)
+    ok &= _check("decode reference uplink", payload is not None and bytes(payload) == b"test"
+                 and aes.fport == 1 and aes.frame_counter_up == 2)
+    ok &= _check("reject replayed uplink",
+                 aes.decrypt_payload(bytearray(VECTOR_UPLINK), direction=UPLINK) is None)
+
+    # full uplink path: driver -> SPI -> emulated radio
+    emulator, lora = make_radio()
+    lora.send_data(data=b"test", data_length=4, frame_counter=2)
+    frame = emulator.frames[-1]
+    ok &= _check("SX127x.send_data builds reference frame", frame["payload"] == VECTOR_UPLINK)
+    ok &= _check("uplink modulation 868.1 MHz SF7 BW125 CRC",
+                 abs(frame["frequency"] - 868100000) < 100 and frame["sf"] == 7
+                 and frame["bw"] == 125000 and frame["crc"] and not frame["invert_iq_tx"])
+
+    # downlinks in RX1 and RX2
+    network = AES(VECTOR_DEVADDR, VECTOR_APPSKEY, VECTOR_NWKSKEY, 0)
+    received = []
+
+    def downlink(frame_counter, data, port=2, fopts=b""):
+        body = bytearray(data)
+        network.encrypt_payload(body, DOWNLINK, frame_counter)
+        packet = bytearray([0x60]) + bytearray(reversed(VECTOR_DEVADDR)) + \
+            bytearray([len(fopts), frame_counter & 0xFF, (frame_counter >> 8) & 0xFF]) + \
+            bytearray(fopts) + bytearray([port]) + body
+        return packet + network.calculate_mic(packet, len(packet), bytearray(4), DOWNLINK, frame_counter)
+
+    lora.on_receive(lambda radio, data: received.append((radio.downlink_port, bytes(data))), irq=False)
+    emulator.inject_downlink(downlink(7, b"\x50\x01"), delay_ms=1000, frequency=868100000, sf=7)
+    ok &= _check("RX1 downlink decrypted", lora.receive_windows() and received[-1:] == [(2, b"\x50\x01")])
+
+    lora.send_data(data=b"next", data_length=4, frame_counter=3)
+    emulator.inject_downlink(downlink(8, b"\x14\x00"), delay_ms=2000, frequency=869525000, sf=9)
+    ok &= _check("RX2 downlink decrypted", lora.receive_windows() and received[-1:] == [(2, b"\x14\x00")])
+    ok &= _check("radio sleeps after the windows", emulator.mode == 0x00)
+
+    lora.send_data(data=b"late", data_length=4, frame_counter=4)
+    emulator.inject_downlink(downlink(8, b"\x14\x00"), delay_ms=1000, frequency=868100000, sf=7)
+    count = len(received)
+    lora.receive_windows()
+    ok &= _check("replayed downlink rejected", len(received) == count)
+
+    # LinkADRReq: SF12 with LowDataRateOptimize, then back to SF9 over RX1
+    lora.apply_data_rate(0)
+    lora.send_data(data=b"slow", data_length=4, frame_counter=5)
+    frame = emulator.frames[-1]
+    ok &= _check("SF12BW125 uplink sets LowDataRateOptimize",
+                 frame["sf"] == 12 and frame["low_data_rate"])
+    # DR3 (SF9), TXPower 1, ChMask channels 0-2, ChMaskCntl 0, NbTrans 1
+    emulator.inject_downlink(downlink(9, b"", port=2, fopts=b"\x03\x31\x07\x00\x01"),
+                             delay_ms=1000, frequency=868100000, sf=12)
+    lora.receive_windows()
+    lora.send_data(data=b"fast", data_length=4, frame_counter=6)
+    frame = emulator.frames[-1]
+    ok &= _check("LinkADRReq DR3 applied, LinkADRAns in FOpts",
+                 frame["sf"] == 9 and not frame["low_data_rate"] and lora.data_rate == 3 and
+                 frame["payload"][5] == 2 and frame["payload"][8:10] == b"\x03\x07")
+    lora.send_data(data=b"once", data_length=4, frame_counter=7)
+    ok &= _check("LinkADRAns sent once", emulator.frames[-1]["payload"][5] == 0)
+    # RFU data rate: nothing applied, only the data rate is NACKed
+    emulator.inject_downlink(downlink(10, b"", port=2, fopts=b"\x03\x71\x07\x00\x01"),
+                             delay_ms=1000, frequency=868100000, sf=9)
+    lora.receive_windows()
+    lora.send_data(data=b"same", data_length=4, frame_counter=8)
+    frame = emulator.frames[-1]
+    ok &= _check("LinkADRReq with RFU data rate rejected",
+                 frame["sf"] == 9 and frame["payload"][8:10] == b"\x03\x05")
+
+    # channel hopping over the TTN AU915 sub-band 2
+    emulator, lora = make_radio(country="AU", channel=None)
+    for frame_counter in range(16):
+        lora.send_data(data=b"hop", data_length=3, frame_counter=frame_counter)
+    # RegFrf has a 61 Hz step
+    used = [(frame["frequency"] + 500) // 1000 * 1000 for frame in emulator.frames]
+    sub_band = [916800000 + 200000 * n for n in range(8)]
+    ok &= _check("AU915 hopping covers sub-band 2 evenly",
+                 all(used.count(f) == 2 for f in sub_band) and len(used) == 16)
+    ok &= _check("no channel twice in a row", all(a != b for a, b in zip(used, used[1:])))
+
+    # AU915 LinkADRReq block as sent by gur_server/adr.py: ChMaskCntl 7
+    # (500 kHz channel 65 only), then ChMaskCntl 0 (channels 8-15), DR5
+    region = lora._region
+    mask = region.apply_ch_mask(region.apply_ch_mask(0, 7, 0x0002), 0, 0xFF00)
+    lora.handle_mac_commands(bytearray(b"\x03\x50\x02\x00\x71\x03\x50\x00\xff\x01"), 10)
+    ok &= _check("AU915 LinkADRReq block keeps sub-band 2",
+                 mask == region.sub_band_mask(2) and lora._channel_mask == mask and
+                 bytes(lora._mac_answers[:lora._mac_answers_length]) == b"\x03\x07\x03\x07")
+
+    # time-on-air, published values and the emulator's own formula
+    ok &= _check("time-on-air SF7BW125 23 B = 61.696 ms",
+                 time_on_air_us(23, 7, 125000) == 61696)
+    ok &= _check("time-on-air SF12BW125 64 B = 2793.472 ms",
+                 time_on_air_us(64, 12, 125000) == 2793472)
+    good = True
+    for sf in range(7, 13):
+        for bw in (125000, 250000, 500000):
+            for length in (1, 13, 23, 51, 222):
+                good &= time_on_air_us(length, sf, bw) == emulator_time_on_air_us(length, sf, bw)
+    ok &= _check("time-on-air matches emulator, SF7-12", good)
+
+    # batched readings: 16 readings every 200 s, ring of 16
+    readings = TEMPERATURE_BATCH.ring(16)
+    expected = [(1760000000 + 200 * n, 20 + (7 * n) % 21) for n in range(17)]
+    for epoch, temperature in expected:
+        readings.add(epoch, temperature)
+    payload = bytearray(TEMPERATURE_BATCH.max_length)
+    first = readings.encode_into(payload)
+    decoded = TEMPERATURE_BATCH.decode(payload[:first])
+    second = readings.encode_into(payload)
+    decoded += TEMPERATURE_BATCH.decode(payload[:second])
+    ok &= _check("batch ring drops oldest, 15 readings in 36 B",
+                 decoded == expected[1:] and first == 36 and readings.count == 0)
+    emulator, lora = make_radio()
+    lora.send_data(data=payload, data_length=second, frame_counter=0, fport=TEMPERATURE_BATCH.fport)
+    frame = emulator.frames[-1]
+    single = time_on_air_us(13 + TEMPERATURE.size, 7, 125000)
+    ok &= _check("batch uplink on FPort 3, 6x less airtime/reading",
+                 frame["payload"][8] == 3 and time_on_air_us(13 + first, 7, 125000) * 6 < single * 15)
+
+    # EU868 duty cycle, shortened to a 60 s window to keep the run short
+    emulator, lora = make_radio(country="EU", channel=None)
+    lora.duty_cycle = DutyCycle(lora._region.bands, window_ms=60000)
+    for frame_counter in range(60):
+        lora.send_data(data=bytes(10), data_length=10, frame_counter=frame_counter)
+    spent = {}
+    for frame in emulator.frames:
+        band = lora._region._band((frame["frequency"] + 500) // 1000 * 1000)
+        spent[band] = spent.get(band, 0) + frame["toa_us"]
+    elapsed = emulator.frames[-1]["time_us"] - emulator.frames[0]["time_us"]
+    ok &= _check("EU868 1% per sub-band over 60 uplinks",
+                 sorted(spent) == [1, 2] and
+                 all(us <= 600000 + elapsed // 100 for us in spent.values()))
+    period = lora.min_uplink_period_ms(10)
+    ok &= _check("sustainable period over two 1% sub-bands",
+                 period == (61696 * 100 // 2 + 999) // 1000)
+
+    print("backend:", "cryptography" if ucryptolib.Cipher is not None else "pure python AES")
+    return ok
+
+
+def run_bench(frames=2000):
+    sx127x.__DEBUG__ = False
+    data = bytearray(b"\x01\x02\x03\x04\x05\x06\x07\x08\x09\x0a")
+    aes = AES(VECTOR_DEVADDR, VECTOR_APPSKEY, VECTOR_NWKSKEY, 0)
+
+    # PHYPayload construction only: FRMPayload encryption + MIC
+    packet = bytearray(64)
+    start = perf_counter()
+    for frame_counter in range(frames):
+        aes.frame_counter = frame_counter
+        body = bytearray(data)
+        aes.encrypt(body)
+        packet[9:9 + len(body)] = body
+        aes.calculate_mic(packet, 9 + len(body), bytearray(4))
+    built = frames / (perf_counter() - start)
+
+    # full send_data through the emulated radio
+    emulator, lora = make_radio()
+    sent = max(frames // 10, 1)
+    start = perf_counter()
+    for frame_counter in range(sent):
+        lora.send_data(data=data, data_length=len(data), frame_counter=frame_counter)
+    uplinks = sent / (perf_counter() - start)
+
+    print("backend:", "cryptography" if ucryptolib.Cipher is not None else "pure python AES")
+    print("frames built/s (encrypt + MIC, 10 B):   {:.0f}".format(built))
+    print("uplinks/s through emulated SX127x:      {:.0f}".format(uplinks))
+    print("SPI transactions per uplink:            {:.0f}".format(emulator.spi_transactions / sent))
+
+
+def run_main(frames=3):
+    """ Executes main.py unchanged until frames uplinks were sent.
+    """
+    machine.reset_wiring()
+    emulator = SX127xEmulator(PINS, max_frames=frames)
+    source = open(NODE_DIR + "/main.py").read()
+    try:
+        exec(compile(source, "main.py", "exec"), {"__name__": "__main__"})
+    except StopEmulation:
+        pass
+    for frame in emulator.frames:
+        print("uplink {:.1f} MHz SF{} {} B toa={} ms".format(
+            frame["frequency"] / 1e6, frame["sf"], len(frame["payload"]), frame["toa_us"] // 1000))
+    return emulator
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "vectors"
+    if command == "bench":
+        run_bench(int(sys.argv[2]) if len(sys.argv) > 2 else 2000)
+    elif command == "main":
+        run_main(int(sys.argv[2]) if len(sys.argv) > 2 else 3)
+    else:
+        sys.exit(0 if run_vectors() else 1)
@@ -0,0 +1,348 @@
+"""
+`sx127x_emu.py`
+======================================================
+Register level SX1276/77/78/79 LoRa modem emulator for the host shims.
+Decodes the SPI protocol (address byte, bit 7 = write, burst access with
+auto increment, FIFO through RegFifoAddrPtr), runs TX and single /
+continuous RX on the utime virtual clock with real time-on-air, drives
+DIO0 from RegDioMapping1 and records every transmitted frame.
+Downlinks are injected with inject_downlink() relative to TX_DONE.
+"""
+import machine
+import utime
+
+# registers
+REG_FIFO = 0x00
+REG_OP_MODE = 0x01
+REG_FRF_MSB = 0x06
+REG_FRF_MID = 0x07
+REG_FRF_LSB = 0x08
+REG_PA_CONFIG = 0x09
+REG_FIFO_ADDR_PTR = 0x0D
+REG_FIFO_TX_BASE_ADDR = 0x0E
+REG_FIFO_RX_BASE_ADDR = 0x0F
+REG_FIFO_RX_CURRENT_ADDR = 0x10
+REG_IRQ_FLAGS_MASK = 0x11
+REG_IRQ_FLAGS = 0x12
+REG_RX_NB_BYTES = 0x13
+REG_PKT_SNR_VALUE = 0x19
+REG_PKT_RSSI_VALUE = 0x1A
+REG_MODEM_CONFIG_1 = 0x1D
+REG_MODEM_CONFIG_2 = 0x1E
+REG_SYMB_TIMEOUT_LSB = 0x1F
+REG_PREAMBLE_MSB = 0x20
+REG_PREAMBLE_LSB = 0x21
+REG_PAYLOAD_LENGTH = 0x22
+REG_MODEM_CONFIG_3 = 0x26
+REG_INVERTIQ = 0x33
+REG_DIO_MAPPING_1 = 0x40
+REG_VERSION = 0x42
+
+# modes
+MODE_LONG_RANGE_MODE = 0x80
+MODE_SLEEP = 0x00
+MODE_STDBY = 0x01
+MODE_TX = 0x03
+MODE_RX_CONTINUOUS = 0x05
+MODE_RX_SINGLE = 0x06
+
+# IRQ flags
+IRQ_RX_TIME_OUT = 0x80
+IRQ_RX_DONE = 0x40
+IRQ_PAYLOAD_CRC_ERROR = 0x20
+IRQ_VALID_HEADER = 0x10
+IRQ_TX_DONE = 0x08
+IRQ_CAD_DONE = 0x04
+
+# DIO0 source for RegDioMapping1 bits 7-6
+DIO0_MAPPING = (IRQ_RX_DONE, IRQ_TX_DONE, IRQ_CAD_DONE, 0)
+
+# RegModemConfig1 bandwidth field, in Hz
+BANDWIDTHS = (7800, 10400, 15600, 20800, 31250, 41700, 62500, 125000, 250000, 500000)
+
+# cost of one SPI transaction (CS low to CS high) on the MCU, in us
+SPI_TRANSACTION_US = 25
+
+# power-on register values that matter for the driver
+_RESET_VALUES = {
+    REG_OP_MODE: 0x09,
+    REG_FRF_MSB: 0x6C, REG_FRF_MID: 0x80, REG_FRF_LSB: 0x00,
+    REG_PA_CONFIG: 0x4F,
+    0x0C: 0x20,
+    REG_FIFO_TX_BASE_ADDR: 0x80,
+    REG_MODEM_CONFIG_1: 0x72,
+    REG_MODEM_CONFIG_2: 0x70,
+    REG_SYMB_TIMEOUT_LSB: 0x64,
+    REG_PREAMBLE_LSB: 0x08,
+    REG_PAYLOAD_LENGTH: 0x01,
+    0x23: 0xFF,
+    0x31: 0xC3,
+    REG_INVERTIQ: 0x27,
+    0x37: 0x0A,
+    0x39: 0x12,
+    0x3B: 0x1D,
+    REG_VERSION: 0x12,
+}
+
+
+class StopEmulation(Exception):
+    """ Raised from the SPI bus once max_frames frames were transmitted.
+    """
+
+
+def time_on_air_us(length, sf, bw, cr=1, preamble=8, crc=True,
+                   implicit_header=False, low_data_rate=None):
+    """ LoRa time-on-air (Semtech AN1200.13), in microseconds.
+    :param int cr: coding rate field, 1 (4/5) to 4 (4/8).
+    """
+    symbol_us = (1 << sf) * 1000000 // bw
+    if low_data_rate is None:
+        low_data_rate = symbol_us > 16000
+    de = 1 if low_data_rate else 0
+    ih = 1 if implicit_header else 0
+    num = 8 * length - 4 * sf + 28 + (16 if crc else 0) - 20 * ih
+    den = 4 * (sf - 2 * de)
+    payload_symbols = 8 + max(-(-num // den) * (cr + 4), 0)
+    # preamble is (n + 4.25) symbols
+    return (preamble * 4 + 17) * symbol_us // 4 + payload_symbols * symbol_us
+
+
+class SX127xEmulator:
+    """ Emulated SX127x wired to the machine shim.
+    :param dict pins: device_config of the end node (ss, dio_0, reset).
+    :param int max_frames: raise StopEmulation after this many uplinks.
+    """
+
+    def __init__(self, pins, max_frames=None, transaction_us=SPI_TRANSACTION_US):
+        self.max_frames = max_frames
+        self.transaction_us = transaction_us
+        self.frames = []
+        self.received = []
+        self.spi_transactions = 0
+        self._downlinks = []
+        self._tx_done_us = None
+        self._reset_chip()
+
+        machine.attach_spi(pins.get("spi_unit", 0), self)
+        machine.attach_pin(pins["ss"], self._on_chip_select)
+        if "reset" in pins:
+            machine.attach_pin(pins["reset"], self._on_reset)
+        self._dio0 = machine.Pin(pins["dio_0"]) if "dio_0" in pins else None
+
+    # --- chip state ---
+
+    def _reset_chip(self):
+        self.registers = bytearray(128)
+        for address, value in _RESET_VALUES.items():
+            self.registers[address] = value
+        self.fifo = bytearray(256)
+        self._selected = False
+        self._address = None
+        self._write = False
+        self._event = None
+        self._rx_packet = None
+
+    def _on_reset(self, value):
+        if not value:
+            self._reset_chip()
+
+    @property
+    def mode(self):
+        return self.registers[REG_OP_MODE] & 0x07
+
+    @property
+    def frequency(self):
+        r = self.registers
+        frf = (r[REG_FRF_MSB] << 16) | (r[REG_FRF_MID] << 8) | r[REG_FRF_LSB]
+        return frf * 32000000 // (1 << 19)
+
+    def modem(self):
+        """ Current modulation parameters decoded from the registers.
+        """
+        r = self.registers
+        sf = r[REG_MODEM_CONFIG_2] >> 4
+        return {
+            "frequency": self.frequency,
+            "sf": sf,
+            "bw": BANDWIDTHS[min(r[REG_MODEM_CONFIG_1] >> 4, len(BANDWIDTHS) - 1)],
+            "cr": (r[REG_MODEM_CONFIG_1] >> 1) & 0x07,
+            "implicit_header": bool(r[REG_MODEM_CONFIG_1] & 0x01),
+            "crc": bool(r[REG_MODEM_CONFIG_2] & 0x04),
+            "low_data_rate": bool(r[REG_MODEM_CONFIG_3] & 0x08),
+            "preamble": (r[REG_PREAMBLE_MSB] << 8) | r[REG_PREAMBLE_LSB],
+            "symbol_timeout": ((r[REG_MODEM_CONFIG_2] & 0x03) << 8) | r[REG_SYMB_TIMEOUT_LSB],
+            "invert_iq_rx": bool(r[REG_INVERTIQ] & 0x40),
+            "invert_iq_tx": not (r[REG_INVERTIQ] & 0x01),
+            "sync_word": r[0x39],
+        }
+
+    # --- SPI ---
+
+    def _on_chip_select(self, value):
+        if value:
+            self._selected = False
+            return
+        self._selected = True
+        self._address = None
+        self.spi_transactions += 1
+        utime.advance(self.transaction_us)
+        self._update()
+
+    def spi_transfer(self, data):
+        if not self._selected:
+            return bytes(len(data))
+        out = bytearray(len(data))
+        for i, byte in enumerate(data):
+            if self._address is None:
+                self._write = bool(byte & 0x80)
+                self._address = byte & 0x7F
+                continue
+            if self._write:
+                self._write_register(self._address, byte)
+            else:
+                out[i] = self._read_register(self._address)
+            # burst access, the FIFO keeps its address
+            if self._address != REG_FIFO:
+                self._address = (self._address + 1) & 0x7F
+        return bytes(out)
+
+    def _read_register(self, address):
+        r = self.registers
+        if address == REG_FIFO:
+            value = self.fifo[r[REG_FIFO_ADDR_PTR]]
+            r[REG_FIFO_ADDR_PTR] = (r[REG_FIFO_ADDR_PTR] + 1) & 0xFF
+            return value
+        return r[address]
+
+    def _write_register(self, address, value):
+        r = self.registers
+        if address == REG_FIFO:
+            self.fifo[r[REG_FIFO_ADDR_PTR]] = value
+            r[REG_FIFO_ADDR_PTR] = (r[REG_FIFO_ADDR_PTR] + 1) & 0xFF
+        elif address == REG_IRQ_FLAGS:
+            # write 1 to clear
+            r[REG_IRQ_FLAGS] &= ~value & 0xFF
+            self._update_dio0()
+        elif address == REG_OP_MODE:
+            r[REG_OP_MODE] = value
+            self._set_mode(value & 0x07)
+        elif address != REG_VERSION:
+            r[address] = value
+
+    # --- modem ---
+
+    def _set_mode(self, mode):
+        now = utime.now_us()
+        self._event = None
+        if mode == MODE_TX:
+            modem = self.modem()
+            length = self.registers[REG_PAYLOAD_LENGTH]
+            base = self.registers[REG_FIFO_TX_BASE_ADDR]
+            payload = bytes(self.fifo[(base + i) & 0xFF] for i in range(length))
+            toa = time_on_air_us(length, modem["sf"], modem["bw"], modem["cr"],
+                                 modem["preamble"], modem["crc"],
+                                 modem["implicit_header"], modem["low_data_rate"])
+            modem["payload"] = payload
+            modem["time_us"] = now
+            modem["toa_us"] = toa
+            modem["power"] = self.registers[REG_PA_CONFIG]
+            self.frames.append(modem)
+            self._event = (now + toa, IRQ_TX_DONE)
+            if self.max_frames is not None and len(self.frames) >= self.max_frames:
+                raise StopEmulation(len(self.frames))
+        elif mode == MODE_RX_SINGLE:
+            modem = self.modem()
+            symbol_us = (1 << modem["sf"]) * 1000000 // modem["bw"]
+            packet = self._find_downlink(modem, now, modem["symbol_timeout"] * symbol_us)
+            if packet is None:
+                self._event = (now + modem["symbol_timeout"] * symbol_us, IRQ_RX_TIME_OUT)
+            else:
+                self._schedule_rx(packet, modem)
+        elif mode == MODE_RX_CONTINUOUS:
+            packet = self._find_downlink(self.modem(), now, None)
+            if packet is not None:
+                self._schedule_rx(packet, self.modem())
+
+    def _update(self):
+        event = self._event
+        if event is None or utime.now_us() < event[0]:
+            return
+        self._event = None
+        flags = event[1]
+        r = self.registers
+        if flags == IRQ_TX_DONE:
+            self._tx_done_us = event[0]
+        elif flags & IRQ_RX_DONE:
+            packet = self._rx_packet
+            payload = packet["payload"]
+            base = r[REG_FIFO_RX_BASE_ADDR]
+            for i, byte in enumerate(payload):
+                self.fifo[(base + i) & 0xFF] = byte
+            r[REG_FIFO_RX_CURRENT_ADDR] = base
+            r[REG_RX_NB_BYTES] = len(payload)
+            r[REG_PKT_SNR_VALUE] = int(packet["snr"] * 4) & 0xFF
+            r[REG_PKT_RSSI_VALUE] = min(max(packet["rssi"] + 157, 0), 255)
+            self.received.append(packet)
+        r[REG_IRQ_FLAGS] |= flags
+        # TX and single RX fall back to standby when done
+        if self.mode != MODE_RX_CONTINUOUS:
+            r[REG_OP_MODE] = (r[REG_OP_MODE] & 0xF8) | MODE_STDBY
+        else:
+            packet = self._find_downlink(self.modem(), utime.now_us(), None)
+            if packet is not None:
+                self._schedule_rx(packet, self.modem())
+        self._update_dio0()
+
+    def _update_dio0(self):
+        if self._dio0 is None:
+            return
+        source = DIO0_MAPPING[self.registers[REG_DIO_MAPPING_1] >> 6]
+        self._dio0.drive(self.registers[REG_IRQ_FLAGS] & source)
+
+    # --- downlinks ---
+
+    def inject_downlink(self, payload, delay_ms=1000, frequency=None, sf=None,
+                        bw=None, invert_iq=True, snr=7.5, rssi=-60, crc_error=False):
+        """ Queues a downlink starting delay_ms after the last TX_DONE.
+        frequency (Hz), sf and bw left to None match any radio setting.
+        """
+        if self._tx_done_us is None:
+            raise RuntimeError("no uplink to answer")
+        self._downlinks.append({
+            "payload": bytes(payload),
+            "start_us": self._tx_done_us + delay_ms * 1000,
+            "frequency": frequency, "sf": sf, "bw": bw,
+            "invert_iq": invert_iq, "snr": snr, "rssi": rssi,
+            "crc_error": crc_error,
+        })
+
+    def _find_downlink(self, modem, now, timeout_us):
+        for packet in self._downlinks:
+            # LoRa demodulates with up to BW / 4 of carrier offset
+            if packet["frequency"] is not None and \
+               abs(packet["frequency"] - modem["frequency"]) > modem["bw"] // 4:
+                continue
+            if packet["sf"] is not None and packet["sf"] != modem["sf"]:
+                continue
+            if packet["bw"] is not None and packet["bw"] != modem["bw"]:
+                continue
+            if packet["invert_iq"] != modem["invert_iq_rx"]:
+                continue
+            symbol_us = (1 << modem["sf"]) * 1000000 // modem["bw"]
+            # the receiver needs a few preamble symbols to lock
+            if now > packet["start_us"] + 4 * symbol_us:
+                continue
+            if timeout_us is not None and packet["start_us"] > now + timeout_us:
+                continue
+            self._downlinks.remove(packet)
+            return packet
+        return None
+
+    def _schedule_rx(self, packet, modem):
+        toa = time_on_air_us(len(packet["payload"]), modem["sf"], modem["bw"],
+                             modem["cr"], 8, False, False, modem["low_data_rate"])
+        flags = IRQ_RX_DONE | IRQ_VALID_HEADER
+        if packet["crc_error"]:
+            flags |= IRQ_PAYLOAD_CRC_ERROR
+        self._rx_packet = packet
+        self._event = (max(packet["start_us"], utime.now_us()) + toa, flags)
@@ -0,0 +1,6 @@
+"""
+`ubinascii.py`
+======================================================
+Host shim of the MicroPython ubinascii module.
+"""
+from binascii import hexlify, unhexlify, a2b_base64, b2a_base64, crc32
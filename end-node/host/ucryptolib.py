@@ -0,0 +1,223 @@
+"""
+`ucryptolib.py`
+======================================================
+Host shim of the MicroPython ucryptolib module, only the aes class.
+Uses the `cryptography` package when it is installed and falls back to
+a table based pure Python AES otherwise (ECB and CBC modes).
+"""
+try:
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except ImportError:
+    Cipher = None
+
+MODE_ECB = 1
+MODE_CBC = 2
+
+
+def _xtime(a):
+    a <<= 1
+    return a ^ 0x11B if a & 0x100 else a
+
+
+def _mul(a, b):
+    r = 0
+    while b:
+        if b & 1:
+            r ^= a
+        a = _xtime(a)
+        b >>= 1
+    return r
+
+
+def _tables():
+    # S-box from the multiplicative inverse in GF(2^8) and the affine map
+    sbox = bytearray(256)
+    inv = [0] * 256
+    for a in range(1, 256):
+        for b in range(1, 256):
+            if _mul(a, b) == 1:
+                inv[a] = b
+                break
+    for a in range(256):
+        x = inv[a]
+        s = x
+        for _ in range(4):
+            x = ((x << 1) | (x >> 7)) & 0xFF
+            s ^= x
+        sbox[a] = s ^ 0x63
+    inv_sbox = bytearray(256)
+    for a in range(256):
+        inv_sbox[sbox[a]] = a
+
+    te = [[0] * 256 for _ in range(4)]
+    td = [[0] * 256 for _ in range(4)]
+    for a in range(256):
+        s = sbox[a]
+        w = (_mul(s, 2) << 24) | (s << 16) | (s << 8) | _mul(s, 3)
+        i = inv_sbox[a]
+        v = (_mul(i, 14) << 24) | (_mul(i, 9) << 16) | (_mul(i, 13) << 8) | _mul(i, 11)
+        for r in range(4):
+            te[r][a] = ((w >> (8 * r)) | (w << (32 - 8 * r))) & 0xFFFFFFFF
+            td[r][a] = ((v >> (8 * r)) | (v << (32 - 8 * r))) & 0xFFFFFFFF
+    return bytes(sbox), bytes(inv_sbox), te, td
+
+
+SBOX, INV_SBOX, _TE, _TD = _tables()
+
+
+class _PureAES:
+    """ AES block cipher on 16 byte blocks, encryption and decryption.
+    """
+
+    def __init__(self, key):
+        if len(key) not in (16, 24, 32):
+            raise ValueError("key")
+        nk = len(key) // 4
+        self._rounds = nk + 6
+        w = [int.from_bytes(key[4 * i:4 * i + 4], "big") for i in range(nk)]
+        rcon = 1
+        for i in range(nk, 4 * (self._rounds + 1)):
+            t = w[i - 1]
+            if i % nk == 0:
+                t = ((t << 8) | (t >> 24)) & 0xFFFFFFFF
+                t = self._sub_word(t) ^ (rcon << 24)
+                rcon = _xtime(rcon)
+            elif nk > 6 and i % nk == 4:
+                t = self._sub_word(t)
+            w.append(w[i - nk] ^ t)
+        self._ek = w
+        # equivalent inverse cipher keys
+        dk = []
+        for r in range(self._rounds, -1, -1):
+            for c in range(4):
+                k = w[4 * r + c]
+                if 0 < r < self._rounds:
+                    k = (_TD[0][SBOX[k >> 24]] ^ _TD[1][SBOX[(k >> 16) & 0xFF]] ^
+                         _TD[2][SBOX[(k >> 8) & 0xFF]] ^ _TD[3][SBOX[k & 0xFF]])
+                dk.append(k)
+        self._dk = dk
+
+    @staticmethod
+    def _sub_word(t):
+        return ((SBOX[t >> 24] << 24) | (SBOX[(t >> 16) & 0xFF] << 16) |
+                (SBOX[(t >> 8) & 0xFF] << 8) | SBOX[t & 0xFF])
+
+    def encrypt_block(self, block):
+        k = self._ek
+        t0, t1, t2, t3 = _TE
+        s0 = int.from_bytes(block[0:4], "big") ^ k[0]
+        s1 = int.from_bytes(block[4:8], "big") ^ k[1]
+        s2 = int.from_bytes(block[8:12], "big") ^ k[2]
+        s3 = int.from_bytes(block[12:16], "big") ^ k[3]
+        i = 4
+        for _ in range(self._rounds - 1):
+            s0, s1, s2, s3 = (
+                t0[s0 >> 24] ^ t1[(s1 >> 16) & 0xFF] ^ t2[(s2 >> 8) & 0xFF] ^ t3[s3 & 0xFF] ^ k[i],
+                t0[s1 >> 24] ^ t1[(s2 >> 16) & 0xFF] ^ t2[(s3 >> 8) & 0xFF] ^ t3[s0 & 0xFF] ^ k[i + 1],
+                t0[s2 >> 24] ^ t1[(s3 >> 16) & 0xFF] ^ t2[(s0 >> 8) & 0xFF] ^ t3[s1 & 0xFF] ^ k[i + 2],
+                t0[s3 >> 24] ^ t1[(s0 >> 16) & 0xFF] ^ t2[(s1 >> 8) & 0xFF] ^ t3[s2 & 0xFF] ^ k[i + 3],
+            )
+            i += 4
+        s = SBOX
+        out = bytearray(16)
+        for c, (a, b, d, e) in enumerate(((s0, s1, s2, s3), (s1, s2, s3, s0),
+                                          (s2, s3, s0, s1), (s3, s0, s1, s2))):
+            w = ((s[a >> 24] << 24) | (s[(b >> 16) & 0xFF] << 16) |
+                 (s[(d >> 8) & 0xFF] << 8) | s[e & 0xFF]) ^ k[i + c]
+            out[4 * c:4 * c + 4] = w.to_bytes(4, "big")
+        return out
+
+    def decrypt_block(self, block):
+        k = self._dk
+        t0, t1, t2, t3 = _TD
+        s0 = int.from_bytes(block[0:4], "big") ^ k[0]
+        s1 = int.from_bytes(block[4:8], "big") ^ k[1]
+        s2 = int.from_bytes(block[8:12], "big") ^ k[2]
+        s3 = int.from_bytes(block[12:16], "big") ^ k[3]
+        i = 4
+        for _ in range(self._rounds - 1):
+            s0, s1, s2, s3 = (
+                t0[s0 >> 24] ^ t1[(s3 >> 16) & 0xFF] ^ t2[(s2 >> 8) & 0xFF] ^ t3[s1 & 0xFF] ^ k[i],
+                t0[s1 >> 24] ^ t1[(s0 >> 16) & 0xFF] ^ t2[(s3 >> 8) & 0xFF] ^ t3[s2 & 0xFF] ^ k[i + 1],
+                t0[s2 >> 24] ^ t1[(s1 >> 16) & 0xFF] ^ t2[(s0 >> 8) & 0xFF] ^ t3[s3 & 0xFF] ^ k[i + 2],
+                t0[s3 >> 24] ^ t1[(s2 >> 16) & 0xFF] ^ t2[(s1 >> 8) & 0xFF] ^ t3[s0 & 0xFF] ^ k[i + 3],
+            )
+            i += 4
+        s = INV_SBOX
+        out = bytearray(16)
+        for c, (a, b, d, e) in enumerate(((s0, s3, s2, s1), (s1, s0, s3, s2),
+                                          (s2, s1, s0, s3), (s3, s2, s1, s0))):
+            w = ((s[a >> 24] << 24) | (s[(b >> 16) & 0xFF] << 16) |
+                 (s[(d >> 8) & 0xFF] << 8) | s[e & 0xFF]) ^ k[i + c]
+            out[4 * c:4 * c + 4] = w.to_bytes(4, "big")
+        return out
+
+
+class aes:
+    """ ucryptolib.aes(key, mode, [IV]), one object per direction.
+    """
+
+    def __init__(self, key, mode, IV=None):
+        if mode not in (MODE_ECB, MODE_CBC):
+            raise ValueError("mode")
+        key = bytes(key)
+        self._mode = mode
+        self._iv = bytearray(IV if IV is not None else bytes(16))
+        self._direction = None
+        if Cipher is not None:
+            self._cipher = Cipher(
+                algorithms.AES(key),
+                modes.ECB() if mode == MODE_ECB else modes.CBC(bytes(self._iv))
+            )
+            self._context = None
+        else:
+            self._cipher = _PureAES(key)
+
+    def _start(self, direction):
+        # like ucryptolib, an object either encrypts or decrypts
+        if self._direction is None:
+            self._direction = direction
+            if Cipher is not None:
+                self._context = (self._cipher.encryptor() if direction
+                                 else self._cipher.decryptor())
+        elif self._direction != direction:
+            raise OSError("can't encrypt & decrypt")
+
+    def _process(self, in_buf, out_buf, direction):
+        if len(in_buf) % 16:
+            raise ValueError("blksize % 16")
+        self._start(direction)
+        if Cipher is not None:
+            data = self._context.update(bytes(in_buf))
+        else:
+            data = self._process_pure(bytes(in_buf), direction)
+        if out_buf is None:
+            return data
+        out_buf[0:len(data)] = data
+        return None
+
+    def _process_pure(self, data, direction):
+        out = bytearray(len(data))
+        iv = self._iv
+        for i in range(0, len(data), 16):
+            block = data[i:i + 16]
+            if direction:
+                if self._mode == MODE_CBC:
+                    block = bytes(a ^ b for a, b in zip(block, iv))
+                result = self._cipher.encrypt_block(block)
+                if self._mode == MODE_CBC:
+                    iv = result
+            else:
+                result = self._cipher.decrypt_block(block)
+                if self._mode == MODE_CBC:
+                    result = bytearray(a ^ b for a, b in zip(result, iv))
+                    iv = block
+            out[i:i + 16] = result
+        self._iv = bytearray(iv)
+        return bytes(out)
+
+    def encrypt(self, in_buf, out_buf=None):
+        return self._process(in_buf, out_buf, True)
+
+    def decrypt(self, in_buf, out_buf=None):
+        return self._process(in_buf, out_buf, False)
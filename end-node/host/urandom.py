@@ -0,0 +1,6 @@
+"""
+`urandom.py`
+======================================================
+Host shim of the MicroPython urandom module.
+"""
+from random import getrandbits, randint, randrange, choice, random, uniform, seed
@@ -0,0 +1,68 @@
+"""
+`utime.py`
+======================================================
+Host shim of the MicroPython utime module.
+Runs on a virtual clock: sleeps advance the clock instead of blocking, so
+the end node loop runs as fast as the host allows. The SX127x emulator
+also advances it for every SPI transaction.
+"""
+_TICKS_PERIOD = 1 << 30
+_TICKS_MAX = _TICKS_PERIOD - 1
+_TICKS_HALFPERIOD = _TICKS_PERIOD // 2
+
+# virtual time in microseconds, starts at the 2021-01-01 epoch
+_epoch_us = 1609459200 * 1000000
+_clock_us = 0
+
+
+def advance(us):
+    """ Moves the virtual clock forward by us microseconds.
+    """
+    global _clock_us
+    if us > 0:
+        _clock_us += int(us)
+
+
+def now_us():
+    return _clock_us
+
+
+def time():
+    return (_epoch_us + _clock_us) // 1000000
+
+
+def time_ns():
+    return (_epoch_us + _clock_us) * 1000
+
+
+def sleep(seconds):
+    advance(seconds * 1000000)
+
+
+def sleep_ms(ms):
+    advance(ms * 1000)
+
+
+def sleep_us(us):
+    advance(us)
+
+
+def ticks_ms():
+    return (_clock_us // 1000) & _TICKS_MAX
+
+
+def ticks_us():
+    return _clock_us & _TICKS_MAX
+
+
+def ticks_cpu():
+    return ticks_us()
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & _TICKS_MAX
+
+
+def ticks_diff(ticks1, ticks2):
+    diff = (ticks1 - ticks2) & _TICKS_MAX
+    return ((diff + _TICKS_HALFPERIOD) & _TICKS_MAX) - _TICKS_HALFPERIOD
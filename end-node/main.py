@@ -1,15 +1,18 @@
 import utime
-import struct
 import urandom
 from sx127x import TTN, SX127x
+from codec import DOWNLINK, TEMPERATURE, TEMPERATURE_BATCH, decode
 from machine import Pin, SPI
 from config import *
 
 __DEBUG__ = True
 
 downlink_temperature = None
+downlink_satisfaction = None
+downlink_overload = None
+downlink_period = None
 
-ttn_config = TTN(ttn_config['devaddr'], ttn_config['nwkey'], ttn_config['app'], country=ttn_config['country'])
+ttn_config = TTN(ttn_config['devaddr'], ttn_config['nwkey'], ttn_config['app'], country=ttn_config['country'], sub_band=ttn_config['sub_band'])
 
 device_spi = SPI(device_config['spi_unit'], baudrate = 10000000, 
         polarity = 0, phase = 0, bits = 8, firstbit = SPI.MSB,
@@ -20,16 +23,35 @@ device_spi = SPI(device_config['spi_unit'], baudrate = 10000000,
 lora = SX127x(device_spi, pins=device_config, lora_parameters=lora_parameters, ttn_config=ttn_config)
 frame_counter = 0
 
-def on_receive(lora, outgoing):
-    payload = lora.read_payload()
-    print("Downlink recebido!")
-    try:
-        print("Mensagem:", payload.decode())
-    except:
-        print("Bytes:", payload)
+def on_receive(lora, payload):
+    global downlink_satisfaction, downlink_overload, downlink_period
+    # payload is the decrypted FRMPayload, valid only inside this callback
+    print("Downlink recebido! FPort:", lora.downlink_port, "FCntDown:", lora.frame_counter_down)
+    codec, values = decode(DOWNLINK, lora.downlink_port, payload)
+    if codec is not None and codec.name == "satisfaction":
+        # v1 = Satisfação, v2 = Satisfação + Flag de Overload (send_downlink),
+        # v3 = + Período recomendado pelo controlador do servidor
+        downlink_satisfaction = values[0]
+        downlink_overload = codec.version > 1 and values[1] == 1
+        if codec.version > 2:
+            downlink_period = values[2]
+        print("Satisfação:", downlink_satisfaction, "Overload:", downlink_overload, "Período:", downlink_period)
+    else:
+        print("Bytes:", bytes(payload))
+
+# downlinks only arrive in the RX1 / RX2 windows after each uplink
+lora.on_receive(on_receive, irq=False)
 
-lora.on_receive(on_receive)
-lora.receive()
+# uplink buffer, packed in place every loop; in batch mode the readings
+# wait in a preallocated ring and go out together when it is full
+batch = app_config.get('batch', 1)
+if batch > 1:
+    readings = TEMPERATURE_BATCH.ring(batch)
+    payload = bytearray(TEMPERATURE_BATCH.max_length)
+    fport = TEMPERATURE_BATCH.fport
+else:
+    payload = bytearray(TEMPERATURE.size)
+    fport = TEMPERATURE.fport
 
 while True:
     epoch = utime.time()
@@ -40,17 +62,32 @@ while True:
     else:
         temperature = urandom.randint(20, 40)
 
-    payload = struct.pack('@Qh', int(epoch), int(temperature))
+    if batch > 1:
+        readings.add(int(epoch), int(temperature))
+        length = readings.encode_into(payload) if readings.count == batch else 0
+    else:
+        TEMPERATURE.encode_into(payload, 0, int(epoch), int(temperature))
+        length = len(payload)
 
     if __DEBUG__:
         print("%s: %s" % (epoch, temperature))
-        print(payload)
+        if length:
+            print(payload[:length])
 
-    lora.send_data(data=payload, data_length=len(payload), frame_counter=frame_counter)
-    
-    utime.sleep(2)
-    lora.receive()
-    
-    frame_counter += 1
+    if length:
+        lora.send_data(data=payload, data_length=length, frame_counter=frame_counter, fport=fport)
+        lora.receive_windows()
+        frame_counter += 1
 
-    utime.sleep_ms(app_config['sleep'] * app_config['loop'])
\ No newline at end of file
+    # next reading at the application period, but never before the duty
+    # cycle allows the uplink it completes; max_rate reads as often as the
+    # duty cycle allows. A period recommended by the server replaces the
+    # application period, spread over the readings of one uplink.
+    wait = 0
+    if batch == 1 or readings.count == batch - 1:
+        wait = lora.next_transmission_ms(len(payload))
+    if downlink_period:
+        wait = max(wait, downlink_period * 1000 // batch)
+    elif not app_config['max_rate']:
+        wait = max(wait, app_config['sleep'] * app_config['loop'])
+    utime.sleep_ms(wait)
\ No newline at end of file
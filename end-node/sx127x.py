@@ -4,6 +4,9 @@ from encryption_aes import AES
 import gc
 import urandom
 import ubinascii
+from ttn.regions import get_region
+from airtime import packet_time_on_air_us, parse_datarate
+from duty_cycle import DutyCycle
 
 PA_OUTPUT_RFO_PIN = 0
 PA_OUTPUT_PA_BOOST_PIN = 1
@@ -36,6 +39,7 @@ REG_FEI_LSB = 0x1E
 REG_MODEM_CONFIG = 0x26
 
 REG_PREAMBLE_DETECT = 0x1F
+REG_SYMB_TIMEOUT_LSB = 0x1F
 REG_PREAMBLE_MSB = 0x20
 REG_PREAMBLE_LSB = 0x21
 REG_PAYLOAD_LENGTH = 0x22
@@ -78,21 +82,50 @@ IRQ_PAYLOAD_CRC_ERROR_MASK = 0x20
 IRQ_RX_DONE_MASK = 0x40
 IRQ_RX_TIME_OUT_MASK = 0x80
 
+# RegModemConfig3
+MODEM_CONFIG3_AGC_AUTO = 0x04
+MODEM_CONFIG3_LOW_DATA_RATE = 0x08
+# RegModemConfig1 bandwidth field
+BANDWIDTH_CODES = {125000: 0x07, 250000: 0x08, 500000: 0x09}
+
 # Buffer size
 MAX_PKT_LENGTH = 255
+# MHDR + FHDR (no FOpts) + FPort + MIC
+FRAME_OVERHEAD = 13
+
+# Class A receive windows, in ms after TX_DONE
+RECEIVE_DELAY1 = 1000
+RECEIVE_DELAY2 = 2000
+# open the window this early to absorb timing jitter
+RX_WINDOW_MARGIN_MS = 20
+# symbols needed by the radio to lock onto a preamble
+RX_MIN_SYMBOLS = 6
+
+# MAC commands (LoRaWAN 1.0.x, 5), answers go in the FOpts of the next uplink
+MAX_FOPTS_LENGTH = 15
+LINK_ADR_REQ = 0x03
+LINK_ADR_ANS = 0x03
+LINK_ADR_REQ_LENGTH = 5
+# LinkADRAns status: power, data rate and channel mask ACK
+LINK_ADR_ACK = 0x07
+# DataRate / TXPower of a LinkADRReq that keep the current setting
+KEEP_CURRENT = 0x0F
+# upper bound for a single RX, in case no RX_DONE / RX_TIMEOUT ever shows up
+RX_WINDOW_GUARD_MS = 3000
 
 __DEBUG__ = True
 
 class TTN:
     """ TTN Class.
     """
-    def __init__(self, dev_address, net_key, app_key, country="EU"):
+    def __init__(self, dev_address, net_key, app_key, country="EU", sub_band=2):
         """ Interface for The Things Network.
         """
         self.dev_addr = dev_address
         self.net_key = net_key
         self.app_key = app_key
         self.region = country
+        self.sub_band = sub_band
 
     @property
     def device_address(self):
@@ -119,6 +152,26 @@ class TTN:
         return self.region
 
 
+def modem_config(datarate, coding_rate=5, enable_CRC=True, implicit_header=False):
+    """ RegModemConfig1, RegModemConfig2 and RegModemConfig3 of a data rate.
+    LowDataRateOptimize is set when the symbol time exceeds 16 ms (SF11 and
+    SF12 at 125 kHz), the AGC is always automatic.
+    :param str datarate: SX127x data rate name, e.g. SF7BW125.
+    :return: (bytes RegModemConfig1-2, int RegModemConfig3).
+    """
+    sf, bw = parse_datarate(datarate)
+    config1 = (BANDWIDTH_CODES[bw] << 4) | ((coding_rate - 4) << 1)
+    if implicit_header:
+        config1 |= 0x01
+    config2 = sf << 4
+    if enable_CRC:
+        config2 |= 0x04
+    config3 = MODEM_CONFIG3_AGC_AUTO
+    if (1 << sf) * 1000000 // bw > 16000:
+        config3 |= MODEM_CONFIG3_LOW_DATA_RATE
+    return bytes((config1, config2)), config3
+
+
 class SX127x:
 
     _default_parameters = {
@@ -137,7 +190,10 @@ class SX127x:
         "SF7BW125":(0x74, 0x72, 0x04), "SF7BW250":(0x74, 0x82, 0x04),
         "SF8BW125":(0x84, 0x72, 0x04), "SF9BW125":(0x94, 0x72, 0x04),
         "SF10BW125":(0xA4, 0x72, 0x04), "SF11BW125":(0xB4, 0x72, 0x0C),
-        "SF12BW125":(0xC4, 0x72, 0x0C)
+        "SF12BW125":(0xC4, 0x72, 0x0C), "SF7BW500":(0x74, 0x92, 0x04),
+        "SF8BW500":(0x84, 0x92, 0x04), "SF9BW500":(0x94, 0x92, 0x04),
+        "SF10BW500":(0xA4, 0x92, 0x04), "SF11BW500":(0xB4, 0x92, 0x04),
+        "SF12BW500":(0xC4, 0x92, 0x04)
     }
             
     def __init__(self,
@@ -152,6 +208,8 @@ class SX127x:
         self._pins = pins
         self._parameters = lora_parameters
         self._lock = False
+        self._on_receive = None
+        self._tx_done = utime.ticks_ms()
 
         # setting pins
         if "dio_0" in self._pins:
@@ -201,32 +259,53 @@ class SX127x:
         self._bw = None
         self._modemcfg = None
 
-        # ttn configuration
-        if "US" in ttn_config.country:
-            from ttn.ttn_usa import TTN_FREQS
-            self._frequencies = TTN_FREQS
-        elif ttn_config.country == "AS":
-            from ttn.ttn_as import TTN_FREQS
-            self._frequencies = TTN_FREQS
-        elif ttn_config.country == "AU":
-            from ttn.ttn_au import TTN_FREQS
-            self._frequencies = TTN_FREQS
-        elif ttn_config.country == "EU":
-            from ttn.ttn_eu import TTN_FREQS
-            self._frequencies = TTN_FREQS
-        else:
-            raise TypeError("Country Code Incorrect/Unsupported")
+        # ttn configuration, channels enabled by the TTN sub-band
+        self._region = get_region(ttn_config.country)
+        self._channel_mask = self._region.sub_band_mask(ttn_config.sub_band)
+        self._enabled_channels = self._region.channels(
+            self._channel_mask, self._parameters["signal_bandwidth"]
+        )
+        self._hop_order = bytearray(len(self._enabled_channels))
+        self._hop_index = len(self._hop_order)
+        # airtime budget per regulatory sub-band
+        self.duty_cycle = DutyCycle(self._region.bands)
+        self._enabled_bands = self._bands_of(self._enabled_channels)
         # Give the uLoRa object ttn configuration
         self._ttn_config = ttn_config
+        # modem registers of every uplink data rate of the region, so a
+        # LinkADRReq switches data rate with two SPI writes
+        self._modem_configs = tuple(
+            modem_config(name, self._parameters['coding_rate'],
+                         self._parameters['enable_CRC'],
+                         self._parameters['implicit_header'])
+            if name in self._data_rates else None
+            for name in self._region.data_rates
+        )
+        self._data_rate = self._region.data_rate(self._parameters['signal_bandwidth'])
+        # configured power is the ceiling, LinkADRReq can only lower it
+        self._max_tx_power_level = self._parameters['tx_power_level']
+        # MAC command answers waiting for the next uplink
+        self._mac_answers = bytearray(MAX_FOPTS_LENGTH)
+        self._mac_answers_length = 0
+        # one AES session, keeps the cipher contexts and FCntDown
+        self._aes = AES(
+            self._ttn_config.device_address,
+            self._ttn_config.app_key,
+            self._ttn_config.network_key,
+            self.frame_counter
+        )
+        # downlinks are read into this buffer, no allocation per packet
+        self._rx_buffer = bytearray(MAX_PKT_LENGTH)
 
         # put in LoRa and sleep mode
         self.sleep()
 
-        # set channel number
+        # set channel number, an index into the enabled channels
         self._channel = channel
-        self._actual_channel = channel
-        if self._channel is not None: 
-            self.set_frequency(self._channel)
+        self._actual_channel = None
+        if self._channel is not None:
+            self._actual_channel = self._enabled_channels[self._channel]
+            self.set_frequency(self._actual_channel)
 
         # set data rate and bandwidth
         self.set_bandwidth(self._parameters["signal_bandwidth"])
@@ -244,17 +323,8 @@ class SX127x:
         #self.invert_IQ(self._parameters["invert_IQ"])
         self.set_preamble_length(self._parameters['preamble_length'])
         self.set_spreading_factor(self._parameters['spreading_factor'])
-        # set LowDataRateOptimize flag if symbol time > 16ms (default disable on reset)
-        # self.write_register(REG_MODEM_CONFIG, self.read_register(REG_MODEM_CONFIG) & 0xF7)  # default disable on reset
-        
-        #bw_parameter = self._parameters["signal_bandwidth"]
-        #sf_parameter = self._parameters["spreading_factor"]
-
-        #if 1000 / (bw_parameter / 2**sf_parameter) > 16:
-        #    self.write_register(
-        #        REG_MODEM_CONFIG, 
-        #        self.read_register(REG_MODEM_CONFIG) | 0x08
-        #    )
+        # modem registers again, with LowDataRateOptimize for SF11 / SF12
+        self.apply_data_rate(self._data_rate)
 
         # set base addresses
         self.write_register(REG_FIFO_TX_BASE_ADDR, FifoTxBaseAddr)
@@ -262,14 +332,14 @@ class SX127x:
 
         self.standby()
 
-    def begin_packet(self, implicit_header_mode = False):
+    def begin_packet(self, implicit_header_mode = False, time_on_air = 0):
         self.standby()
         self.implicit_header_mode(implicit_header_mode)
         #self.write_register(REG_DIO_MAPPING_1, 0x40)
         
         # Check for multi-channel configuration
         if self._channel is None:
-            self._actual_channel = urandom.getrandbits(3)
+            self._actual_channel = self.next_channel(time_on_air)
             self.set_frequency(self._actual_channel)
 
         # reset FIFO address and paload length
@@ -297,6 +367,9 @@ class SX127x:
         if timed_out:
             raise RuntimeError("Timeout during packet send")
 
+        # RX1 / RX2 are timed from here
+        self._tx_done = utime.ticks_ms()
+
         # clear IRQ's
         self.write_register(REG_IRQ_FLAGS, IRQ_TX_DONE_MASK)
 
@@ -314,7 +387,7 @@ class SX127x:
     def set_lock(self, lock = False):
         self._lock = lock
 
-    def send_data(self, data, data_length, frame_counter, timeout=5):
+    def send_data(self, data, data_length, frame_counter, timeout=5, fport=None):
         # Data packet
         enc_data = bytearray(data_length)
         lora_pkt = bytearray(64)
@@ -324,13 +397,9 @@ class SX127x:
 
         # Encrypt data (enc_data is overwritten in this function)
         self.frame_counter = frame_counter
-        aes = AES(
-            self._ttn_config.device_address,
-            self._ttn_config.app_key,
-            self._ttn_config.network_key,
-            self.frame_counter
-        )
-        
+        aes = self._aes
+        aes.frame_counter = self.frame_counter
+
         enc_data = aes.encrypt(enc_data)
         # Construct MAC Layer packet (PHYPayload)
         # MHDR (MAC Header) - 1 byte
@@ -341,15 +410,20 @@ class SX127x:
         lora_pkt[2] = self._ttn_config.device_address[2]
         lora_pkt[3] = self._ttn_config.device_address[1]
         lora_pkt[4] = self._ttn_config.device_address[0]
-        # FHDR (Frame Header): FCtrl (1 byte) - frame control
-        lora_pkt[5] = 0x00
+        # FHDR (Frame Header): FCtrl (1 byte) - frame control, FOptsLen in the low nibble
+        fopts_length = self._mac_answers_length
+        lora_pkt[5] = fopts_length
         # FHDR (Frame Header): FCnt (2 bytes) - frame counter
         lora_pkt[6] = self.frame_counter & 0x00FF
         lora_pkt[7] = (self.frame_counter >> 8) & 0x00FF
-        # FPort - port field
-        lora_pkt[8] = self._fport
+        # FHDR (Frame Header): FOpts - MAC command answers, sent once
+        for i in range(fopts_length):
+            lora_pkt[8 + i] = self._mac_answers[i]
+        self._mac_answers_length = 0
+        # FPort - port field, the one of the constructor unless given
+        lora_pkt[8 + fopts_length] = self._fport if fport is None else fport
         # Set length of LoRa packet
-        lora_pkt_len = 9
+        lora_pkt_len = 9 + fopts_length
 
         if __DEBUG__:
             print("PHYPayload", ubinascii.hexlify(lora_pkt))
@@ -378,16 +452,30 @@ class SX127x:
 
     def send_packet(self, lora_packet, packet_length, timeout):
         """ Sends a LoRa packet using the SX1276 module.
+        Blocks until the duty cycle of the chosen sub-band allows it.
         """
+        time_on_air = self.time_on_air(packet_length)
+        if self._region.max_dwell_ms and \
+           time_on_air > self._region.max_dwell_ms * 1000:
+            raise ValueError("Packet exceeds the regional dwell time")
+
         self.set_lock(True)  # wait until RX_Done, lock and begin writing.
 
-        self.begin_packet()
+        self.begin_packet(time_on_air = time_on_air)
+
+        band = self._region.channel_bands[self._actual_channel]
+        wait = self.duty_cycle.wait_ms(band, time_on_air)
+        if wait > 0:
+            if __DEBUG__:
+                print("Duty cycle: waiting {} ms".format(wait))
+            utime.sleep_ms(wait)
 
         # Fill the FIFO buffer with the LoRa payload
         self.write(lora_packet, packet_length)
         
         # Send the package
         self.end_packet(timeout)
+        self.duty_cycle.consume(band, time_on_air)
 
         self.set_lock(False) # unlock when done writing
 
@@ -445,10 +533,96 @@ class SX127x:
             level = min(max(level, 2), 17)
             self.write_register(REG_PA_CONFIG, PA_BOOST | (level - 2))
 
+    def time_on_air(self, packet_length):
+        """ Time-on-air of a PHYPayload of packet_length bytes, in us.
+        """
+        return packet_time_on_air_us(packet_length, self._parameters)
+
+    def next_transmission_ms(self, data_length):
+        """ ms until an uplink of data_length bytes is legal on some enabled sub-band.
+        """
+        time_on_air = self.time_on_air(data_length + FRAME_OVERHEAD)
+        if self._channel is not None:
+            return self.duty_cycle.wait_ms(
+                self._region.channel_bands[self._actual_channel], time_on_air
+            )
+        return self.duty_cycle.earliest(self._enabled_bands, time_on_air)[0]
+
+    def min_uplink_period_ms(self, data_length):
+        """ Shortest uplink period the duty cycle sustains for data_length bytes.
+        """
+        time_on_air = self.time_on_air(data_length + FRAME_OVERHEAD)
+        if self._channel is not None:
+            bands = (self._region.channel_bands[self._actual_channel],)
+        else:
+            bands = self._enabled_bands
+        return self.duty_cycle.min_interval_ms(bands, time_on_air)
+
+    def _bands_of(self, channels):
+        bands = []
+        for channel in channels:
+            band = self._region.channel_bands[channel]
+            if band not in bands:
+                bands.append(band)
+        return tuple(bands)
+
+    def next_channel(self, time_on_air = 0):
+        """ Pseudo-random hopping over the enabled channels.
+        Walks a shuffled permutation of the channels so every channel is
+        used once per round, reshuffled when a round is over. Channels whose
+        sub-band has no airtime left for time_on_air us are skipped.
+        """
+        count = len(self._hop_order)
+        channel = self._hop()
+        if time_on_air:
+            for _ in range(count - 1):
+                band = self._region.channel_bands[channel]
+                if self.duty_cycle.wait_ms(band, time_on_air) == 0:
+                    break
+                channel = self._hop()
+        return channel
+
+    def _hop(self):
+        order = self._hop_order
+        count = len(order)
+        if self._hop_index >= count:
+            last = order[count - 1] if self._actual_channel is not None else count
+            for i in range(count):
+                order[i] = i
+            # Fisher-Yates
+            for i in range(count - 1, 0, -1):
+                j = urandom.getrandbits(16) % (i + 1)
+                order[i], order[j] = order[j], order[i]
+            # never the same channel twice in a row across rounds
+            if count > 1 and order[0] == last:
+                order[0], order[count - 1] = order[count - 1], order[0]
+            self._hop_index = 0
+        channel = self._enabled_channels[order[self._hop_index]]
+        self._hop_index += 1
+        return channel
+
+    def set_channel_mask(self, mask):
+        """ Enables the channels of mask (bit n = channel n), for the current data rate.
+        """
+        channels = self._region.channels(mask, self._parameters["signal_bandwidth"])
+        if not channels:
+            raise ValueError("No channel enabled")
+        self._channel_mask = mask
+        self._enabled_channels = channels
+        self._hop_order = bytearray(len(channels))
+        self._hop_index = len(channels)
+        self._enabled_bands = self._bands_of(channels)
+        if self._channel is not None:
+            self._channel = min(self._channel, len(channels) - 1)
+            self._actual_channel = channels[self._channel]
+            self.set_frequency(self._actual_channel)
+
     def set_frequency(self, channel):
-        self.write_register(REG_FRF_MSB, self._frequencies[channel][0])
-        self.write_register(REG_FRF_MID, self._frequencies[channel][1])
-        self.write_register(REG_FRF_LSB, self._frequencies[channel][2])
+        self.write_frequency(self._region.frequencies[channel])
+
+    def write_frequency(self, frequency):
+        # RegFrfMsb, RegFrfMid and RegFrfLsb in one burst
+        self.write_registers(REG_FRF_MSB, frequency)
     
     def set_coding_rate(self, denominator):
         denominator = min(max(denominator, 5), 8)
@@ -477,6 +651,96 @@ class SX127x:
         except KeyError:
             raise KeyError("Invalid or Unsupported Datarate.")
 
+    def set_symbol_timeout(self, symbols):
+        symbols = min(max(symbols, 4), 0x3ff)
+        self.write_register(
+            REG_FEI_LSB,
+            (self.read_register(REG_FEI_LSB) & 0xfc) | (symbols >> 8)
+        )
+        self.write_register(REG_SYMB_TIMEOUT_LSB, symbols & 0xff)
+
+    def set_data_rate(self, datarate):
+        """ Restores the modem configuration for an uplink data rate.
+        """
+        self.apply_data_rate(self._region.data_rate(datarate))
+
+    def apply_data_rate(self, data_rate):
+        """ Uplink modem configuration for a data rate index of the region:
+        the precomputed RegModemConfig1-2 in one burst and RegModemConfig3.
+        """
+        config = self._modem_configs[data_rate]
+        self.write_registers(REG_FEI_MSB, config[0])
+        self.write_register(REG_MODEM_CONFIG, config[1])
+        if data_rate != self._data_rate:
+            name = self._region.data_rates[data_rate]
+            self._data_rate = data_rate
+            self._parameters['signal_bandwidth'] = name
+            self._parameters['spreading_factor'] = parse_datarate(name)[0]
+
+    @property
+    def data_rate(self):
+        """ Returns the data rate index of the uplinks.
+        """
+        return self._data_rate
+
+    def handle_mac_commands(self, commands, length):
+        """ Runs the MAC commands of a downlink (FOpts, or the FRMPayload
+        on FPort 0) and queues the answers for the next uplink. Only
+        LinkADRReq is understood; parsing stops at any other command, as
+        its length is unknown.
+        :param bytearray commands: MAC commands.
+        :param int length: bytes of commands to parse.
+        """
+        i = 0
+        while i + LINK_ADR_REQ_LENGTH <= length and commands[i] == LINK_ADR_REQ:
+            # a block of contiguous LinkADRReq is applied as a whole
+            end = i + LINK_ADR_REQ_LENGTH
+            while end + LINK_ADR_REQ_LENGTH <= length and commands[end] == LINK_ADR_REQ:
+                end += LINK_ADR_REQ_LENGTH
+            self._link_adr_req(commands, i, end)
+            i = end
+
+    def _link_adr_req(self, commands, start, end):
+        region = self._region
+        # every ChMask of the block in order, on a copy of the mask
+        mask = self._channel_mask
+        for i in range(start, end, LINK_ADR_REQ_LENGTH):
+            if mask is not None:
+                mask = region.apply_ch_mask(
+                    mask, (commands[i + 4] >> 4) & 0x07, commands[i + 2] | (commands[i + 3] << 8)
+                )
+        # DataRate, TXPower and NbTrans come from the last command
+        last = end - LINK_ADR_REQ_LENGTH
+        data_rate = commands[last + 1] >> 4
+        power = commands[last + 1] & 0x0F
+        if data_rate == KEEP_CURRENT:
+            data_rate = self._data_rate
+        status = 0
+        if mask is not None and region.channels(mask):
+            status |= 0x01
+        if data_rate < len(self._modem_configs) and self._modem_configs[data_rate] is not None and \
+           (mask is None or region.channels(mask, region.data_rates[data_rate])):
+            status |= 0x02
+        if power == KEEP_CURRENT or power <= region.max_tx_power:
+            status |= 0x04
+
+        # all or nothing; NbTrans is not used, every uplink is sent once
+        if status == LINK_ADR_ACK:
+            self.apply_data_rate(data_rate)
+            self.set_channel_mask(mask)
+            if power != KEEP_CURRENT:
+                self.set_tx_power(min(self._max_tx_power_level, region.max_eirp - 2 * power))
+        if __DEBUG__:
+            print("LinkADRReq DR{} TXPower {} status {:03b}".format(data_rate, power, status))
+
+        # one LinkADRAns per LinkADRReq of the block
+        for _ in range(start, end, LINK_ADR_REQ_LENGTH):
+            if self._mac_answers_length + 2 > MAX_FOPTS_LENGTH:
+                break
+            self._mac_answers[self._mac_answers_length] = LINK_ADR_ANS
+            self._mac_answers[self._mac_answers_length + 1] = status
+            self._mac_answers_length += 2
+
     def enable_CRC(self, enable_CRC = False):
         modem_config_2 = self.read_register(REG_FEI_LSB)
         config = modem_config_2 | 0x04 if enable_CRC else modem_config_2 & 0xfb
@@ -545,10 +809,98 @@ class SX127x:
             REG_OP_MODE, MODE_LONG_RANGE_MODE | MODE_RX_CONTINUOUS
         )
 
-    def on_receive(self, callback):
+    def receive_windows(self, rx1_delay = RECEIVE_DELAY1, rx2_delay = RECEIVE_DELAY2):
+        """ Opens the LoRaWAN Class A RX1 and RX2 windows after an uplink.
+        Both windows are timed from the TX_DONE timestamp and use single RX
+        mode, so the radio only listens for a few symbols and goes back to
+        sleep when no downlink preamble is detected.
+        :param int rx1_delay: RX1 delay after TX_DONE, in ms.
+        :param int rx2_delay: RX2 delay after TX_DONE, in ms.
+        """
+        datarate = self._parameters["signal_bandwidth"]
+
+        region = self._region
+
+        # RX1: downlink channel paired with the uplink channel
+        received = self._receive_window(
+            rx1_delay,
+            region.rx1_frequencies[self._actual_channel],
+            region.rx1_data_rate(datarate)
+        )
+        # RX2: fixed channel and data rate from the regional plan
+        if not received:
+            received = self._receive_window(
+                rx2_delay,
+                region.rx2_frequency,
+                region.data_rates[region.rx2_data_rate]
+            )
+
+        # back to uplink configuration, radio sleeps until the next uplink
+        self.invert_IQ(False)
+        self.apply_data_rate(self._data_rate)
+        if self._channel is not None:
+            self.set_frequency(self._actual_channel)
+        self.sleep()
+
+        return received
+
+    def _receive_window(self, delay, frequency, datarate):
+        # configure the radio before the window opens
+        self.standby()
+        self.write_frequency(frequency)
+        self.set_bandwidth(datarate)
+        self.implicit_header_mode(False)
+        self.invert_IQ(True)
+
+        sf = int(datarate[2:datarate.index("B")])
+        bw = int(datarate[datarate.index("W") + 1:])
+        symbol_us = (1 << sf) * 1000 // bw
+        self.set_symbol_timeout(
+            RX_MIN_SYMBOLS + (2000 * RX_WINDOW_MARGIN_MS) // symbol_us
+        )
+
+        self.write_register(REG_FIFO_ADDR_PTR, FifoRxBaseAddr)
+        self.write_register(REG_IRQ_FLAGS, 0xff)
+
+        wait = utime.ticks_diff(
+            utime.ticks_add(self._tx_done, delay - RX_WINDOW_MARGIN_MS),
+            utime.ticks_ms()
+        )
+        if wait > 0:
+            utime.sleep_ms(wait)
+
+        self.write_register(REG_OP_MODE, MODE_LONG_RANGE_MODE | MODE_RX_SINGLE)
+        start = utime.ticks_ms()
+
+        # wait for RX_DONE or RX_TIMEOUT, standby automatically on both
+        irq_flags = self.read_register(REG_IRQ_FLAGS)
+        while irq_flags & (IRQ_RX_DONE_MASK | IRQ_RX_TIME_OUT_MASK) == 0:
+            if utime.ticks_diff(utime.ticks_ms(), start) >= RX_WINDOW_GUARD_MS:
+                break
+            irq_flags = self.read_register(REG_IRQ_FLAGS)
+
+        # clear IRQ's
+        self.write_register(REG_IRQ_FLAGS, irq_flags)
+
+        if (irq_flags & IRQ_RX_DONE_MASK) == 0 or \
+           (irq_flags & IRQ_PAYLOAD_CRC_ERROR_MASK) != 0:
+            return False
+
+        self._dispatch_payload()
+        return True
+
+    def on_receive(self, callback, irq = True):
+        """ Registers the downlink callback.
+        :param callback: called as callback(lora, payload).
+        :param bool irq: attach it to DIO0 for continuous RX, use False when
+        downlinks are only expected in the receive_windows().
+        """
         self._on_receive = callback
 
-        if self._pin_rx_done:
+        if not irq:
+            if self._pin_rx_done:
+                self._pin_rx_done.irq(handler = None)
+        elif self._pin_rx_done:
             if callback:
                 print("callback attached")
                 self.write_register(REG_DIO_MAPPING_1, 0x00)
@@ -560,26 +912,43 @@ class SX127x:
 
 
     def handle_on_receive(self, event_source):
-        self.set_lock(True)              # lock until TX_Done
-
-        aes = AES(
-            self._ttn_config.device_address,
-            self._ttn_config.app_key,
-            self._ttn_config.network_key,
-            self.frame_counter
-        )
-
         # irqFlags = self.getIrqFlags() should be 0x50
         if (self.get_irq_flags() & IRQ_PAYLOAD_CRC_ERROR_MASK) == 0:
-            if self._on_receive:
-                payload = self.read_payload()
-                self.set_lock(False)     # unlock when done reading
-                data = aes.decrypt_payload(payload)
+            self._dispatch_payload()
+
+    def _dispatch_payload(self):
+        self.set_lock(True)              # lock until TX_Done
+
+        length = self.read_payload_into(self._rx_buffer)
+        self.set_lock(False)     # unlock when done reading
+        # None when DevAddr, FCntDown or MIC do not match
+        aes = self._aes
+        data = aes.decrypt_payload(self._rx_buffer, length)
+        if data is not None:
+            if aes.fopts_length:
+                self.handle_mac_commands(aes.fopts, aes.fopts_length)
+            if aes.fport == 0:
+                self.handle_mac_commands(data, len(data))
+            elif aes.fport is not None and self._on_receive:
                 self._on_receive(self, data)
+        elif __DEBUG__:
+            print("Downlink rejected")
 
         self.set_lock(False)             # unlock in any case.
         self.collect_garbage()
 
+    @property
+    def downlink_port(self):
+        """ Returns the FPort of the last accepted downlink.
+        """
+        return self._aes.fport
+
+    @property
+    def frame_counter_down(self):
+        """ Returns the FCntDown of the last accepted downlink.
+        """
+        return self._aes.frame_counter_down
+
     """
     def handle_on_receive(self, event_source):
         self.set_lock(True)              # lock until TX_Done
@@ -642,6 +1011,24 @@ class SX127x:
                 MODE_LONG_RANGE_MODE | MODE_RX_SINGLE
             )
 
+    def read_payload_into(self, buffer):
+        """ Reads the received packet into buffer, returns its length.
+        """
+        self.write_register(
+            REG_FIFO_ADDR_PTR,
+            self.read_register(REG_FIFO_RX_CURRENT_ADDR)
+        )
+
+        if self._implicit_header_mode:
+            packet_length = self.read_register(REG_PAYLOAD_LENGTH)
+        else:
+            packet_length = self.read_register(REG_RX_NB_BYTES)
+
+        for i in range(packet_length):
+            buffer[i] = self.read_register(REG_FIFO)
+
+        return packet_length
+
     def read_payload(self):
         # set FIFO address to current RX address
         # fifo_rx_current_addr = self.read_register(REG_FIFO_RX_CURRENT_ADDR)
@@ -671,6 +1058,14 @@ class SX127x:
     def write_register(self, address, value):
         self.transfer(address | 0x80, value)
 
+    def write_registers(self, address, values):
+        """ Burst write of consecutive registers, in one SPI transaction.
+        """
+        self._pin_ss.value(0)
+        self._spi.write(bytes([address | 0x80]))
+        self._spi.write(values)
+        self._pin_ss.value(1)
+
     def transfer(self, address, value = 0x00):
         response = bytearray(1)
 
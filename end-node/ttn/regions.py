@@ -0,0 +1,184 @@
+"""
+`regions.py`
+======================================================
+The Things Network frequency plans: EU868, US915, AU915 and AS923.
+Frequencies are declared in Hz and converted once, at import, into the
+SX127x RegFrf register triples; everything in a Region is a tuple or bytes
+so the tables are immutable and can be frozen into the firmware.
+"""
+
+# SX127x synthesizer step is 32 MHz / 2^19
+FXOSC = 32000000
+FRF_SHIFT = 19
+
+# ETSI EN 300 220 sub-bands: (from Hz, to Hz, duty cycle 1/n)
+EU868_BANDS = ((863000000, 865000000, 1000),
+               (865000000, 868000000, 100),
+               (868000000, 868600000, 100),
+               (868700000, 869200000, 1000),
+               (869400000, 869650000, 10),
+               (869700000, 870000000, 100))
+NO_DUTY_CYCLE = ((0, 1000000000, 1),)
+
+# data rate index -> SX127x data rate name, None for RFU
+EU868_DATA_RATES = ("SF12BW125", "SF11BW125", "SF10BW125", "SF9BW125",
+                    "SF8BW125", "SF7BW125", "SF7BW250")
+US915_DATA_RATES = ("SF10BW125", "SF9BW125", "SF8BW125", "SF7BW125",
+                    "SF8BW500", None, None, None,
+                    "SF12BW500", "SF11BW500", "SF10BW500", "SF9BW500",
+                    "SF8BW500", "SF7BW500")
+AU915_DATA_RATES = ("SF12BW125", "SF11BW125", "SF10BW125", "SF9BW125",
+                    "SF8BW125", "SF7BW125", "SF8BW500", None,
+                    "SF12BW500", "SF11BW500", "SF10BW500", "SF9BW500",
+                    "SF8BW500", "SF7BW500")
+AS923_DATA_RATES = EU868_DATA_RATES
+
+
+def frf(frequency):
+    """ RegFrfMsb, RegFrfMid, RegFrfLsb for a frequency in Hz.
+    """
+    value = ((frequency << FRF_SHIFT) + FXOSC // 2) // FXOSC
+    return bytes(((value >> 16) & 0xFF, (value >> 8) & 0xFF, value & 0xFF))
+
+
+class Region:
+    """ One regional channel plan.
+    :param tuple uplink: uplink channel frequencies in Hz, by channel number.
+    :param tuple rx1: RX1 frequency in Hz for each uplink channel.
+    :param tuple rx1_data_rates: RX1 data rate index for each uplink data rate.
+    :param int sub_band_size: 125 kHz channels per sub-band, 0 without sub-bands.
+    :param int max_dwell_ms: max time-on-air of one uplink, 0 for no limit.
+    :param int max_eirp: MaxEIRP in dBm, TXPower n of a LinkADRReq is MaxEIRP - 2n.
+    :param int max_tx_power: highest TXPower index defined for the region.
+    """
+
+    def __init__(self, name, uplink, rx1, data_rates, rx1_data_rates, rx2, rx2_data_rate,
+                 bands=NO_DUTY_CYCLE, sub_band_size=0, max_dwell_ms=0, max_eirp=16,
+                 max_tx_power=7):
+        self.name = name
+        self.uplink_hz = uplink
+        self.rx1_hz = rx1
+        self.rx2_hz = rx2
+        self.data_rates = data_rates
+        self.rx1_data_rates = rx1_data_rates
+        self.rx2_data_rate = rx2_data_rate
+        self.bands = bands
+        self.sub_band_size = sub_band_size
+        self.max_dwell_ms = max_dwell_ms
+        self.max_eirp = max_eirp
+        self.max_tx_power = max_tx_power
+
+        # register triples, computed once
+        self.frequencies = tuple(frf(f) for f in uplink)
+        self.rx1_frequencies = tuple(frf(f) for f in rx1)
+        self.rx2_frequency = frf(rx2)
+        # duty cycle sub-band of each uplink channel
+        self.channel_bands = tuple(self._band(f) for f in uplink)
+
+    def _band(self, frequency):
+        for i in range(len(self.bands)):
+            if self.bands[i][0] <= frequency < self.bands[i][1]:
+                return i
+        raise ValueError("Frequency outside the regional bands")
+
+    def data_rate(self, name):
+        """ Returns the data rate index of an SX127x data rate name.
+        """
+        return self.data_rates.index(name)
+
+    def rx1_data_rate(self, name):
+        return self.data_rates[self.rx1_data_rates[self.data_rate(name)]]
+
+    def sub_band_mask(self, sub_band):
+        """ Channel mask (int, bit n = channel n) of a 1-based sub-band.
+        """
+        if not self.sub_band_size:
+            return (1 << len(self.uplink_hz)) - 1
+        first = (sub_band - 1) * self.sub_band_size
+        mask = ((1 << self.sub_band_size) - 1) << first
+        # the 500 kHz channel of the sub-band
+        return mask | (1 << (64 + sub_band - 1))
+
+    def channels(self, mask, data_rate=None):
+        """ Channel numbers enabled in mask, optionally only the ones that
+        can carry data_rate (125 vs 500 kHz channels on US915/AU915).
+        """
+        wide = None
+        if data_rate is not None and self.sub_band_size:
+            wide = data_rate.endswith("BW500")
+        enabled = []
+        for channel in range(len(self.uplink_hz)):
+            if not (mask >> channel) & 1:
+                continue
+            if wide is not None and (channel >= 64) != wide:
+                continue
+            enabled.append(channel)
+        return tuple(enabled)
+
+    def apply_ch_mask(self, mask, control, ch_mask):
+        """ Channel mask after one ChMaskCntl / ChMask pair of a LinkADRReq,
+        None when ChMaskCntl is RFU in this region.
+        """
+        if not self.sub_band_size:
+            if control == 0:
+                return ch_mask & ((1 << len(self.uplink_hz)) - 1)
+            if control == 6:
+                return (1 << len(self.uplink_hz)) - 1
+            return None
+        if control < 4:
+            shift = 16 * control
+            return (mask & ~(0xFFFF << shift)) | (ch_mask << shift)
+        # 4: channels 64-71 only, 6 / 7: all 125 kHz channels on / off too
+        wide = (ch_mask & 0xFF) << 64
+        if control == 4:
+            return (mask & ((1 << 64) - 1)) | wide
+        if control == 6:
+            return ((1 << 64) - 1) | wide
+        if control == 7:
+            return wide
+        return None
+
+
+def _eu868():
+    uplink = (868100000, 868300000, 868500000, 867100000,
+              867300000, 867500000, 867700000, 867900000)
+    return Region("EU868", uplink, uplink, EU868_DATA_RATES, tuple(range(7)),
+                  869525000, 3, bands=EU868_BANDS)
+
+
+def _as923():
+    uplink = (923200000, 923400000, 922200000, 922400000,
+              922600000, 922800000, 923000000, 922000000)
+    return Region("AS923", uplink, uplink, AS923_DATA_RATES, tuple(range(7)),
+                  923200000, 2, max_dwell_ms=400)
+
+
+# TXPower 0-14 (30 dBm down to 2 dBm) in RP002 and LoRaWAN 1.0.2+; 1.0.1 stopped at 10
+def _us915_au915(name, first_hz, first_wide_hz, data_rates, rx1_data_rates, dwell):
+    uplink = tuple(first_hz + 200000 * n for n in range(64)) + \
+        tuple(first_wide_hz + 1600000 * n for n in range(8))
+    rx1 = tuple(923300000 + 600000 * (n % 8) for n in range(72))
+    return Region(name, uplink, rx1, data_rates, rx1_data_rates,
+                  923300000, 8, sub_band_size=8, max_dwell_ms=dwell, max_eirp=30,
+                  max_tx_power=14)
+
+
+# RX1 answers a 125 kHz uplink on 500 kHz with the same spreading factor
+REGIONS = {
+    "EU": _eu868(),
+    "AS": _as923(),
+    "US": _us915_au915("US915", 902300000, 903000000, US915_DATA_RATES,
+                       (10, 11, 12, 13, 13), 400),
+    "AU": _us915_au915("AU915", 915200000, 915900000, AU915_DATA_RATES,
+                       (8, 9, 10, 11, 12, 13, 13), 0),
+}
+
+
+def get_region(country):
+    """ Region of a TTN country code ("EU", "US", "AU" or "AS").
+    """
+    if country in REGIONS:
+        return REGIONS[country]
+    if "US" in country:
+        return REGIONS["US"]
+    raise TypeError("Country Code Incorrect/Unsupported")
@@ -1,35 +0,0 @@
-# The MIT License (MIT)
-#
-# Copyright (c) 2018 Brent Rubell for Adafruit
-#
-# Permission is hereby granted, free of charge, to any person obtaining a copy
-# of this software and associated documentation files (the "Software"), to deal
-# in the Software without restriction, including without limitation the rights
-# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
-# copies of the Software, and to permit persons to whom the Software is
-# furnished to do so, subject to the following conditions:
-#
-# The above copyright notice and this permission notice shall be included in
-# all copies or substantial portions of the Software.
-#
-# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
-# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
-# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
-# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
-# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
-# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
-# THE SOFTWARE.
-"""
-`ttn_au.py`
-======================================================
-The Things Network Frequency Plans - AU915
-* Author(s): Brent Rubell
-"""
-TTN_FREQS = {0: (0xe5, 0x33, 0x5a), # 916.8 MHz
-             1: (0xe5, 0x40, 0x26), # 917.0 MHz
-             2: (0xe5, 0x4c, 0xf3), # 917.2 MHz
-             3: (0xe5, 0x59, 0xC0), # 917.4 MHz
-             4: (0xe5, 0x66, 0x8D), # 917.6 MHz
-             5: (0xe5, 0x73, 0x5A), # 917.8 MHz
-             6: (0xe5, 0x80, 0x27), # 918.0 MHz
-             7: (0xe5, 0x8c, 0xf3)} # 918.2 MHz
@@ -0,0 +1,113 @@
+import math
+import threading
+from collections import OrderedDict
+from hashlib import blake2b
+
+# === CONFIGURAÇÕES ===
+WINDOW_SECONDS = 300
+# HLL: 2^PRECISION registradores por slot, erro padrão ~1.04/sqrt(2^PRECISION)
+# (p=12: 4 KB por slot, ~1.6%); a janela é coberta por slots de SLOT_SECONDS
+PRECISION = 12
+SLOT_SECONDS = 30
+# A estimativa junta os slots (máximo por registrador); refeita no máximo a cada MERGE_INTERVAL s
+MERGE_INTERVAL = 1.0
+
+
+class LastSeen:
+    """Contagem exata de dispositivos ativos: último uplink de cada um, em
+    ordem de visita. add() move o dispositivo para o fim; count() tira do
+    começo quem saiu da janela. O(1) amortizado, memória O(dispositivos)."""
+
+    def __init__(self, window=WINDOW_SECONDS):
+        self.window = window
+        self.last = OrderedDict()
+        self.lock = threading.Lock()
+
+    def add(self, t, dev):
+        with self.lock:
+            self.last[dev] = t
+            self.last.move_to_end(dev)
+
+    def count(self, now):
+        cutoff = now - self.window
+        with self.lock:
+            last = self.last
+            while last:
+                dev, t = next(iter(last.items()))
+                if t >= cutoff:
+                    break
+                del last[dev]
+            return len(last)
+
+
+def _hash64(dev):
+    return int.from_bytes(blake2b(dev.encode(), digest_size=8).digest(), "little")
+
+
+class SlidingHLL:
+    """Dispositivos ativos aproximados com HyperLogLog em slots de tempo.
+    Cada slot de SLOT_SECONDS tem seu sketch; a janela é a união (máximo
+    por registrador) dos slots que ela cobre. Memória fixa de
+    (window/slot + 1) * 2^precision bytes, qualquer que seja a frota;
+    add() é O(1) e a união é refeita no máximo a cada MERGE_INTERVAL."""
+
+    def __init__(self, window=WINDOW_SECONDS, slot=SLOT_SECONDS, precision=PRECISION):
+        if not 4 <= precision <= 16:
+            raise ValueError("Precisão do HLL fora de 4..16")
+        self.window = window
+        self.slot = slot
+        self.p = precision
+        self.m = 1 << precision
+        self.slots = int(math.ceil(window / slot)) + 1
+        self.registers = [bytearray(self.m) for _ in range(self.slots)]
+        self.ids = [None] * self.slots
+        self.alpha = 0.7213 / (1 + 1.079 / self.m)
+        self.lock = threading.Lock()
+        self._estimate = 0
+        self._merged_at = None
+
+    def _slot(self, t):
+        """Registradores do slot de t, zerados se o slot do anel era de outra volta."""
+        k = int(t // self.slot)
+        i = k % self.slots
+        if self.ids[i] != k:
+            self.registers[i] = bytearray(self.m)
+            self.ids[i] = k
+        return self.registers[i]
+
+    def add(self, t, dev):
+        x = _hash64(dev)
+        index = x & (self.m - 1)
+        w = x >> self.p
+        # posição do primeiro bit 1 nos 64 - p bits restantes
+        rank = (64 - self.p) - w.bit_length() + 1
+        with self.lock:
+            registers = self._slot(t)
+            if rank > registers[index]:
+                registers[index] = rank
+
+    def count(self, now):
+        with self.lock:
+            if self._merged_at is not None and now - self._merged_at < MERGE_INTERVAL:
+                return self._estimate
+            first = int((now - self.window) // self.slot)
+            last = int(now // self.slot)
+            live = [r for r, k in zip(self.registers, self.ids) if k is not None and first <= k <= last]
+            merged = bytes(self.m)
+            for r in live:
+                merged = bytes(map(max, merged, r))
+            self._estimate = self._cardinality(merged)
+            self._merged_at = now
+            return self._estimate
+
+    def _cardinality(self, registers):
+        m = self.m
+        estimate = self.alpha * m * m / sum(2.0 ** -r for r in registers)
+        zeros = registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # faixa pequena: linear counting
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def memory(self):
+        return self.slots * self.m
@@ -0,0 +1,251 @@
+import threading
+from array import array
+from collections import deque
+
+# channel_load coloca end-node/ no sys.path
+from channel_load import REFERENCE_SIZE
+from airtime import parse_datarate, time_on_air_us
+from ttn.regions import get_region
+
+# === CONFIGURAÇÕES ===
+# Algoritmo de ADR da Semtech (o mesmo do ChirpStack/TTN): margem = maior SNR
+# dos últimos HISTORY uplinks - SNR mínimo do SF - INSTALLATION_MARGIN; cada
+# STEP_DB de margem sobe um DR e, no DR máximo, baixa um passo de potência
+HISTORY = 20
+INSTALLATION_MARGIN = 10.0
+STEP_DB = 3.0
+# SNR mínimo de demodulação por SF (dB), datasheet do SX127x
+REQUIRED_SNR = {7: -7.5, 8: -10.0, 9: -12.5, 10: -15.0, 11: -17.5, 12: -20.0}
+NB_TRANS = 1
+# Sem sinal do nodo depois de ANSWER_UPLINKS uplinks, o pedido pode ser refeito
+ANSWER_UPLINKS = 10
+# MAC command LinkADRReq (LoRaWAN 1.0.x, 5.2)
+LINK_ADR_REQ = 0x03
+LINK_ADR_ANS = 0x03
+# LinkADRAns: potência, DR e máscara de canais aceitos
+LINK_ADR_ACK = 0x07
+# Tamanho do payload de cada MAC command que o nodo manda (CID -> bytes)
+UPLINK_MAC_LENGTHS = {0x02: 0, 0x03: 1, 0x04: 0, 0x05: 1, 0x06: 2, 0x07: 1, 0x08: 0, 0x09: 0, 0x0A: 1}
+
+
+def link_from_rxpk(rxpk, region):
+    """(SNR, RSSI, DR) de um rxpk do packet forwarder, ou None."""
+    try:
+        return float(rxpk["lsnr"]), int(rxpk.get("rssi", 0)), region.data_rate(rxpk["datr"])
+    except (KeyError, ValueError, TypeError):
+        return None
+
+
+def link_from_chirpstack(event):
+    """(SNR, RSSI, DR) de um evento event/up do ChirpStack: o melhor gateway
+    do rxInfo (snr no v4, loRaSNR no v3) e o "dr" do evento, ou None."""
+    best = None
+    for rx in event.get("rxInfo") or ():
+        snr = rx.get("snr", rx.get("loRaSNR"))
+        if snr is not None and (best is None or snr > best[0]):
+            best = (float(snr), int(rx.get("rssi", 0)))
+    dr = event.get("dr")
+    if best is None or dr is None:
+        return None
+    return best[0], best[1], int(dr)
+
+
+def uplink_mac_commands(fopts):
+    """(CID, payload) dos MAC commands de um FOpts de uplink; para no
+    primeiro CID desconhecido, cujo tamanho não dá para saber."""
+    commands = []
+    i = 0
+    while i < len(fopts):
+        size = UPLINK_MAC_LENGTHS.get(fopts[i])
+        if size is None or i + 1 + size > len(fopts):
+            break
+        commands.append((fopts[i], fopts[i + 1:i + 1 + size]))
+        i += 1 + size
+    return commands
+
+
+def channel_mask_blocks(region, mask):
+    """(ChMaskCntl, ChMask) dos LinkADRReq que deixam só os canais de mask.
+    US915/AU915: o bloco 7 desliga todos os de 125 kHz e ativa os de
+    500 kHz; os blocos seguintes religam os de 125 kHz em grupos de 16."""
+    if not region.sub_band_size:
+        return [(0, mask & 0xFFFF)]
+    blocks = [(7, (mask >> 64) & 0xFF)]
+    for block in range(4):
+        bits = (mask >> (16 * block)) & 0xFFFF
+        if bits:
+            blocks.append((block, bits))
+    return blocks
+
+
+class LinkHistory:
+    """SNR/RSSI dos últimos uplinks de um dispositivo em anéis de int16
+    (SNR em quartos de dB) e uma deque monotônica com o máximo da janela,
+    atualizada em O(1) amortizado a cada uplink."""
+    __slots__ = ("snr", "rssi", "count", "peak", "datarate", "tx_power", "pending", "waited", "hold")
+
+    def __init__(self, size):
+        self.snr = array("h", [0]) * size
+        self.rssi = array("h", [0]) * size
+        self.count = 0
+        # (seq, SNR) com SNR decrescente; a frente é o máximo da janela
+        self.peak = deque()
+        self.datarate = None
+        # índice de TXPower que o nodo usa: 0 (máxima) até ele aceitar um pedido
+        self.tx_power = 0
+        self.pending = None
+        self.waited = 0
+        # pedido recusado: nada de novo antes do uplink número hold
+        self.hold = 0
+
+    def add(self, snr, rssi, size):
+        seq = self.count
+        q = int(round(snr * 4))
+        self.snr[seq % size] = q
+        self.rssi[seq % size] = rssi
+        self.count = seq + 1
+        peak = self.peak
+        while peak and peak[-1][1] <= q:
+            peak.pop()
+        peak.append((seq, q))
+        if peak[0][0] <= seq - size:
+            peak.popleft()
+
+    def max_snr(self):
+        return self.peak[0][1] / 4
+
+    def mean_rssi(self, size):
+        n = min(self.count, size)
+        return sum(self.rssi[:n]) / n if n else 0.0
+
+
+class AdrEngine:
+    """ADR do lado da rede: histórico de enlace por dispositivo e a
+    recomendação de DR/potência, recalculada a cada uplink. link_adr_req()
+    devolve os LinkADRReq prontos para o FOpts do próximo downlink e segura
+    novos pedidos até o LinkADRAns do nodo (answer()); sem ele, até o nodo
+    aparecer no DR pedido ou passarem ANSWER_UPLINKS uplinks."""
+
+    def __init__(self, region="AU", sub_band=2, history=HISTORY, margin=INSTALLATION_MARGIN):
+        self.region = get_region(region)
+        self.mask = self.region.sub_band_mask(sub_band)
+        self.size = history
+        self.margin = margin
+        rates = self.region.data_rates
+        # ADR só anda pelos DRs de 125 kHz (SF12..SF7)
+        self.max_dr = max(i for i, name in enumerate(rates) if name and name.endswith("BW125"))
+        # maior índice de TXPower (MaxEIRP - 2 dB * índice), o mesmo que o nodo valida
+        self.max_tx_power = self.region.max_tx_power
+        self.devices = {}
+        self.stats = {"requests": 0, "accepted": 0, "rejected": 0, "expired": 0}
+        self.lock = threading.Lock()
+
+    def add(self, dev, link):
+        """link: (SNR, RSSI, DR) de link_from_rxpk/link_from_chirpstack, ou None."""
+        if link is None:
+            return
+        snr, rssi, datarate = link
+        with self.lock:
+            h = self.devices.get(dev)
+            if h is None:
+                h = self.devices[dev] = LinkHistory(self.size)
+            h.add(snr, rssi, self.size)
+            h.datarate = datarate
+            if h.pending is not None:
+                if datarate == h.pending[0]:
+                    h.tx_power = h.pending[1]
+                    h.pending = None
+                    self.stats["accepted"] += 1
+                else:
+                    h.waited += 1
+                    if h.waited >= ANSWER_UPLINKS:
+                        h.pending = None
+                        self.stats["expired"] += 1
+
+    def answer(self, dev, fopts):
+        """LinkADRAns no FOpts de um uplink: todos os bits de ACK confirmam o
+        pedido pendente; qualquer NACK o descarta e segura outro por HISTORY uplinks."""
+        statuses = [payload[0] for cid, payload in uplink_mac_commands(fopts) if cid == LINK_ADR_ANS]
+        if not statuses:
+            return
+        with self.lock:
+            h = self.devices.get(dev)
+            if h is None or h.pending is None:
+                return
+            if all(status & LINK_ADR_ACK == LINK_ADR_ACK for status in statuses):
+                h.tx_power = h.pending[1]
+                self.stats["accepted"] += 1
+            else:
+                h.hold = h.count + self.size
+                self.stats["rejected"] += 1
+            h.pending = None
+
+    def _recommend(self, h):
+        if h.count < self.size or h.datarate is None or h.datarate > self.max_dr:
+            return None
+        sf = parse_datarate(self.region.data_rates[h.datarate])[0]
+        steps = int((h.max_snr() - REQUIRED_SNR[sf] - self.margin) / STEP_DB)
+        dr, power = h.datarate, h.tx_power
+        while steps > 0 and dr < self.max_dr:
+            dr += 1
+            steps -= 1
+        while steps > 0 and power < self.max_tx_power:
+            power += 1
+            steps -= 1
+        while steps < 0 and power > 0:
+            power -= 1
+            steps += 1
+        if (dr, power) == (h.datarate, h.tx_power):
+            return None
+        return dr, power
+
+    def recommend(self, dev):
+        """(DR, TXPower) recomendados, ou None se nada muda ou falta histórico."""
+        with self.lock:
+            h = self.devices.get(dev)
+            return None if h is None or h.pending else self._recommend(h)
+
+    def link_adr_req(self, dev):
+        """FOpts com os LinkADRReq da recomendação (b"" sem mudança)."""
+        with self.lock:
+            h = self.devices.get(dev)
+            if h is None or h.pending or h.count < h.hold:
+                return b""
+            target = self._recommend(h)
+            if target is None:
+                return b""
+            h.pending = target
+            h.waited = 0
+            self.stats["requests"] += 1
+        dr, power = target
+        fopts = bytearray()
+        for cntl, mask in channel_mask_blocks(self.region, self.mask):
+            fopts += bytes((LINK_ADR_REQ, (dr << 4) | power, mask & 0xFF, mask >> 8, (cntl << 4) | NB_TRANS))
+        return bytes(fopts)
+
+    def summary(self):
+        """DRs em uso e o airtime que a recomendação economizaria."""
+        with self.lock:
+            current, target, rssi = {}, {}, []
+            for h in self.devices.values():
+                if h.datarate is None:
+                    continue
+                rssi.append(h.mean_rssi(self.size))
+                rec = h.pending or self._recommend(h) or (h.datarate, h.tx_power)
+                current[h.datarate] = current.get(h.datarate, 0) + 1
+                target[rec[0]] = target.get(rec[0], 0) + 1
+        if not current:
+            return "-"
+        before = sum(n * self._airtime(dr) for dr, n in current.items())
+        after = sum(n * self._airtime(dr) for dr, n in target.items())
+        dist = " ".join(f"DR{dr}:{n}" for dr, n in sorted(current.items()))
+        worst = min(rssi)
+        stats = self.stats
+        return (f"{len(self.devices)} nodos | {dist} | pior RSSI médio {worst:.0f} dBm"
+                f" | airtime recomendado {after / before - 1:+.0%}"
+                f" | pedidos={stats['requests']} aceitos={stats['accepted']} recusados={stats['rejected']}"
+                f" sem resposta={stats['expired']}")
+
+    def _airtime(self, dr):
+        sf, bw = parse_datarate(self.region.data_rates[dr])
+        return time_on_air_us(REFERENCE_SIZE, sf, bw)
@@ -0,0 +1,437 @@
+import argparse
+import base64
+import json
+import os
+import struct
+import sys
+import time
+
+# Dependência opcional: numpy para o caminho vetorizado. Sem numpy cai
+# para o decodificador quadro a quadro do servidor (lorawan_crypto).
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+END_NODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "end-node")
+sys.path.insert(0, END_NODE_DIR)
+from codec import GAME_THEORY, TEMPERATURE_BATCH
+from devices import DEVICES
+from lorawan_crypto import UPLINK, FrameCrypto, ecb
+
+# === CONFIGURAÇÕES ===
+SEMTECH_PORT = 1700
+GAME_FPORT = 2
+# Payload do nodo game theory (end-node/codec.py)
+GAME_FIELDS = GAME_THEORY.fields
+GAME_LENGTH = GAME_THEORY.size
+# Leituras em lote do nodo de temperatura (varints zigzag em delta, codec.DeltaCodec)
+BATCH_FPORT = TEMPERATURE_BATCH.fport
+BATCH_VERSION = TEMPERATURE_BATCH.version
+READING_FIELDS = ("index", "dev_addr", "f_cnt") + TEMPERATURE_BATCH.fields
+FRAME_FIELDS = ("index", "dev_addr", "f_cnt", "fport", "mic_ok", "copies", "rssi", "lsnr", "tmst", "t")
+
+if np is not None:
+    # '<BBBBBH' empacotado: 7 bytes, sem alinhamento
+    GAME_DTYPE = np.dtype([("node_id", "u1"), ("state", "u1"), ("last_sat", "u1"),
+                           ("p_rew", "u1"), ("action", "u1"), ("period", "<u2")])
+    assert GAME_DTYPE.names == GAME_FIELDS and GAME_DTYPE.itemsize == GAME_LENGTH
+    RECORD_DTYPE = np.dtype([("index", "<u4"), ("dev_addr", "<u4"), ("f_cnt", "<u4"),
+                             ("fport", "u1"), ("mic_ok", "?"), ("copies", "u1"),
+                             ("rssi", "<i2"), ("lsnr", "<f4"), ("tmst", "<u4"), ("t", "<f8"),
+                             ("has_payload", "?")] + GAME_DTYPE.descr)
+    READING_DTYPE = np.dtype([("index", "<u4"), ("dev_addr", "<u4"), ("f_cnt", "<u4"),
+                              ("epoch", "<i8"), ("temperature", "<i2")])
+
+
+# === LEITURA DAS CAPTURAS ===
+
+def _rxpk_frames(rxpk_list, t):
+    for rxpk in rxpk_list:
+        if rxpk.get("stat", 1) != 1 or "data" not in rxpk:
+            continue
+        yield (base64.b64decode(rxpk["data"]), t, rxpk.get("rssi", 0), rxpk.get("lsnr", 0.0),
+               rxpk.get("tmst", 0))
+
+
+def read_jsonl(path):
+    """Uma linha por rxpk, ou por PUSH_DATA inteiro ({"rxpk": [...]})."""
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            obj = json.loads(line)
+            t = obj.get("t", 0.0)
+            yield from _rxpk_frames(obj.get("rxpk", (obj,)), t)
+
+
+def _udp_payloads(path):
+    """Payloads UDP de um pcap clássico (Ethernet, IP cru ou Linux cooked)."""
+    with open(path, "rb") as f:
+        header = f.read(24)
+        magic = header[:4]
+        if magic in (b"\xd4\xc3\xb2\xa1", b"\x4d\x3c\xb2\xa1"):
+            endian = "<"
+        elif magic in (b"\xa1\xb2\xc3\xd4", b"\xa1\xb2\x3c\x4d"):
+            endian = ">"
+        else:
+            raise ValueError("Não é um pcap clássico")
+        nano = magic in (b"\x4d\x3c\xb2\xa1", b"\xa1\xb2\x3c\x4d")
+        linktype = struct.unpack(endian + "I", header[20:24])[0]
+        record = struct.Struct(endian + "IIII")
+        while True:
+            head = f.read(16)
+            if len(head) < 16:
+                return
+            sec, frac, incl, _ = record.unpack(head)
+            packet = f.read(incl)
+            t = sec + frac / (1e9 if nano else 1e6)
+            if linktype == 1:
+                ethertype = struct.unpack(">H", packet[12:14])[0]
+                offset = 14
+                if ethertype == 0x8100:
+                    ethertype = struct.unpack(">H", packet[16:18])[0]
+                    offset = 18
+                if ethertype != 0x0800:
+                    continue
+            elif linktype == 113:
+                offset = 16
+            elif linktype in (101, 228):
+                offset = 0
+            else:
+                raise ValueError(f"Linktype {linktype} não suportado")
+            ip = packet[offset:]
+            if len(ip) < 20 or ip[0] >> 4 != 4 or ip[9] != 17:
+                continue
+            udp = ip[(ip[0] & 0x0F) * 4:]
+            sport, dport = struct.unpack(">HH", udp[:4])
+            if SEMTECH_PORT in (sport, dport):
+                yield t, udp[8:]
+
+
+def read_pcap(path):
+    """rxpk dos PUSH_DATA (versão 2, id 0) capturados na porta 1700."""
+    for t, payload in _udp_payloads(path):
+        if len(payload) > 12 and payload[0] == 2 and payload[3] == 0:
+            try:
+                obj = json.loads(payload[12:])
+            except ValueError:
+                continue
+            yield from _rxpk_frames(obj.get("rxpk", ()), t)
+
+
+def load_frames(paths):
+    """Lê as capturas e junta cópias idênticas (vários gateways) em um quadro,
+    ficando com os metadados de melhor SNR. Retorna (phys, meta, copies)."""
+    index = {}
+    phys = []
+    meta = []
+    copies = []
+    for path in paths:
+        reader = read_pcap if path.endswith((".pcap", ".cap")) else read_jsonl
+        for phy, t, rssi, lsnr, tmst in reader(path):
+            i = index.get(phy)
+            if i is None:
+                index[phy] = len(phys)
+                phys.append(phy)
+                meta.append((rssi, lsnr, tmst, t))
+                copies.append(1)
+            else:
+                copies[i] += 1
+                if lsnr > meta[i][1]:
+                    meta[i] = (rssi, lsnr, tmst, meta[i][3])
+    return phys, meta, copies
+
+
+def _unwrap_fcnt(last, address, phy):
+    """FCnt de 32 bits: desdobra o contador de 16 bits por DevAddr, em ordem
+    de captura (last: DevAddr -> último FCnt). Sem checagem de replay, então
+    capturas fora de ordem e o FCnt voltando a 0 (reboot do nodo) passam."""
+    f_cnt = phy[6] | (phy[7] << 8)
+    previous = last.get(address)
+    if previous is not None:
+        f_cnt |= previous & ~0xFFFF
+        if f_cnt + 0x8000 < previous:
+            f_cnt += 0x10000
+    last[address] = f_cnt
+    return f_cnt
+
+
+# === DECODIFICAÇÃO VETORIZADA (numpy) ===
+
+def _subkeys(ecb):
+    """K1, K2 da CMAC (RFC 4493) como arrays de 16 bytes."""
+    l = int.from_bytes(ecb(bytes(16)), "big")
+    keys = []
+    for _ in range(2):
+        l = (l << 1) ^ (0x87 if l >> 127 else 0)
+        l &= (1 << 128) - 1
+        keys.append(np.frombuffer(l.to_bytes(16, "big"), np.uint8))
+    return keys
+
+
+class _Keys:
+    """ECB em lote das chaves de uma sessão: uma chamada cifra N blocos."""
+    def __init__(self, nwkskey, appskey):
+        self.nwk = ecb(bytes.fromhex(nwkskey))
+        self.app = ecb(bytes.fromhex(appskey))
+        self.k1, self.k2 = _subkeys(self.nwk)
+
+
+def _ecb_rows(ecb, blocks):
+    n = blocks.shape[0]
+    return np.frombuffer(ecb(blocks.tobytes()), np.uint8).reshape(n, -1)
+
+
+def _decode_group(frames, fcnt, keys, fopts_length, out, batches):
+    """frames: N quadros de mesmo DevAddr, tamanho e FOptsLen (N x L, uint8),
+    fcnt: FCnt de 32 bits de cada um. Preenche out (RECORD_DTYPE) com MIC, FCnt e payload;
+    os payloads de leituras em lote vão para batches, decodificados depois todos juntos."""
+    n, length = frames.shape
+    fcnt_bytes = fcnt.astype("<u4").view(np.uint8).reshape(n, 4)
+
+    # MIC: CMAC(NwkSKey, B0 | MHDR..FRMPayload), um bloco de todos os quadros por vez
+    msg_length = length - 4
+    total = 16 + msg_length
+    blocks = -(-total // 16)
+    data = np.zeros((n, blocks * 16), np.uint8)
+    data[:, 0] = 0x49
+    data[:, 6:10] = frames[:, 1:5]
+    data[:, 10:14] = fcnt_bytes
+    data[:, 15] = msg_length
+    data[:, 16:total] = frames[:, :msg_length]
+    if total % 16:
+        data[:, total] = 0x80
+        data[:, -16:] ^= keys.k2
+    else:
+        data[:, -16:] ^= keys.k1
+    x = np.zeros((n, 16), np.uint8)
+    for j in range(blocks):
+        x = _ecb_rows(keys.nwk, x ^ data[:, 16 * j:16 * j + 16])
+    out["mic_ok"] = (x[:, :4] == frames[:, msg_length:]).all(axis=1)
+    out["dev_addr"] = frames[:, 1:5].copy().view("<u4").ravel()
+    out["f_cnt"] = fcnt
+
+    port = 8 + fopts_length
+    if msg_length <= port:
+        return
+    fport = frames[:, port]
+    out["fport"] = fport
+    # FRMPayload: keystream AES-CTR dos blocos A_i de todos os quadros numa chamada
+    size = msg_length - port - 1
+    count = -(-size // 16)
+    a = np.zeros((n, count, 16), np.uint8)
+    a[:, :, 0] = 0x01
+    a[:, :, 6:10] = frames[:, None, 1:5]
+    a[:, :, 10:14] = fcnt_bytes[:, None, :]
+    a[:, :, 15] = np.arange(1, count + 1, dtype=np.uint8)
+    a = a.reshape(n * count, 16)
+    stream = _ecb_rows(keys.app, a).reshape(n, count * 16)
+    if (fport == 0).any():
+        # FPort 0 (comandos MAC) usa a NwkSKey
+        zero = fport == 0
+        stream[zero] = _ecb_rows(keys.nwk, a.reshape(n, count, 16)[zero].reshape(-1, 16)).reshape(-1, count * 16)
+    plain = frames[:, port + 1:msg_length] ^ stream[:, :size]
+
+    if size == GAME_LENGTH:
+        game = (fport == GAME_FPORT) & out["mic_ok"]
+        values = np.ascontiguousarray(plain).view(GAME_DTYPE).ravel()
+        out["has_payload"] = game
+        for field in GAME_FIELDS:
+            out[field] = np.where(game, values[field], 0)
+    batch = (fport == BATCH_FPORT) & out["mic_ok"]
+    if batch.any():
+        batches.append((out["index"][batch], out["dev_addr"][batch], fcnt[batch], plain[batch]))
+
+
+def _segment_cumsum(values, starts, counts):
+    """Soma acumulada que recomeça em cada segmento (starts, counts)."""
+    total = np.cumsum(values)
+    return total - np.repeat(total[starts] - values[starts], counts)
+
+
+def decode_batches(batches):
+    """Leituras (READING_DTYPE) de todos os payloads em lote de uma vez:
+    os varints viram valores com um reduceat sobre os bytes de todos os
+    quadros juntos, e epoch/temperatura saem de somas acumuladas por
+    quadro. Quadros com versão desconhecida ou truncados são descartados."""
+    if not batches:
+        return np.zeros(0, READING_DTYPE)
+    index = np.concatenate([b[0] for b in batches])
+    dev_addr = np.concatenate([b[1] for b in batches])
+    f_cnt = np.concatenate([b[2] for b in batches])
+    lengths = np.concatenate([np.full(len(b[3]), b[3].shape[1]) for b in batches])
+    data = np.concatenate([b[3].ravel() for b in batches])
+    starts = np.cumsum(lengths) - lengths
+    # versão no primeiro byte e último varint terminado
+    ok = (lengths > 1) & (data[starts] == BATCH_VERSION) & (data[starts + lengths - 1] < 0x80)
+    frame = np.repeat(np.arange(len(lengths)), lengths)
+    body = np.ones(len(data), bool)
+    body[starts] = False
+    body &= ok[frame]
+    data, frame = data[body], frame[body]
+
+    end = data < 0x80
+    first = np.flatnonzero(np.concatenate(([True], end[:-1])))
+    shift = 7 * (np.arange(len(data)) - np.repeat(first, np.diff(np.append(first, len(data)))))
+    ok &= np.bincount(frame[shift >= 63], minlength=len(lengths)) == 0
+    raw = np.add.reduceat((data & 0x7F).astype(np.int64) << np.minimum(shift, 62), first) if len(first) \
+        else np.zeros(0, np.int64)
+    fields = (raw >> 1) ^ -(raw & 1)
+    field_frame = frame[first]
+    # um par (tempo, valor) por leitura
+    counts = np.bincount(field_frame, minlength=len(lengths))
+    ok &= (counts > 0) & (counts % 2 == 0)
+    keep = ok[field_frame]
+    pairs = fields[keep].reshape(-1, 2)
+    counts = counts[ok] // 2
+    seg = np.cumsum(counts) - counts
+
+    readings = np.zeros(len(pairs), READING_DTYPE)
+    step = pairs[:, 0].copy()
+    step[seg] = 0
+    interval = _segment_cumsum(step, seg, counts)
+    readings["epoch"] = np.repeat(pairs[seg, 0], counts) + _segment_cumsum(interval, seg, counts)
+    readings["temperature"] = _segment_cumsum(pairs[:, 1], seg, counts)
+    for field, values in (("index", index), ("dev_addr", dev_addr), ("f_cnt", f_cnt)):
+        readings[field] = np.repeat(values[ok], counts)
+    return readings
+
+
+def decode_numpy(phys, meta, copies, devices=DEVICES):
+    """Decodifica todos os quadros em um array estruturado (RECORD_DTYPE), na ordem de captura,
+    e as leituras em lote em outro (READING_DTYPE)."""
+    sessions = {bytes.fromhex(a)[::-1]: _Keys(k["nwkskey"], k["appskey"]) for a, k in devices.items()}
+    groups = {}
+    skipped = 0
+    # FCnt de 32 bits: desdobra o contador de 16 bits por DevAddr, em ordem de captura
+    fcnts = [0] * len(phys)
+    last = {}
+    for i, phy in enumerate(phys):
+        # só data up (unconfirmed/confirmed) de DevAddr conhecido
+        address = phy[1:5]
+        if len(phy) < 12 or phy[0] & 0xE0 not in (0x40, 0x80) or address not in sessions:
+            skipped += 1
+            continue
+        fcnts[i] = _unwrap_fcnt(last, address, phy)
+        groups.setdefault((address, len(phy), phy[5] & 0x0F), []).append(i)
+    fcnts = np.array(fcnts, np.uint32)
+
+    records = np.zeros(len(phys) - skipped, RECORD_DTYPE)
+    batches = []
+    start = 0
+    for (address, length, fopts_length), indexes in groups.items():
+        frames = np.frombuffer(b"".join(phys[i] for i in indexes), np.uint8).reshape(len(indexes), length)
+        out = records[start:start + len(indexes)]
+        out["index"] = indexes
+        _decode_group(frames, fcnts[indexes], sessions[address], fopts_length, out, batches)
+        start += len(indexes)
+
+    records.sort(order="index")
+    rows = np.array(meta, dtype=[("rssi", "<i2"), ("lsnr", "<f4"), ("tmst", "<u4"), ("t", "<f8")])
+    kept = records["index"]
+    for field in ("rssi", "lsnr", "tmst", "t"):
+        records[field] = rows[field][kept]
+    records["copies"] = np.minimum(np.asarray(copies, np.uint32)[kept], 255)
+    readings = decode_batches(batches)
+    # estável: dentro do quadro as leituras ficam na ordem do nodo
+    readings = readings[np.argsort(readings["index"], kind="stable")]
+    return records, readings, skipped
+
+
+# === FALLBACK SEM NUMPY ===
+
+def decode_python(phys, meta, copies, devices=DEVICES):
+    """Mesmo resultado, quadro a quadro com o FrameCrypto do udp_server; listas de dicts."""
+    sessions = {}
+    for address, k in devices.items():
+        aes = FrameCrypto(bytes.fromhex(address), bytes.fromhex(k["appskey"]), bytes.fromhex(k["nwkskey"]))
+        sessions[bytes.fromhex(address)[::-1]] = aes
+    records = []
+    readings = []
+    skipped = 0
+    last = {}
+    for i, phy in enumerate(phys):
+        aes = sessions.get(phy[1:5])
+        if len(phy) < 12 or phy[0] & 0xE0 not in (0x40, 0x80) or aes is None:
+            skipped += 1
+            continue
+        # o mesmo FCnt do caminho numpy: decrypt_payload o aceita como o
+        # seguinte ao anterior, sem a sua checagem de replay
+        f_cnt = _unwrap_fcnt(last, phy[1:5], phy)
+        aes.frame_counter_up = f_cnt - 1 if f_cnt else None
+        payload = aes.decrypt_payload(phy, len(phy), UPLINK)
+        rssi, lsnr, tmst, t = meta[i]
+        # FPort vai em claro, vale mesmo com MIC inválido
+        port = 8 + (phy[5] & 0x0F)
+        record = {"index": i, "dev_addr": int.from_bytes(phy[1:5], "little"),
+                  "f_cnt": f_cnt,
+                  "fport": phy[port] if len(phy) - 4 > port else 0, "mic_ok": payload is not None,
+                  "copies": copies[i], "rssi": rssi, "lsnr": lsnr, "tmst": tmst, "t": t,
+                  "has_payload": False}
+        record.update(dict.fromkeys(GAME_FIELDS, 0))
+        if payload is not None and aes.fport == GAME_FPORT and len(payload) == GAME_LENGTH:
+            record["has_payload"] = True
+            record.update(zip(GAME_FIELDS, GAME_THEORY.decode(payload)))
+        elif payload is not None and aes.fport == BATCH_FPORT:
+            try:
+                batch = TEMPERATURE_BATCH.decode(payload)
+            except (ValueError, IndexError):
+                batch = ()
+            for reading in batch:
+                readings.append(dict(zip(READING_FIELDS, (i, record["dev_addr"], record["f_cnt"]) + reading)))
+        records.append(record)
+    return records, readings, skipped
+
+
+# === SAÍDA ===
+
+def write_csv(path, records, fields=FRAME_FIELDS + ("has_payload",) + GAME_FIELDS):
+    with open(path, "w") as f:
+        f.write(",".join(fields) + "\n")
+        for r in records:
+            f.write(",".join(str(r[k].item() if hasattr(r[k], "item") else r[k]) for k in fields) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decodifica capturas rxpk (JSON-lines ou pcap) em lote.")
+    parser.add_argument("captures", nargs="+", help="arquivos .jsonl / .pcap")
+    parser.add_argument("-o", "--out", help="saída .npy (numpy) ou .csv")
+    parser.add_argument("--readings", help="saída .npy ou .csv das leituras em lote")
+    parser.add_argument("--no-numpy", action="store_true", help="força o decodificador quadro a quadro")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    phys, meta, copies = load_frames(args.captures)
+    t1 = time.perf_counter()
+    if np is not None and not args.no_numpy:
+        records, readings, skipped = decode_numpy(phys, meta, copies)
+        mic_fail = int((~records["mic_ok"]).sum())
+        payloads = int(records["has_payload"].sum())
+    else:
+        records, readings, skipped = decode_python(phys, meta, copies)
+        mic_fail = sum(1 for r in records if not r["mic_ok"])
+        payloads = sum(1 for r in records if r["has_payload"])
+    t2 = time.perf_counter()
+
+    rate = len(phys) / (t2 - t1) if t2 > t1 else 0.0
+    print(f"📦 {len(phys)} quadros únicos ({sum(copies)} cópias) | ignorados={skipped}"
+          f" | MIC inválido={mic_fail} | payloads game theory={payloads} | leituras em lote={len(readings)}")
+    print(f"⏱️ leitura {t1 - t0:.2f}s | decodificação {t2 - t1:.3f}s ({rate:,.0f} quadros/s)")
+
+    for path, rows, fields in ((args.out, records, FRAME_FIELDS + ("has_payload",) + GAME_FIELDS),
+                               (args.readings, readings, READING_FIELDS)):
+        if not path:
+            continue
+        if path.endswith(".npy"):
+            if np is None or args.no_numpy:
+                sys.exit("Saída .npy precisa do numpy")
+            np.save(path, rows)
+        else:
+            write_csv(path, rows, fields)
+        print(f"💾 {path}")
+
+
+if __name__ == "__main__":
+    main()
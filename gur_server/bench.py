@@ -0,0 +1,354 @@
+import argparse
+import base64
+import contextlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import timeit
+
+from adr import AdrEngine
+from buckets import BucketRing
+# channel_load coloca end-node/ (codec) no sys.path
+from channel_load import ChannelAirtime, from_chirpstack
+from codec import GAME_THEORY
+from lorawan_crypto import DOWNLINK, UPLINK, FrameCrypto
+from pipeline import Pipeline
+from session_store import SessionStore
+
+# Os servidores importam paho no topo; sem ele os benchmarks de servidor
+# são pulados e só os do nodo rodam
+try:
+    import chirp_satisfaction_server as chirp
+    import gur_server as gur
+except ImportError as e:
+    chirp = gur = None
+    MISSING = str(e)
+
+# === CONFIGURAÇÕES ===
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+# Regressão quando o tempo passa de THRESHOLD x baseline; os de I/O
+# variam mais com o disco e têm limite próprio no baseline
+THRESHOLD = 1.3
+IO_THRESHOLD = 2.0
+REPEAT = 5
+# Uma regressão aparente é medida de novo antes de contar: ruído de
+# máquina compartilhada só deixa mais lento, então vale o menor
+RETRIES = 2
+MIN_TIME = 0.2
+WINDOW_SIZES = (100, 1000, 10000, 100000)
+
+DEV_ADDR = bytearray([0x01, 0x03, 0x22, 0x00])
+KEY = bytearray(range(16))
+NODE_BYTES = GAME_THEORY.encode(3, 5, 70, 50, 1, 42)
+NODE_B64 = base64.b64encode(NODE_BYTES).decode()
+
+BENCHMARKS = []
+
+
+def benchmark(name, io=False, server=False):
+    """Registra um setup que devolve a função medida (sem argumentos)."""
+    def register(setup):
+        BENCHMARKS.append((name, setup, io, server))
+        return setup
+    return register
+
+
+class FakeClient:
+    """Cliente MQTT que só conta as publicações."""
+
+    def __init__(self):
+        self.published = 0
+
+    def publish(self, topic, payload):
+        self.published += 1
+
+
+class FakeMessage:
+    def __init__(self, payload):
+        self.payload = payload
+
+
+def chirp_uplink(dev_eui, f_cnt):
+    return json.dumps({
+        "fPort": 2, "fCnt": f_cnt, "deviceInfo": {"devEui": dev_eui}, "data": NODE_B64,
+    }).encode()
+
+
+def ttn_uplink(device_id):
+    return json.dumps({"end_device_ids": {"device_id": device_id}}).encode()
+
+
+def reset_chirp(tmp, events=0):
+    chirp.LOG_FILE = os.path.join(tmp, "chirp.csv")
+    chirp.init_log_file()
+    if chirp.store is not None:
+        chirp.store.close()
+        chirp.store = None
+    if chirp.pipeline is not None:
+        chirp.pipeline.stop()
+        chirp.pipeline = None
+    chirp.window.__init__(chirp.WINDOW_SECONDS)
+    now = time.time()
+    for k in range(events):
+        chirp.window.add(now, f"dev{k % 1000}")
+
+
+# === SERVIDOR ===
+
+@benchmark("chirp.calc_satisfaction", server=True)
+def bench_calc_satisfaction(tmp):
+    return lambda: chirp.calc_satisfaction(47, 45)
+
+
+@benchmark("gur.calc_satisfaction", server=True)
+def bench_gur_calc_satisfaction(tmp):
+    return lambda: gur.calc_satisfaction(47, 45)
+
+
+@benchmark("chirp.unpack_node_data", server=True)
+def bench_unpack_node_data(tmp):
+    return lambda: chirp.unpack_node_data(NODE_B64)
+
+
+def bench_window(size):
+    def setup(tmp):
+        reset_chirp(tmp, size)
+        return chirp.get_window_stats
+    return setup
+
+
+for size in WINDOW_SIZES:
+    benchmark(f"chirp.get_window_stats[{size}]", server=True)(bench_window(size))
+
+
+@benchmark("chirp.log_data", io=True, server=True)
+def bench_log_data(tmp):
+    reset_chirp(tmp)
+    node_data = chirp.unpack_node_data(NODE_B64)
+    return lambda: chirp.log_data("70b3d57ed007334e", 1, node_data, 40, 45, 90.0, 0, 7)
+
+
+@benchmark("gur.log_event", io=True, server=True)
+def bench_log_event(tmp):
+    gur.LOG_FILE = os.path.join(tmp, "gur.csv")
+    return lambda: gur.log_event("node-1", 40, 90.0)
+
+
+@benchmark("chirp.on_message", io=True, server=True)
+def bench_on_message(tmp):
+    reset_chirp(tmp, 1000)
+    client = FakeClient()
+    msg = FakeMessage(chirp_uplink("70b3d57ed007334e", 1))
+    return lambda: chirp.on_message(client, None, msg)
+
+
+@benchmark("chirp.on_message+store", io=True, server=True)
+def bench_on_message_store(tmp):
+    reset_chirp(tmp, 1000)
+    chirp.store = SessionStore(os.path.join(tmp, "chirp.db"))
+    client = FakeClient()
+    msg = FakeMessage(chirp_uplink("70b3d57ed007334e", 1))
+    return lambda: chirp.on_message(client, None, msg)
+
+
+@benchmark("chirp.on_message[pipeline]", server=True)
+def bench_on_message_pipeline(tmp):
+    # custo no thread de rede do paho: só o enfileiramento
+    reset_chirp(tmp)
+    chirp.pipeline = Pipeline(lambda item, shedding: None)
+    client = FakeClient()
+    msg = FakeMessage(chirp_uplink("70b3d57ed007334e", 1))
+    msg.topic = "application/app/device/70b3d57ed007334e/event/up"
+    return lambda: chirp.on_message(client, None, msg)
+
+
+@benchmark("gur.on_message", io=True, server=True)
+def bench_gur_on_message(tmp):
+    gur.LOG_FILE = os.path.join(tmp, "gur.csv")
+    gur.store = SessionStore(os.path.join(tmp, "gur.db"))
+    gur.nodes = {}
+    client = FakeClient()
+    msg = FakeMessage(ttn_uplink("node-1"))
+    return lambda: gur.on_message(client, None, msg)
+
+
+@benchmark("buckets.add")
+def bench_buckets_add(tmp):
+    ring = BucketRing()
+    clock = iter(range(10 ** 12))
+    return lambda: ring.add(next(clock) * 0.001)
+
+
+@benchmark("buckets.count[1800]")
+def bench_buckets_count(tmp):
+    ring = BucketRing()
+    for k in range(100000):
+        ring.add(k * 0.018)
+    return lambda: ring.count(1800, 1800.0)
+
+
+@benchmark("channel_load.add")
+def bench_channel_add(tmp):
+    channels = ChannelAirtime()
+    event = {"data": base64.b64encode(NODE_BYTES).decode(),
+             "txInfo": {"frequency": 916800000,
+                        "modulation": {"lora": {"bandwidth": 125000, "spreadingFactor": 10, "codeRate": "CR_4_5"}}}}
+    clock = iter(range(10 ** 12))
+    return lambda: channels.add(next(clock) * 0.001, from_chirpstack(event))
+
+
+@benchmark("adr.add+link_adr_req")
+def bench_adr(tmp):
+    adr = AdrEngine()
+    link = (-4.0, -110, 3)
+
+    def step():
+        adr.add("dev", link)
+        adr.link_adr_req("dev")
+    return step
+
+
+# === AES DE SESSÃO (lorawan_crypto; o AES do nodo é medido por end-node/host/run_host.py bench) ===
+
+@benchmark("crypto.encrypt_payload[7]")
+def bench_encrypt(tmp):
+    aes = FrameCrypto(DEV_ADDR, KEY, KEY)
+    data = bytearray(NODE_BYTES)
+    return lambda: aes.encrypt_payload(data, UPLINK, 1)
+
+
+@benchmark("crypto.encrypt_payload[51]")
+def bench_encrypt_51(tmp):
+    aes = FrameCrypto(DEV_ADDR, KEY, KEY)
+    data = bytearray(51)
+    return lambda: aes.encrypt_payload(data, UPLINK, 1)
+
+
+@benchmark("crypto.calculate_mic[16]")
+def bench_mic(tmp):
+    aes = FrameCrypto(DEV_ADDR, KEY, KEY)
+    frame = bytearray(16)
+    mic = bytearray(4)
+    return lambda: aes.calculate_mic(frame, 16, mic, UPLINK, 1)
+
+
+@benchmark("crypto.calculate_mic[64]")
+def bench_mic_64(tmp):
+    aes = FrameCrypto(DEV_ADDR, KEY, KEY)
+    frame = bytearray(64)
+    mic = bytearray(4)
+    return lambda: aes.calculate_mic(frame, 64, mic, DOWNLINK, 1)
+
+
+def calibration():
+    """Carga fixa de referência: os resultados são guardados também em
+    unidades dela, o que desconta a variação de clock/carga da máquina."""
+    counts = {}
+    for i in range(200):
+        key = i % 7
+        counts[key] = counts.get(key, 0) + i
+    return counts
+
+
+def _number(timer):
+    number, elapsed = timer.autorange()
+    return max(1, int(number * MIN_TIME / max(elapsed, 1e-9)))
+
+
+def measure(fn):
+    """(ns por chamada, ns relativo à calibração). As rodadas do benchmark
+    e da calibração são intercaladas e a razão é a mediana das razões de
+    cada par, de modo que um surto de carga afeta os dois lados igual."""
+    timer, reference = timeit.Timer(fn), timeit.Timer(calibration)
+    number, ref_number = _number(timer), _number(reference)
+    best = float("inf")
+    ratios = []
+    for _ in range(REPEAT):
+        t = timer.timeit(number) / number
+        ratios.append(t / (reference.timeit(ref_number) / ref_number))
+        best = min(best, t)
+    ratios.sort()
+    return best * 1e9, ratios[len(ratios) // 2]
+
+
+def machine():
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+    }
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks dos caminhos quentes do servidor e do nodo.")
+    parser.add_argument("-k", "--filter", default="", help="roda só os nomes que contêm o texto")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save", action="store_true", help="grava os resultados como novo baseline")
+    parser.add_argument("--threshold", type=float, default=None,
+                        help=f"limite de regressão (padrão {THRESHOLD}, I/O {IO_THRESHOLD})")
+    args = parser.parse_args()
+
+    if chirp is None:
+        print(f"⚠️ Benchmarks de servidor pulados: {MISSING}")
+    baseline = load_baseline(args.baseline)
+    if baseline and baseline["machine"] != machine():
+        print(f"⚠️ Baseline de outra máquina/ambiente: {baseline['machine']}")
+    reference = baseline["results"] if baseline else {}
+
+    results = {}
+    regressions = []
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w") as devnull:
+        for name, setup, io, server in BENCHMARKS:
+            if args.filter not in name or (server and chirp is None):
+                continue
+            # os handlers imprimem a cada mensagem; fora da medida
+            threshold = args.threshold or (IO_THRESHOLD if io else THRESHOLD)
+            limit = args.threshold or reference.get(name, {}).get("threshold", threshold)
+            with contextlib.redirect_stdout(devnull):
+                fn = setup(tmp)
+                ns, rel = measure(fn)
+                for _ in range(RETRIES):
+                    if name not in reference or rel / reference[name]["rel"] <= limit:
+                        break
+                    again, again_rel = measure(fn)
+                    ns, rel = min(ns, again), min(rel, again_rel)
+            results[name] = {"ns": round(ns, 1), "rel": round(rel, 4),
+                             "threshold": IO_THRESHOLD if io else THRESHOLD}
+            line = f"{name:32s} {ns:12.1f} ns {rel:9.4f} cal"
+            if name in reference:
+                ratio = rel / reference[name]["rel"]
+                line += f"  {ratio:5.2f}x baseline"
+                if ratio > limit:
+                    regressions.append(name)
+                    line += f"  ❌ REGRESSÃO (> {limit}x)"
+            print(line)
+        if chirp is not None:
+            reset_chirp(tmp)
+        if gur is not None and gur.store is not None:
+            gur.store.close()
+
+    if args.save:
+        # com -k só os benchmarks que rodaram são substituídos
+        saved = dict(reference) if baseline and baseline["machine"] == machine() else {}
+        saved.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump({"machine": machine(), "results": saved}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"💾 Baseline salvo em {args.baseline}")
+    if regressions:
+        print(f"❌ {len(regressions)} regressão(ões): {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
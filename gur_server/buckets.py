@@ -0,0 +1,100 @@
+import math
+import threading
+from array import array
+
+# === CONFIGURAÇÕES ===
+# O maior horizonte consultado: a janela de 30 min do gur_server.py
+SPAN_SECONDS = 1800
+RESOLUTION = 1.0
+# Constantes de tempo das médias exponenciais (s): 1, 5 e 30 min
+EWMA_TAUS = (60, 300, 1800)
+
+
+class BucketRing:
+    """Contagem de eventos em baldes de RESOLUTION s num anel de SPAN_SECONDS,
+    de onde saem janelas de qualquer tamanho até o span. Cada balde guarda
+    também o total acumulado no seu início (soma de prefixos), então
+    count(janela) é uma subtração, O(1), e todas as resoluções dividem a
+    mesma memória. As EWMA são atualizadas a cada evento, O(len(taus)).
+    Alimentado pelos workers e lido pelos Timers de status, daí o lock."""
+
+    def __init__(self, span=SPAN_SECONDS, resolution=RESOLUTION, taus=EWMA_TAUS):
+        self.resolution = resolution
+        self.size = int(math.ceil(span / resolution)) + 1
+        self.counts = array("Q", [0]) * self.size
+        self.starts = array("Q", [0]) * self.size
+        self.total = 0
+        self.head = None
+        self.taus = tuple(taus)
+        self.ewma = [0.0] * len(self.taus)
+        self.ewma_t = None
+        self.lock = threading.Lock()
+
+    def _advance(self, b):
+        """Abre os baldes até b (absoluto); os pulados ficam vazios."""
+        if self.head is not None and b <= self.head:
+            return
+        first = b if self.head is None else max(self.head + 1, b - self.size + 1)
+        size, total = self.size, self.total
+        for k in range(first, b + 1):
+            i = k % size
+            self.starts[i] = total
+            self.counts[i] = 0
+        self.head = b
+
+    def add(self, t, n=1):
+        b = int(t // self.resolution)
+        with self.lock:
+            self._advance(b)
+            if b <= self.head - self.size:
+                return
+            size = self.size
+            self.counts[b % size] += n
+            # evento atrasado: os baldes seguintes começam n eventos depois
+            for k in range(b + 1, self.head + 1):
+                self.starts[k % size] += n
+            self.total += n
+            dt = 0.0 if self.ewma_t is None else t - self.ewma_t
+            if dt > 0:
+                self.ewma = [r * math.exp(-dt / tau) + n / tau for r, tau in zip(self.ewma, self.taus)]
+                self.ewma_t = t
+            else:
+                self.ewma = [r + n / tau for r, tau in zip(self.ewma, self.taus)]
+                if self.ewma_t is None:
+                    self.ewma_t = t
+
+    def _prefix(self, b):
+        """Total acumulado no início do balde absoluto b (b <= head + 1)."""
+        if b > self.head:
+            return self.total
+        return self.starts[b % self.size]
+
+    def count(self, window, now):
+        """Eventos nos últimos `window` s, na resolução de um balde."""
+        k = min(max(1, int(round(window / self.resolution))), self.size - 1)
+        with self.lock:
+            self._advance(int(now // self.resolution))
+            return self.total - self._prefix(self.head - k + 1)
+
+    def rate(self, window, now):
+        """Eventos por segundo nos últimos `window` s."""
+        return self.count(window, now) / window
+
+    def ewma_rate(self, tau, now):
+        """Média exponencial da taxa (eventos/s) com constante de tempo tau."""
+        with self.lock:
+            r, last = self.ewma[self.taus.index(tau)], self.ewma_t
+        if last is None or now <= last:
+            return r
+        return r * math.exp(-(now - last) / tau)
+
+    def series(self, window, step, now):
+        """Contagens por intervalo de `step` s nos últimos `window` s, do
+        mais antigo ao mais novo (métricas/gráficos), O(window/step)."""
+        per = max(1, int(round(step / self.resolution)))
+        k = min(max(per, int(round(window / self.resolution))), self.size - 1)
+        with self.lock:
+            self._advance(int(now // self.resolution))
+            edges = range(self.head - k + 1, self.head + 2, per)
+            prefix = [self._prefix(b) for b in edges]
+        return [b - a for a, b in zip(prefix, prefix[1:])]
@@ -0,0 +1,124 @@
+import base64
+import math
+import os
+import sys
+import threading
+
+# time_on_air_us() do nodo (end-node/airtime.py, Semtech AN1200.13), que
+# não importa nada do MicroPython
+END_NODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "end-node")
+sys.path.insert(0, END_NODE_DIR)
+from airtime import parse_datarate, time_on_air_us
+from buckets import BucketRing
+from codec import GAME_THEORY
+
+# === CONFIGURAÇÕES ===
+WINDOW_SECONDS = 300
+# MHDR (1) + FHDR sem FOpts (7) + FPort (1) + MIC (4)
+FRAME_OVERHEAD = 13
+# Uplink de referência: o payload do jogo em SF7BW125. Janelas em airtime
+# são expressas em "uplinks equivalentes" a ele, na mesma escala do target
+REFERENCE_DATARATE = "SF7BW125"
+REFERENCE_SIZE = GAME_THEORY.size + FRAME_OVERHEAD
+# Uplink sem txInfo/rxpk (ex.: replay de CSV): canal 0 e airtime de referência
+UNKNOWN_CHANNEL = 0
+# Métricas de carga que alimentam calc_satisfaction
+LOAD_METRICS = ("messages", "airtime", "aloha")
+
+
+def reference_airtime():
+    sf, bw = parse_datarate(REFERENCE_DATARATE)
+    return time_on_air_us(REFERENCE_SIZE, sf, bw)
+
+
+def _coding_rate(codr):
+    # "4/5" (Semtech e ChirpStack v3) ou "CR_4_5" (ChirpStack v4) -> 5
+    try:
+        return int(str(codr).replace("_", "/").split("/")[-1])
+    except ValueError:
+        return 5
+
+
+def from_chirpstack(event):
+    """(canal em Hz, airtime em µs) de um evento event/up do ChirpStack,
+    ou None sem txInfo LoRa. Aceita o JSON do v4 (modulation.lora, banda
+    em Hz) e do v3 (loRaModulationInfo, banda em kHz). O tamanho é o do
+    FRMPayload mais o cabeçalho, sem FOpts (que o evento não traz)."""
+    tx = event.get("txInfo") or {}
+    modulation = tx.get("modulation")
+    if isinstance(modulation, dict):
+        lora = modulation.get("lora")
+    else:
+        lora = tx.get("loRaModulationInfo")
+    if not lora:
+        return None
+    bandwidth = int(lora.get("bandwidth", 125))
+    if bandwidth < 1000:
+        bandwidth *= 1000
+    size = len(base64.b64decode(event.get("data") or "")) + FRAME_OVERHEAD
+    toa = time_on_air_us(size, int(lora["spreadingFactor"]), bandwidth,
+                         _coding_rate(lora.get("codeRate", "4/5")))
+    return int(tx.get("frequency", UNKNOWN_CHANNEL)), toa
+
+
+def from_rxpk(rxpk):
+    """(canal em Hz, airtime em µs) de um rxpk do packet forwarder."""
+    datr = rxpk.get("datr")
+    if not isinstance(datr, str) or rxpk.get("modu", "LORA") != "LORA":
+        return None
+    sf, bw = parse_datarate(datr)
+    toa = time_on_air_us(int(rxpk["size"]), sf, bw, _coding_rate(rxpk.get("codr", "4/5")))
+    return int(round(float(rxpk.get("freq", 0)) * 1e6)), toa
+
+
+class ChannelAirtime:
+    """Airtime recebido por canal numa janela deslizante. Cada canal tem
+    seu BucketRing (µs por balde de 1 s), então somar ou consultar a janela
+    é O(1) por canal. A utilização de um canal é airtime/janela, ou seja a
+    carga oferecida G do ALOHA puro, e 1 - exp(-2G) estima a chance de um
+    uplink colidir nele (SFs diferentes tratados como se colidissem)."""
+
+    def __init__(self, window=WINDOW_SECONDS):
+        self.window = window
+        self.channels = {}
+        self.reference = reference_airtime()
+        self.lock = threading.Lock()
+
+    def add(self, t, airtime=None):
+        """airtime: (canal, µs) de from_chirpstack/from_rxpk, ou None."""
+        channel, toa = airtime or (UNKNOWN_CHANNEL, self.reference)
+        with self.lock:
+            ring = self.channels.get(channel)
+            if ring is None:
+                ring = self.channels[channel] = BucketRing(self.window, taus=())
+        ring.add(t, toa)
+
+    def airtime(self, now):
+        """Airtime (µs) na janela por canal."""
+        with self.lock:
+            rings = list(self.channels.items())
+        return {channel: ring.count(self.window, now) for channel, ring in rings}
+
+    def utilisation(self, now):
+        """Fração do tempo da janela ocupada, por canal."""
+        return {channel: us / (self.window * 1e6) for channel, us in self.airtime(now).items()}
+
+    def load(self, metric, now):
+        """Carga da janela em uplinks equivalentes ao de referência.
+        airtime: todo o airtime recebido / airtime de referência.
+        aloha: a carga que, espalhada igualmente pelos canais em uso, daria
+        ao mais cheio a sua probabilidade de colisão; pesa o desequilíbrio
+        entre canais, que a soma simples esconde."""
+        used = [us for us in self.airtime(now).values() if us]
+        if not used:
+            return 0.0
+        if metric == "airtime":
+            return round(sum(used) / self.reference, 1)
+        return round(max(used) * len(used) / self.reference, 1)
+
+    def summary(self, now):
+        parts = []
+        for channel, g in sorted(self.utilisation(now).items()):
+            name = f"{channel / 1e6:.1f}" if channel else "?"
+            parts.append(f"{name}: {g:.1%} (col. {1 - math.exp(-2 * g):.1%})")
+        return " | ".join(parts) or "-"
@@ -0,0 +1,169 @@
+import asyncio
+import base64
+import contextlib
+import csv
+import os
+import sys
+import tempfile
+
+from dedup import COLLECT_WINDOW
+from devices import DEVICES
+from gateway_stats import GatewayStats
+from lorawan_crypto import MTYPE_UNCONFIRMED_UP, UPLINK, FrameCrypto
+from session_store import SessionStore
+from target_schedule import Schedule
+
+# Os servidores importam paho no topo; sem ele as verificações que passam
+# por eles são puladas (como no bench.py)
+try:
+    import chirp_satisfaction_server as chirp
+    import replay
+    import udp_server
+except ImportError as e:
+    chirp = replay = udp_server = None
+    MISSING = str(e)
+
+# python checks.py: verificações do servidor, no estilo de end-node/host/run_host.py.
+# Sai com 1 se alguma falhar.
+CHECKS = []
+GATEWAY = "AA555A0000000000"
+
+
+def check(server=False):
+    """Registra uma verificação: fn(tmp) devolve True se tudo passou."""
+    def register(fn):
+        CHECKS.append((fn, server))
+        return fn
+    return register
+
+
+def _check(name, ok):
+    print(f"{'✅' if ok else '❌'} {name}")
+    return ok
+
+
+def uplink_frame(crypto, dev_addr, f_cnt, fport, payload):
+    """PHYPayload unconfirmed up como o nodo monta (end-node/sx127x.py)."""
+    data = bytearray(payload)
+    crypto.encrypt_payload(data, UPLINK, f_cnt)
+    frame = (bytearray([MTYPE_UNCONFIRMED_UP]) + bytes.fromhex(dev_addr)[::-1] +
+             bytes((0, f_cnt & 0xFF, (f_cnt >> 8) & 0xFF, fport)) + data)
+    return bytes(frame + crypto.calculate_mic(frame, len(frame), bytearray(4), UPLINK, f_cnt))
+
+
+def udp_receive(server, phys):
+    """Entrega os PHYPayloads ao servidor UDP como rxpk de um gateway e espera
+    a deduplicação e o worker do Pipeline terminarem."""
+    async def run():
+        server.connection_made(None)
+        for phy in phys:
+            server.handle_rxpk(GATEWAY, {"tmst": 0, "freq": 916.8, "datr": "SF7BW125", "codr": "4/5",
+                                         "lsnr": 7.0, "rssi": -50, "stat": 1, "size": len(phy),
+                                         "data": base64.b64encode(phy).decode()})
+        await asyncio.sleep(COLLECT_WINDOW + 0.1)
+    asyncio.run(run())
+    server.pipeline.stop()
+    return server.stats
+
+
+# === LoRaWAN ===
+
+@check(server=True)
+def check_fcnt_reset(tmp):
+    """Nodo ABP reiniciado: o FCntUp 20000 volta do SQLite e o nodo manda FCnt 0."""
+    dev_addr, keys = next(iter(DEVICES.items()))
+    node = FrameCrypto(bytes.fromhex(dev_addr), bytes.fromhex(keys["appskey"]), bytes.fromhex(keys["nwkskey"]))
+    store = SessionStore(os.path.join(tmp, "fcnt.db"))
+    ok = True
+    for relax in (True, False):
+        store.save_device(dev_addr, {"f_cnt_up": 20000, "f_cnt_down": 7})
+        server = udp_server.SemtechUDPServer({dev_addr: dict(keys, relax_fcnt=relax)},
+                                             lambda server, uplink, shedding: None, store=store)
+        forged = bytearray(uplink_frame(node, dev_addr, 2, 2, b"\x00" * 7))
+        forged[-1] ^= 0xFF
+        stats = udp_receive(server, [uplink_frame(node, dev_addr, f_cnt, 2, b"\x00" * 7) for f_cnt in (0, 1)]
+                            + [bytes(forged)])
+        saved = store.load_devices()[dev_addr]
+        if relax:
+            ok &= _check("relax_fcnt: FCnt 0 após restaurar 20000 é aceito como reset",
+                         stats["uplinks"] == 2 and stats["fcnt_reset"] == 1 and saved["f_cnt_up"] == 1
+                         and saved["f_cnt_down"] == 7)
+        else:
+            ok &= _check("sem relax_fcnt: FCnt 0 é rejeitado como replay, não como MIC",
+                         stats["uplinks"] == 0 and stats["fcnt_rejected"] == 2 and saved["f_cnt_up"] == 20000)
+        ok &= _check(f"relax_fcnt={relax}: MIC adulterado conta só em mic_fail", stats["mic_fail"] == 1)
+    store.close()
+    return ok
+
+
+# === GATEWAYS ===
+
+@check()
+def check_gateway_boundary(tmp):
+    """Janela que cruza a fronteira entre o histórico reduzido e as amostras
+    cruas, com a mais antiga no meio de um balde grosso: cada stat conta uma vez."""
+    stats = GatewayStats(raw_capacity=5, coarse_step=60, coarse_capacity=100)
+    for k in range(20):
+        stats.record("B827EBFFFE295E58", {"rxnb": 1, "rxok": 1}, k * 30.0)
+    rows = stats.query("B827EBFFFE295E58", 0, 600, step=60)
+    return _check("gateway_stats: balde da fronteira cru/grosso contado uma vez",
+                  sum(r["rxnb"] for r in rows) == 20 and all(r["rxnb"] == 2 for r in rows))
+
+
+# === CRONOGRAMA ===
+
+@check()
+def check_periodic_schedule(tmp):
+    """Ciclo com o primeiro ponto depois de 0: até ele vale o fim do ciclo anterior."""
+    steps = Schedule([(10, 5), (20, 9)], period=30)
+    ramp = Schedule([(10, 0), (20, 10)], "ramp", period=30)
+    ok = _check("degraus periódicos: target(35) é o 9 do ciclo anterior",
+                steps.target(35) == 9 and steps.target(5) == 9 and steps.target(45) == 5)
+    ok &= _check("degraus periódicos: next_change(35) é o primeiro ponto, 40",
+                 steps.next_change(25) == 40 and steps.next_change(35) == 40)
+    ok &= _check("rampa periódica: target(35) fica em 10 até t=40", ramp.target(35) == 10 and ramp.target(39.9) == 10)
+    return ok
+
+
+# === REPLAY ===
+
+@check(server=True)
+def check_replay_trial(tmp):
+    """Replay num CSV que já tem os trials 1 a 3: o TRIAL_ID do import
+    (do CSV padrão) não pode ser reaproveitado."""
+    out = os.path.join(tmp, "replay.csv")
+    chirp.LOG_FILE = out
+    chirp.init_log_file()
+    with open(out, "a", newline="") as f:
+        writer = csv.writer(f)
+        for trial in (1, 2, 3):
+            writer.writerow([trial, 0, "0000000000000001", 1, trial] + [0] * 10)
+    chirp.TRIAL_ID = 1
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        server = replay.start_chirp(out, replay.REPLAY_EPOCH)
+        replay.replay(server, replay.synthetic("chirp", 2, 60, 600))
+    saved = server.store.get_state("trial")
+    server.store.close()
+    server.store = None
+    with open(out, newline="") as f:
+        trials = [row["Trial_ID"] for row in csv.DictReader(f)]
+    ok = _check("replay num CSV com trials 1-3 grava o trial 4",
+                trials[:3] == ["1", "2", "3"] and len(trials) == 23 and set(trials[3:]) == {"4"})
+    ok &= _check("replay guarda o trial e o início no store", saved == {"id": 4, "start": replay.REPLAY_EPOCH})
+    return ok
+
+
+def main():
+    if udp_server is None:
+        print(f"⚠️ Verificações de servidor puladas: {MISSING}")
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        for fn, server in CHECKS:
+            if server and udp_server is None:
+                continue
+            ok &= fn(tmp)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,20 +4,69 @@ import time
 import math
 import base64
 import csv
-import struct
 import os
-from threading import Timer
+import sys
+from threading import RLock
 from datetime import datetime
 
+# Formatos dos payloads compartilhados com o nodo (end-node/codec.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "end-node"))
+from codec import GAME_THEORY, SATISFACTION, SATISFACTION_V2
+from active_nodes import LastSeen, SlidingHLL
+from adr import AdrEngine, link_from_chirpstack
+from buckets import BucketRing
+from channel_load import ChannelAirtime, LOAD_METRICS, from_chirpstack
+from clock import RealClock
+from controller import RateController
+from fairness import FAIRNESS_MODES, WindowCounter
+from pipeline import Pipeline
+from console import Console
+from session_store import SessionStore
+from target_schedule import load_schedule
+
 # === CONFIGURAÇÕES ===
 MQTT_BROKER = "localhost"
 MQTT_PORT = 1883
 APPLICATION_ID = "50981d4c-9ebd-49fc-a7d4-f88ea8598ef2"
 LOG_FILE = "dados_experimento_game_theory_v3.csv" # Mudei para v3 para não misturar
+STORE_FILE = "sessao_game_theory_v3.db" # Janela e trial em andamento, para retomar após crash
 
 # === PARÂMETROS FIXOS ===
 WINDOW_SECONDS = 300
 TICK_INTERVAL = 60
+# Eventos que saíram da janela são apagados do store a cada COMPACT_INTERVAL s
+COMPACT_INTERVAL = 60
+# Alvo de mensagens por janela: 45 até 1 h, 25 até 2 h, depois 35
+TARGET_SCHEDULE = load_schedule("game_theory_v3.json")
+# Malha fechada: recomenda um período aos nodos (downlink v3); False volta ao v2
+CONTROL_ENABLED = True
+# Fila entre o thread do paho e o processamento (pipeline.POLICIES)
+PIPELINE_WORKERS = 2
+PIPELINE_QUEUE = 1024
+PIPELINE_POLICY = "shed"
+# Terminal: resumo a cada CONSOLE_INTERVAL s e 1 linha a cada CONSOLE_SAMPLE uplinks
+CONSOLE_INTERVAL = 10
+CONSOLE_SAMPLE = 100
+CONSOLE_QUIET = False
+# Sinal por dispositivo (fairness.FAIRNESS_MODES): None, "share" ou "maxmin"
+FAIRNESS_MODE = None
+# Contagem da janela e dos nodos ativos:
+#   window: exata, WindowCounter guarda cada uplink (necessário para FAIRNESS_MODE)
+#   last_seen: exata, só o último uplink de cada nodo; total da janela pelo BucketRing
+#   hll: aproximada (HyperLogLog, ~1.6%), memória fixa para frotas muito grandes
+ACTIVE_MODE = "window"
+# O que a satisfação compara com o target (channel_load.LOAD_METRICS):
+#   messages: uplinks na janela, como sempre
+#   airtime: airtime da janela em uplinks equivalentes (payload do jogo em SF7BW125)
+#   aloha: idem, pelo canal mais cheio (probabilidade de colisão do ALOHA puro)
+LOAD_METRIC = "messages"
+# ADR: pelo MQTT quem manda MAC commands é o ChirpStack, então aqui a
+# recomendação (adr.py) só aparece no status; o servidor UDP a envia
+ADR_REGION = "AU"
+ADR_SUB_BAND = 2
+
+# Relógio de tudo que é horário ou Timer (clock.py); o replay troca por um VirtualClock
+clock = RealClock()
 
 # === CONTROLE DE TRIAL ===
 def get_next_trial_id():
@@ -30,19 +79,26 @@ def get_next_trial_id():
     except: return 1
 
 TRIAL_ID = get_next_trial_id()
-START_TIME = time.time()
-message_log = []
+START_TIME = clock.time()
+window = WindowCounter(WINDOW_SECONDS)
+store = None
+active_nodes = {"window": lambda: None, "last_seen": LastSeen, "hll": SlidingHLL}[ACTIVE_MODE]()
+# Carga em baldes de 1 s: janelas de 1/5/30 min e EWMA, e a taxa do controlador
+load = BucketRing()
+controller = RateController(WINDOW_SECONDS, ring=load)
+# Airtime por canal (txInfo do ChirpStack / rxpk do servidor UDP)
+channels = ChannelAirtime(WINDOW_SECONDS)
+adr = AdrEngine(ADR_REGION, ADR_SUB_BAND)
+# Janela e controlador são compartilhados pelos workers, Timers e servidor UDP
+state_lock = RLock()
+pipeline = None
+console = Console("chirp", CONSOLE_INTERVAL, CONSOLE_SAMPLE, CONSOLE_QUIET)
 
 # === FUNÇÕES ===
 
 def get_dynamic_target(sim_time):
     """Define o objetivo de mensagens baseado no tempo de simulação."""
-    if sim_time < 3600:
-        return 45
-    elif sim_time < 7200:
-        return 25
-    else:
-        return 35
+    return TARGET_SCHEDULE.target(sim_time)
 
 def calc_satisfaction(recebido, target):
     """Calcula a satisfação com base no target atual."""
@@ -50,34 +106,64 @@ def calc_satisfaction(recebido, target):
     return round(max(0.0, min(100.0, val)), 2)
 
 def get_window_stats():
-    now = time.time()
-    cutoff = now - WINDOW_SECONDS
-    global message_log
-    # Limpa mensagens antigas
-    message_log = [(t, dev) for (t, dev) in message_log if t >= cutoff]
-    active_nodes = len(set(dev for _, dev in message_log))
-    return len(message_log), active_nodes
+    # Limpa mensagens antigas (O(1) amortizado por mensagem)
+    now = clock.time()
+    if active_nodes is None:
+        # Nada saiu da janela: só leituras de len(), atômicas, sem o lock.
+        # Quem chama sem o lock pode ver um add() pela metade (±1), o que no
+        # status não importa; process_uplink chama com o lock
+        events = window.events
+        try:
+            fresh = events[0][0] >= now - WINDOW_SECONDS
+        except IndexError:
+            fresh = True
+        if fresh:
+            return window.total, window.active
+    with state_lock:
+        if active_nodes is not None:
+            return load.count(WINDOW_SECONDS, now), active_nodes.count(now)
+        window.expire(now)
+        return window.total, window.active
+
+def window_load(total, now):
+    """Carga da janela na métrica de LOAD_METRIC, na escala do target."""
+    if LOAD_METRIC == "messages":
+        return total
+    return channels.load(LOAD_METRIC, now)
+
+def device_signal(dev_eui, total_win, target, now):
+    """(satisfação, overload) enviados ao dispositivo. Sem FAIRNESS_MODE é o
+    sinal global; com ele a contagem do dispositivo é comparada com a sua
+    cota e escalada para a janela toda ("se todos falassem como ele")."""
+    if FAIRNESS_MODE is None:
+        return calc_satisfaction(total_win, target), total_win > target
+    quota = window.quota(target, FAIRNESS_MODE, now)
+    is_overload = window.overload(dev_eui, target, FAIRNESS_MODE, now)
+    return calc_satisfaction(window.count(dev_eui) * target / quota, target), is_overload
 
 def unpack_node_data(b64_data):
-    """Desempacota os 7 bytes enviados pelo nodo."""
+    """Desempacota os 7 bytes enviados pelo nodo (base64, como no JSON do ChirpStack)."""
     try:
         if not b64_data: return None
-        raw = base64.b64decode(b64_data)
-        if len(raw) != 7: return None
-        # Formato: node_id(B), state(B), last_sat(B), p_rew(B), action(B), period(H)
-        data = struct.unpack('<BBBBBH', raw)
-        return {
-            "node_id": data[0],
-            "state": data[1],
-            "last_sat": data[2],        # O que o nodo viu antes
-            "p_rew": data[3]/100.0,     # Probabilidade usada
-            "action": "REWARD" if data[4]==1 else "PUNISH",
-            "period": data[5]
-        }
+        return unpack_node_bytes(base64.b64decode(b64_data))
     except: return None
 
-def log_data(dev_eui, f_cnt, node_data, msgs_win, target, sat, status_flag, active):
-    sim_time = round(time.time() - START_TIME, 2)
+def unpack_node_bytes(raw):
+    """Desempacota os 7 bytes enviados pelo nodo (FRMPayload já decifrado)."""
+    if len(raw) != GAME_THEORY.size: return None
+    # Formato: node_id(B), state(B), last_sat(B), p_rew(B), action(B), period(H)
+    node_id, state, last_sat, p_rew, action, period = GAME_THEORY.decode(raw)
+    return {
+        "node_id": node_id,
+        "state": state,
+        "last_sat": last_sat,       # O que o nodo viu antes
+        "p_rew": p_rew/100.0,       # Probabilidade usada
+        "action": "REWARD" if action==1 else "PUNISH",
+        "period": period
+    }
+
+def log_data(dev_eui, f_cnt, node_data, msgs_win, target, sat, status_flag, active, quiet=False):
+    sim_time = round(clock.time() - START_TIME, 2)
     
     # Valores padrão caso venha vazio
     n_data = node_data if node_data else {
@@ -95,14 +181,23 @@ def log_data(dev_eui, f_cnt, node_data, msgs_win, target, sat, status_flag, acti
             active
         ])
     
-    # Log no terminal simplificado
+    # Log no terminal simplificado: só a amostra do console, e nada
+    # quando a fila está cheia (o resumo por intervalo conta todas)
+    sampled = console.event("uplink")
+    if quiet or not sampled: return
     flag_str = 'OVER' if status_flag else 'UNDER'
     print(f"💾 T={int(sim_time)}s | Win={msgs_win}/{target} | Sat={sat:.0f}% | {flag_str} | Node={n_data['node_id']} St={n_data['state']}")
 
-def send_downlink(client, dev_eui, satisfaction, is_overload):
+def downlink_payload(satisfaction, is_overload, period=None):
     # Byte 0 = Satisfação, Byte 1 = Flag de Overload (0 ou 1)
+    # Bytes 2-3 = Período recomendado pelo controlador (s), só no v3
     flag_byte = 1 if is_overload else 0
-    payload_bytes = bytes([int(satisfaction), flag_byte])
+    if period is None:
+        return SATISFACTION_V2.encode(int(satisfaction), flag_byte)
+    return SATISFACTION.encode(int(satisfaction), flag_byte, period)
+
+def send_downlink(client, dev_eui, satisfaction, is_overload, period=None):
+    payload_bytes = downlink_payload(satisfaction, is_overload, period)
     
     payload = {
         "devEui": dev_eui,
@@ -112,21 +207,50 @@ def send_downlink(client, dev_eui, satisfaction, is_overload):
     }
     topic = f"application/{APPLICATION_ID}/device/{dev_eui}/command/down"
     client.publish(topic, json.dumps(payload))
+    console.event("downlink")
+
+def load_summary(now):
+    """Carga em várias resoluções, todas do mesmo BucketRing."""
+    counts = " | ".join(f"{w // 60} min={load.count(w, now)}" for w in (60, 300, 1800))
+    ewma = "/".join(f"{load.ewma_rate(tau, now) * 60:.1f}" for tau in load.taus)
+    return f"Carga:        {counts} msgs | EWMA 1/5/30 min: {ewma} msg/min"
 
 def periodic_status():
-    sim_time = time.time() - START_TIME
+    # resumo do console pendente: sem tráfego nenhum event() o imprimiria
+    console.flush()
+    sim_time = clock.time() - START_TIME
     target = get_dynamic_target(sim_time)
     
     total, active = get_window_stats()
+    total = window_load(total, clock.time())
     sat = calc_satisfaction(total, target)
     status = "OVERLOAD" if total > target else "UNDERLOAD"
     
     print(f"\n--- TRIAL {TRIAL_ID} ({int(sim_time)}s) ---")
     print(f"Target Atual: {target} msgs")
-    print(f"Janela Real:  {total} msgs ({status})")
+    unit = "msgs" if LOAD_METRIC == "messages" else f"msgs equiv. ({LOAD_METRIC})"
+    print(f"Janela Real:  {total} {unit} ({status})")
     print(f"Satisfação:   {sat:.1f}%")
+    print(load_summary(clock.time()))
+    print(f"Canais:       {channels.summary(clock.time())}")
+    print(f"ADR:          {adr.summary()}")
+    if pipeline is not None:
+        print(f"Fila MQTT:    {pipeline.summary()}")
+    if active_nodes is None:
+        print(f"Jain:         {window.jain():.3f} ({active} nodos, modo {FAIRNESS_MODE or 'global'})")
+    else:
+        print(f"Ativos:       {active} nodos ({ACTIVE_MODE})")
+    if CONTROL_ENABLED and controller.period is not None:
+        print(f"Período rec.: {controller.period} s (taxa {controller.rate(clock.time()) * 60:.1f} msg/min)")
     print("--------------------------------------------------\n")
-    Timer(TICK_INTERVAL, periodic_status).start()
+    clock.timer(TICK_INTERVAL, periodic_status)
+
+def compaction_tick():
+    """Timer próprio, iniciado pelo MQTT e pelo servidor UDP (que não tem
+    periodic_status): sem ele a tabela de eventos cresce sem limite."""
+    if store is not None:
+        store.compact(clock.time() - WINDOW_SECONDS)
+    clock.timer(COMPACT_INTERVAL, compaction_tick)
 
 # === MQTT ===
 def on_connect(client, userdata, flags, rc, properties=None):
@@ -134,61 +258,135 @@ def on_connect(client, userdata, flags, rc, properties=None):
         print(f"✅ Conectado. Iniciando Trial {TRIAL_ID} com Setpoint Dinâmico.")
         client.subscribe(f"application/{APPLICATION_ID}/device/+/event/up")
 
+def process_uplink(dev_eui, f_cnt, node_data, quiet=False, airtime=None):
+    """Conta o uplink na janela, calcula a satisfação e loga.
+    airtime: (canal, µs) do uplink (channel_load), se os metadados de rádio vieram.
+    Retorna (satisfação, overload, período recomendado ou None) para o downlink.
+    Usado pelos workers do MQTT e pelo servidor UDP."""
+    with state_lock:
+        # 1. Obter tempo e Target atual
+        now = clock.time()
+        sim_time = now - START_TIME
+        current_target = get_dynamic_target(sim_time)
+
+        # 2. Atualiza Janela
+        if active_nodes is None:
+            window.add(now, dev_eui)
+        else:
+            active_nodes.add(now, dev_eui)
+        if store is not None:
+            store.append_event(now, dev_eui)
+        load.add(now)
+        channels.add(now, airtime)
+        total_win, active = get_window_stats()
+        total_win = window_load(total_win, now)
+
+        # 3. Calcula Satisfação com o Target Dinâmico e 4. Lógica Direcional
+        # (global ou pela cota do dispositivo, conforme FAIRNESS_MODE)
+        sat, is_overload = device_signal(dev_eui, total_win, current_target, now)
+        period = controller.update(now, current_target, active) if CONTROL_ENABLED else None
+
+    # 5. Log
+    log_data(dev_eui, f_cnt, node_data, total_win, current_target, sat, 1 if is_overload else 0, active, quiet)
+    return sat, is_overload, period
+
 def on_message(client, userdata, msg):
-    global message_log
+    # Só enfileira: decodificar, logar em disco e publicar fica nos workers,
+    # e o thread de rede do paho segue livre para keepalives e leituras
+    if pipeline is None:
+        handle_uplink((client, msg.payload), False)
+    else:
+        pipeline.submit(msg.topic, (client, msg.payload))
+
+def handle_uplink(item, shedding):
+    client, raw = item
     try:
-        data = json.loads(msg.payload.decode())
+        data = json.loads(raw.decode())
         if data.get("fPort") != 2: return
         
         dev_info = data.get("deviceInfo", {})
         dev_eui = dev_info.get("devEui", "unk")
         raw_payload = data.get("data", "")
         
-        # 1. Obter tempo e Target atual
-        now = time.time()
-        sim_time = now - START_TIME
-        current_target = get_dynamic_target(sim_time)
-
-        # 2. Processa Payload do Nodo
+        # Processa Payload do Nodo, atualiza janela e loga
         node_data = unpack_node_data(raw_payload)
-        
-        # 3. Atualiza Janela
-        message_log.append((now, dev_eui))
-        total_win, active = get_window_stats()
-        
-        # 4. Calcula Satisfação com o Target Dinâmico
-        sat = calc_satisfaction(total_win, current_target)
-        
-        # 5. Lógica Direcional
-        is_overload = total_win > current_target
-        
-        # 6. Log e Envio
-        log_data(dev_eui, data.get("fCnt"), node_data, total_win, current_target, sat, 1 if is_overload else 0, active)
-        send_downlink(client, dev_eui, sat, is_overload)
+        adr.add(dev_eui, link_from_chirpstack(data))
+        sat, is_overload, period = process_uplink(dev_eui, data.get("fCnt"), node_data, quiet=shedding,
+                                                  airtime=from_chirpstack(data))
+        send_downlink(client, dev_eui, sat, is_overload, period)
         
     except Exception as e:
         print(f"❌ Erro: {e}")
 
 # === INIT ===
-# Cria cabeçalho apenas se arquivo não existir
-if not os.path.exists(LOG_FILE):
-    with open(LOG_FILE, "w", newline="") as f:
-        csv.writer(f).writerow([
-            "Trial_ID", "Sim_Time", "Dev_EUI", "Node_ID", "F_Cnt", 
-            "Msgs_Window", "Target", "Server_Sat", "Net_Status_Flag",
-            "Node_State", "Node_Action", "Node_Period", 
-            "Node_Last_Sat", "Node_P_Rew", # <--- Colunas Novas
-            "Active_Nodes"
-        ])
+def init_log_file():
+    # Cria cabeçalho apenas se arquivo não existir
+    if not os.path.exists(LOG_FILE):
+        with open(LOG_FILE, "w", newline="") as f:
+            csv.writer(f).writerow([
+                "Trial_ID", "Sim_Time", "Dev_EUI", "Node_ID", "F_Cnt", 
+                "Msgs_Window", "Target", "Server_Sat", "Net_Status_Flag",
+                "Node_State", "Node_Action", "Node_Period", 
+                "Node_Last_Sat", "Node_P_Rew", # <--- Colunas Novas
+                "Active_Nodes"
+            ])
+
+def restore_session():
+    """Retoma o trial interrompido: se ainda há mensagens dentro da janela,
+    recarrega a janela e o START_TIME (o target continua de onde parou)."""
+    global store, TRIAL_ID, START_TIME
+    t0 = time.perf_counter()
+    store = SessionStore(STORE_FILE)
+    now = clock.time()
+    trial = store.get_state("trial")
+    events = store.events_since(now - WINDOW_SECONDS)
+    if trial and events:
+        TRIAL_ID = trial["id"]
+        START_TIME = trial["start"]
+        if active_nodes is None:
+            window.load(events)
+        for t, dev in events:
+            load.add(t)
+            channels.add(t)
+            if active_nodes is not None:
+                active_nodes.add(t, dev)
+        elapsed = (time.perf_counter() - t0) * 1000
+        print(f"♻️ Trial {TRIAL_ID} retomado em T={int(now - START_TIME)}s: "
+              f"{len(events)} msgs da janela restauradas em {elapsed:.1f} ms")
+    else:
+        store.set_state("trial", {"id": TRIAL_ID, "start": START_TIME})
+    store.compact(now - WINDOW_SECONDS)
+    return store
+
+def check_config():
+    """Configuração inválida falha na partida, não no primeiro uplink dentro
+    de um worker. Chamado pelo main() daqui e pelo do udp_server."""
+    if FAIRNESS_MODE not in FAIRNESS_MODES:
+        raise ValueError(f"FAIRNESS_MODE deve ser um de {FAIRNESS_MODES}")
+    if FAIRNESS_MODE is not None and active_nodes is not None:
+        raise ValueError("FAIRNESS_MODE precisa de ACTIVE_MODE = \"window\" (contagem por dispositivo)")
+    if LOAD_METRIC not in LOAD_METRICS:
+        raise ValueError(f"LOAD_METRIC deve ser um de {LOAD_METRICS}")
+
+def main():
+    global pipeline
+    check_config()
+    init_log_file()
+    restore_session()
+    pipeline = Pipeline(handle_uplink, PIPELINE_WORKERS, PIPELINE_QUEUE, PIPELINE_POLICY)
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(MQTT_BROKER, MQTT_PORT, 60)
+    client.loop_start()
+    periodic_status()
+    compaction_tick()
+
+    try:
+        while True: time.sleep(1)
+    except KeyboardInterrupt:
+        client.loop_stop()
+        pipeline.stop()
 
-client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
-client.on_connect = on_connect
-client.on_message = on_message
-client.connect(MQTT_BROKER, MQTT_PORT, 60)
-client.loop_start()
-periodic_status()
-
-try:
-    while True: time.sleep(1)
-except KeyboardInterrupt:
-    client.loop_stop()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,72 @@
+import heapq
+import threading
+import time
+
+# Relógios injetáveis dos servidores: todo horário (janela, alvo, CSV) e
+# todo Timer passam por clock.time() / clock.timer(), então a mesma lógica
+# roda ao vivo, deslocada, acelerada ou num replay tão rápido quanto a CPU.
+
+
+class RealClock:
+    """Horário do sistema e threading.Timer, como antes."""
+
+    def time(self):
+        return time.time()
+
+    def timer(self, delay, fn):
+        t = threading.Timer(delay, fn)
+        t.start()
+        return t
+
+
+class OffsetClock(RealClock):
+    """Horário do sistema deslocado de offset s (ex.: retomar um trial
+    gravado em outro fuso ou testar a virada de uma fase do cronograma)."""
+
+    def __init__(self, offset):
+        self.offset = offset
+
+    def time(self):
+        return time.time() + self.offset
+
+
+class ScaledClock(RealClock):
+    """Tempo que anda scale vezes mais rápido que o relógio de parede a
+    partir de start; os Timers são encurtados na mesma proporção."""
+
+    def __init__(self, scale, start=None):
+        self.scale = scale
+        self.real_start = time.time()
+        self.start = self.real_start if start is None else start
+
+    def time(self):
+        return self.start + (time.time() - self.real_start) * self.scale
+
+    def timer(self, delay, fn):
+        return super().timer(delay / self.scale, fn)
+
+
+class VirtualClock:
+    """Tempo que só anda quando advance_to() é chamado, tipicamente com o
+    horário de cada mensagem de um replay. Os Timers vencidos disparam em
+    ordem, no mesmo thread, com o relógio parado no horário de cada um."""
+
+    def __init__(self, start=0.0):
+        self.now = start
+        self.pending = []
+        self.seq = 0
+
+    def time(self):
+        return self.now
+
+    def timer(self, delay, fn):
+        self.seq += 1
+        heapq.heappush(self.pending, (self.now + delay, self.seq, fn))
+        return None
+
+    def advance_to(self, t):
+        while self.pending and self.pending[0][0] <= t:
+            due, _, fn = heapq.heappop(self.pending)
+            self.now = max(self.now, due)
+            fn()
+        self.now = max(self.now, t)
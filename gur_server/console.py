@@ -0,0 +1,54 @@
+import sys
+import threading
+import time
+
+# === CONFIGURAÇÕES ===
+# Uma linha de resumo a cada SUMMARY_INTERVAL s com os contadores do intervalo
+SUMMARY_INTERVAL = 10.0
+# Linha individual para 1 a cada SAMPLE_EVERY eventos de cada tipo (0 = nenhuma)
+SAMPLE_EVERY = 100
+
+
+class Console:
+    """Saída de terminal com custo constante: conta os eventos, imprime
+    um resumo por intervalo e só uma amostra 1-em-N das linhas individuais.
+    Uso:
+        if console.event("uplink"):
+            print(f"...")   # só formata a linha quando ela vai sair
+    quiet=True deixa só os resumos."""
+
+    def __init__(self, name, interval=SUMMARY_INTERVAL, sample=SAMPLE_EVERY, quiet=False, out=None):
+        self.name = name
+        self.interval = interval
+        self.sample = sample
+        self.quiet = quiet
+        self.out = out
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.seen = {}
+        self.started = time.monotonic()
+
+    def event(self, kind):
+        """Conta um evento; True se a linha individual deve ser impressa."""
+        now = time.monotonic()
+        with self.lock:
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+            seen = self.seen.get(kind, 0)
+            self.seen[kind] = seen + 1
+            due = now - self.started >= self.interval
+        if due:
+            self.flush(now)
+        return not self.quiet and self.sample > 0 and seen % self.sample == 0
+
+    def flush(self, now=None):
+        """Imprime o resumo do intervalo e zera os contadores."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            elapsed = now - self.started
+            counts, self.counts = self.counts, {}
+            self.started = now
+        if not counts:
+            return
+        parts = " | ".join(f"{kind}={n} ({n / max(elapsed, 1e-9):.1f}/s)" for kind, n in sorted(counts.items()))
+        sampled = "silencioso" if self.quiet or not self.sample else f"amostra 1/{self.sample}"
+        print(f"📊 {self.name} {elapsed:.0f}s | {parts} | {sampled}", file=self.out or sys.stdout)
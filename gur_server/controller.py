@@ -0,0 +1,75 @@
+from buckets import BucketRing
+
+# === PARÂMETROS DO CONTROLE ===
+# Janela de contagem do servidor (s), a mesma de WINDOW_SECONDS
+WINDOW_SECONDS = 300
+# Janela curta da estimativa de taxa: bem menos atrasada que a de 5 min
+RATE_WINDOW = 60.0
+# Uma ação de controle a cada CONTROL_INTERVAL, independente do tráfego
+CONTROL_INTERVAL = 10.0
+KP = 0.3
+KI = 0.03
+# Limites do integrador (anti-windup) e do período recomendado (s)
+INTEGRAL_MIN = -0.9
+INTEGRAL_MAX = 3.0
+MIN_PERIOD = 10
+MAX_PERIOD = 3600
+
+
+class RateController:
+    """PI com feedforward sobre a taxa de uplinks.
+    O feedforward dá o período que, com `active` nodos obedecendo, entrega
+    exatamente `target` mensagens por janela; o PI corrige o que sobra
+    (downlinks perdidos, nodos que não obedecem, perda de uplinks).
+    A medida é a taxa dos últimos RATE_WINDOW s, não a contagem de 5 min,
+    que atrasa a resposta e faz o laço oscilar. Ela sai de um BucketRing:
+    o do servidor, se passado em `ring` (e então quem o alimenta é o
+    servidor), ou um próprio, alimentado por observe()."""
+
+    def __init__(self, window=WINDOW_SECONDS, kp=KP, ki=KI, interval=CONTROL_INTERVAL,
+                 rate_window=RATE_WINDOW, min_period=MIN_PERIOD, max_period=MAX_PERIOD, ring=None):
+        self.window = window
+        self.kp = kp
+        self.ki = ki
+        self.interval = interval
+        self.rate_window = rate_window
+        self.min_period = min_period
+        self.max_period = max_period
+        self.ring = ring if ring is not None else BucketRing(span=rate_window, taus=())
+        self.integral = 0.0
+        self.hold_until = None
+        self.target = None
+        self.last_update = None
+        self.period = None
+        self.error = 0.0
+
+    def observe(self, now):
+        """Registra um uplink (O(1))."""
+        self.ring.add(now)
+
+    def rate(self, now):
+        """Uplinks por segundo na janela curta."""
+        return self.ring.rate(self.rate_window, now)
+
+    def update(self, now, target, active):
+        """Período recomendado (s) para cada nodo; recalculado a cada interval."""
+        if self.period is not None and now - self.last_update < self.interval:
+            return self.period
+        target = max(target, 1)
+        active = max(active, 1)
+        if target != self.target:
+            # Os nodos só ouvem o novo período no próximo uplink: até lá o erro
+            # é atraso de transporte, e integrá-lo dá undershoot. O laço abre
+            # por uma janela curta mais um período antigo; age só o feedforward.
+            self.hold_until = now + self.rate_window + (self.period or 0)
+            self.target = target
+            self.error = 0.0
+        self.last_update = now
+        if now >= self.hold_until:
+            measured = self.rate(now) * self.window
+            self.error = (target - measured) / target
+            self.integral = min(max(self.integral + self.ki * self.error, INTEGRAL_MIN), INTEGRAL_MAX)
+        gain = max(0.1, 1.0 + self.kp * self.error + self.integral)
+        period = active * self.window / (target * gain)
+        self.period = int(min(max(period, self.min_period), self.max_period))
+        return self.period
@@ -0,0 +1,130 @@
+from collections import OrderedDict, deque
+
+# === CONFIGURAÇÕES ===
+# Tempo esperando cópias do mesmo frame em outros gateways (s)
+COLLECT_WINDOW = 0.2
+# Quanto tempo uma chave já emitida ainda descarta cópias atrasadas (s)
+RETENTION = 10.0
+# Limite duro de chaves em memória, caso chegue uma rajada
+MAX_KEYS = 65536
+# Amostras guardadas para os percentis de latência
+LATENCY_SAMPLES = 1024
+
+
+def frame_key(phy):
+    """(DevAddr, FCnt, MIC) do PHYPayload em um único bytes, barato de hashear."""
+    return phy[1:5] + phy[6:8] + phy[-4:]
+
+
+class Uplink:
+    """Um frame validado com os metadados (rxpk) de todos os gateways que o ouviram."""
+    def __init__(self, key, phy, arrival):
+        self.key = key
+        self.phy = phy
+        self.arrival = arrival
+        self.emitted = None
+        self.session = None
+        self.fport = None
+        self.f_cnt = None
+        self.payload = b""
+        # MAC commands do nodo (FOpts), em claro
+        self.fopts = b""
+        self.copies = {}
+
+    def add(self, gateway, rxpk):
+        # o mesmo gateway pode repassar o frame mais de uma vez: fica a de melhor SNR
+        current = self.copies.get(gateway)
+        if current is None or rxpk.get("lsnr", -99.0) > current.get("lsnr", -99.0):
+            self.copies[gateway] = rxpk
+
+    def ranked(self):
+        """Gateways do melhor para o pior SNR (RSSI desempata)."""
+        return sorted(self.copies.items(),
+                      key=lambda c: (c[1].get("lsnr", -99.0), c[1].get("rssi", -999)),
+                      reverse=True)
+
+    def best(self):
+        return self.ranked()[0]
+
+
+class Deduplicator:
+    """Junta as cópias de um frame durante COLLECT_WINDOW e entrega um único
+    Uplink para on_event. Chaves emitidas ficam RETENTION segundos para
+    descartar cópias atrasadas e são despejadas por ordem de tempo."""
+
+    def __init__(self, loop, on_event, window=COLLECT_WINDOW, retention=RETENTION,
+                 max_keys=MAX_KEYS):
+        self.loop = loop
+        self.on_event = on_event
+        self.window = window
+        self.retention = retention
+        self.max_keys = max_keys
+        # em coleta: chave -> Uplink
+        self.pending = {}
+        # já emitidos: chave -> instante de expiração, em ordem de emissão
+        self.recent = OrderedDict()
+        # atraso entre a primeira e a última cópia, e entre a primeira cópia e a emissão
+        self.spread = deque(maxlen=LATENCY_SAMPLES)
+        self.hold = deque(maxlen=LATENCY_SAMPLES)
+        self.stats = {"events": 0, "copies": 0, "merged": 0, "late": 0, "evicted": 0}
+
+    def merge(self, key, gateway, rxpk):
+        """Tenta juntar a cópia a um frame já visto. True se era duplicata."""
+        uplink = self.pending.get(key)
+        if uplink is not None:
+            uplink.add(gateway, rxpk)
+            self.spread.append(self.loop.time() - uplink.arrival)
+            self.stats["copies"] += 1
+            self.stats["merged"] += 1
+            return True
+        if key in self.recent:
+            self.stats["copies"] += 1
+            self.stats["late"] += 1
+            return True
+        return False
+
+    def open(self, key, phy, gateway, rxpk):
+        """Primeira cópia válida (MIC ok) de um frame: abre a janela de coleta."""
+        now = self.loop.time()
+        self._evict(now)
+        uplink = Uplink(key, phy, now)
+        uplink.add(gateway, rxpk)
+        self.pending[key] = uplink
+        self.stats["copies"] += 1
+        self.loop.call_later(self.window, self._close, key)
+        return uplink
+
+    def _close(self, key):
+        uplink = self.pending.pop(key)
+        now = self.loop.time()
+        uplink.emitted = now
+        self.recent[key] = now + self.retention
+        self.hold.append(now - uplink.arrival)
+        self.stats["events"] += 1
+        self.on_event(uplink)
+
+    def _evict(self, now):
+        recent = self.recent
+        while recent:
+            key, expires = next(iter(recent.items()))
+            if expires > now and len(recent) < self.max_keys:
+                break
+            recent.popitem(last=False)
+            self.stats["evicted"] += 1
+
+    def latency(self):
+        """Percentis (ms) do espalhamento entre cópias e da espera até a emissão."""
+        return {"spread": _percentiles(self.spread), "hold": _percentiles(self.hold)}
+
+
+def _percentiles(samples):
+    if not samples:
+        return {"n": 0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+    ordered = sorted(samples)
+    n = len(ordered)
+    return {
+        "n": n,
+        "p50": round(ordered[n // 2] * 1000, 1),
+        "p95": round(ordered[min(n - 1, n * 95 // 100)] * 1000, 1),
+        "max": round(ordered[-1] * 1000, 1),
+    }
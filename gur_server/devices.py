@@ -0,0 +1,9 @@
+# === SESSÕES ABP ===
+# DevAddr (hex, MSB primeiro) -> chaves de sessão, as mesmas de end-node/config.py.
+# Compartilhado pelo servidor UDP e pelas ferramentas offline.
+DEVICES = {
+    "00220301": {
+        "nwkskey": "566B54ED5305062D86B4FB51D69ADC84",
+        "appskey": "8A6BBDD1734553FCC6DD9742268485CC",
+    },
+}
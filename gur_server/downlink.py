@@ -0,0 +1,172 @@
+import base64
+import json
+import random
+
+from lorawan_crypto import DOWNLINK, MTYPE_UNCONFIRMED_DOWN
+# Importado pelo udp_server, que já colocou end-node/ no sys.path
+from ttn.regions import get_region
+
+# === TEMPORIZAÇÃO CLASS A ===
+# Janelas contadas a partir do fim do uplink, que é o tmst do rxpk (us)
+RECEIVE_DELAY1 = 1000000
+RECEIVE_DELAY2 = 2000000
+TMST_MASK = 0xFFFFFFFF
+# jitqueue.c recusa (TOO_LATE) o que chega depois de tmst - TX_JIT_DELAY - TX_START_DELAY
+JIT_LEAD = 0.0315
+# Folga para a ida do PULL_RESP até o gateway
+NETWORK_MARGIN = 0.05
+# TX_ACK perdido (forwarder antigo ou UDP descartado)
+ACK_TIMEOUT = 3.0
+
+# === RÁDIO ===
+TX_POWER = 14
+RF_CHAIN = 0
+
+# === PROTOCOLO SEMTECH ===
+PROTOCOL_VERSION = 2
+PULL_RESP = 0x03
+# Erros de TX_ACK que ainda dá para salvar mandando em RX2
+RETRY_ERRORS = ("TOO_LATE", "COLLISION_PACKET")
+
+
+class Downlink:
+    def __init__(self, session, uplink, frame):
+        self.session = session
+        self.uplink = uplink
+        self.frame = frame
+        self.gateway = None
+        self.rxpk = None
+        self.window = 0
+
+
+def build_frame(session, fport, payload, fopts=b""):
+    """PHYPayload unconfirmed down com o próximo FCntDown da sessão.
+    fopts: MAC commands em claro no FHDR (LoRaWAN 1.0.x, até 15 bytes)."""
+    aes = session.downlink_aes
+    f_cnt = session.fcnt_down
+    session.fcnt_down += 1
+    n = len(payload)
+    k = len(fopts)
+    if k > 15:
+        raise ValueError("FOpts passa de 15 bytes")
+    start = 9 + k
+    frame = bytearray(start + n + 4)
+    frame[0] = MTYPE_UNCONFIRMED_DOWN
+    frame[1:5] = session.key
+    frame[5] = k
+    frame[6] = f_cnt & 0xFF
+    frame[7] = (f_cnt >> 8) & 0xFF
+    frame[8:8 + k] = fopts
+    frame[8 + k] = fport
+    data = bytearray(payload)
+    aes.encrypt_payload(data, DOWNLINK, f_cnt)
+    frame[start:start + n] = data
+    frame[start + n:] = aes.calculate_mic(frame, start + n, bytearray(4), DOWNLINK, f_cnt)
+    return bytes(frame)
+
+
+class DownlinkScheduler:
+    """Agenda downlinks Class A via PULL_RESP no gateway de melhor SNR.
+    RX1 quando ainda dá tempo de entrar na jitqueue, senão RX2; TOO_LATE e
+    COLLISION_PACKET em RX1 são reenviados em RX2."""
+
+    def __init__(self, server, region="AU"):
+        self.server = server
+        self.region = get_region(region)
+        self._channels = {f: ch for ch, f in enumerate(self.region.uplink_hz)}
+        self._token = random.getrandbits(16)
+        self.pending = {}
+        self.stats = {"scheduled": 0, "rx1": 0, "rx2": 0, "acked": 0, "retried": 0,
+                      "missed": 0, "no_gateway": 0, "no_ack": 0}
+        self.errors = {}
+
+    def schedule(self, session, uplink, fport, payload, fopts=b""):
+        """Responde a um Uplink já deduplicado (dedup.py), com todas as cópias."""
+        self.send(session, uplink, build_frame(session, fport, payload, fopts))
+
+    def send(self, session, uplink, frame):
+        """Como schedule(), com o frame já montado (build_frame) fora do loop."""
+        self.stats["scheduled"] += 1
+        self._dispatch(Downlink(session, uplink, frame))
+
+    def _dispatch(self, downlink):
+        for gateway, rxpk in downlink.uplink.ranked():
+            if gateway in self.server.gateways:
+                downlink.gateway = gateway
+                downlink.rxpk = rxpk
+                break
+        else:
+            self.stats["no_gateway"] += 1
+            return
+        elapsed = self.server.loop.time() - downlink.uplink.arrival + NETWORK_MARGIN + JIT_LEAD
+        if elapsed < RECEIVE_DELAY1 / 1000000:
+            self._send(downlink, 1)
+        elif elapsed < RECEIVE_DELAY2 / 1000000:
+            self._send(downlink, 2)
+        else:
+            self.stats["missed"] += 1
+
+    def _txpk(self, downlink, window):
+        rxpk = downlink.rxpk
+        region = self.region
+        channel = self._channels.get(int(round(rxpk.get("freq", 0.0) * 1000000)))
+        if window == 1 and channel is not None:
+            tmst = rxpk["tmst"] + RECEIVE_DELAY1
+            frequency = region.rx1_hz[channel]
+            datarate = region.rx1_data_rate(rxpk["datr"])
+        else:
+            tmst = rxpk["tmst"] + RECEIVE_DELAY2
+            frequency = region.rx2_hz
+            datarate = region.data_rates[region.rx2_data_rate]
+        return {
+            "imme": False,
+            "tmst": tmst & TMST_MASK,
+            "freq": frequency / 1000000,
+            "rfch": RF_CHAIN,
+            "powe": TX_POWER,
+            "modu": "LORA",
+            "datr": datarate,
+            "codr": rxpk.get("codr", "4/5"),
+            "ipol": True,
+            "size": len(downlink.frame),
+            "data": base64.b64encode(downlink.frame).decode(),
+            "ncrc": True,
+        }
+
+    def _send(self, downlink, window):
+        downlink.window = window
+        self._token = (self._token + 1) & 0xFFFF
+        token = self._token
+        body = json.dumps({"txpk": self._txpk(downlink, window)}, separators=(",", ":"))
+        datagram = bytes((PROTOCOL_VERSION, token >> 8, token & 0xFF, PULL_RESP)) + body.encode()
+        self.server.transport.sendto(datagram, self.server.gateways[downlink.gateway])
+        self.pending[token] = downlink
+        self.server.loop.call_later(ACK_TIMEOUT, self._expire, token)
+        self.stats["rx1" if window == 1 else "rx2"] += 1
+
+    def _expire(self, token):
+        if self.pending.pop(token, None) is not None:
+            self.stats["no_ack"] += 1
+
+    def handle_tx_ack(self, token, body):
+        """TX_ACK: sem JSON (ou error NONE) é sucesso; erros viram métrica."""
+        downlink = self.pending.pop(token, None)
+        if downlink is None:
+            return
+        error = "NONE"
+        body = body.rstrip(b"\x00")
+        if body:
+            try:
+                error = json.loads(body).get("txpk_ack", {}).get("error", "NONE")
+            except ValueError:
+                error = "UNKNOWN"
+        if error == "NONE":
+            self.stats["acked"] += 1
+            return
+        self.errors[error] = self.errors.get(error, 0) + 1
+        elapsed = self.server.loop.time() - downlink.uplink.arrival + NETWORK_MARGIN + JIT_LEAD
+        if downlink.window == 1 and error in RETRY_ERRORS and elapsed < RECEIVE_DELAY2 / 1000000:
+            self.stats["retried"] += 1
+            self._send(downlink, 2)
+        else:
+            self.stats["missed"] += 1
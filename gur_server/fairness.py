@@ -0,0 +1,110 @@
+from collections import deque
+
+# === CONFIGURAÇÕES ===
+WINDOW_SECONDS = 300
+# Modos de sinal por dispositivo: None manda o sinal global para todos
+#   share: cota igual target/ativos; overload se a rede está em overload ou
+#          se o dispositivo passou da cota (os que falam muito recuam antes)
+#   maxmin: com a rede em overload a cota é a max-min (water-filling): quem
+#           pede menos que a divisão igual fica com o que pede e só quem
+#           passa do nível recua; em underload a cota é a divisão igual
+FAIRNESS_MODES = (None, "share", "maxmin")
+# O nível max-min ordena as contagens; recalculado no máximo a cada LEVEL_INTERVAL s
+# para o mesmo target (um target novo recalcula na hora)
+LEVEL_INTERVAL = 10.0
+
+
+class WindowCounter:
+    """Janela deslizante de uplinks com contagem por dispositivo.
+    add() e expire() são O(1) amortizados: cada evento entra e sai da deque
+    uma vez, e as contagens e a soma dos quadrados (para o índice de Jain)
+    são atualizadas incrementalmente."""
+
+    def __init__(self, window=WINDOW_SECONDS):
+        self.window = window
+        self.events = deque()
+        self.counts = {}
+        self.sum_sq = 0
+        self._level = None
+        self._level_at = None
+        self._level_target = None
+
+    def add(self, t, dev):
+        self.events.append((t, dev))
+        c = self.counts.get(dev, 0)
+        self.counts[dev] = c + 1
+        self.sum_sq += 2 * c + 1
+
+    def expire(self, now):
+        cutoff = now - self.window
+        events, counts = self.events, self.counts
+        while events and events[0][0] < cutoff:
+            _, dev = events.popleft()
+            c = counts[dev]
+            self.sum_sq -= 2 * c - 1
+            if c == 1:
+                del counts[dev]
+            else:
+                counts[dev] = c - 1
+
+    def load(self, events):
+        """Recarrega a janela a partir de [(t, dev)] em ordem (restauração)."""
+        self.__init__(self.window)
+        for t, dev in events:
+            self.add(t, dev)
+
+    @property
+    def total(self):
+        return len(self.events)
+
+    @property
+    def active(self):
+        return len(self.counts)
+
+    def count(self, dev):
+        return self.counts.get(dev, 0)
+
+    def jain(self):
+        """Índice de Jain das contagens: 1 = todos iguais, 1/n = um só fala."""
+        if not self.sum_sq:
+            return 1.0
+        return self.total ** 2 / (self.active * self.sum_sq)
+
+    def maxmin_level(self, target, now):
+        """Cota max-min por dispositivo para `target` mensagens na janela.
+        Se a soma das contagens cabe no alvo ninguém é limitado (inf)."""
+        if self._level is not None and target == self._level_target and now - self._level_at < LEVEL_INTERVAL:
+            return self._level
+        remaining = target
+        level = float("inf")
+        counts = sorted(self.counts.values())
+        n = len(counts)
+        for i, c in enumerate(counts):
+            share = remaining / (n - i)
+            if c > share:
+                level = share
+                break
+            remaining -= c
+        self._level = level
+        self._level_at = now
+        self._level_target = target
+        return level
+
+    def quota(self, target, mode, now):
+        """Cota de cada dispositivo na janela, None sem modo de justiça."""
+        if mode not in FAIRNESS_MODES:
+            raise ValueError(f"Modo de justiça desconhecido: {mode}")
+        if mode is None:
+            return None
+        if mode == "maxmin" and self.total > target:
+            return self.maxmin_level(target, now)
+        return target / max(self.active, 1)
+
+    def overload(self, dev, target, mode, now):
+        """Flag de overload enviada ao dispositivo no modo dado."""
+        quota = self.quota(target, mode, now)
+        if quota is None:
+            return self.total > target
+        if mode == "share" and self.total > target:
+            return True
+        return self.count(dev) > quota
@@ -0,0 +1,157 @@
+from array import array
+from itertools import chain
+
+# === CONFIGURAÇÕES ===
+# Contadores do objeto "stat" do PUSH_DATA (por intervalo, somam ao agregar)
+COUNTERS = ("rxnb", "rxok", "rxfw", "dwnb", "txnb")
+# ackr é porcentagem de PUSH_DATA confirmados: média ao agregar
+FIELDS = COUNTERS + ("ackr",)
+# lora_pkt_fwd manda stat a cada 30 s (DEFAULT_STAT): 1440 amostras = 12 h
+RAW_CAPACITY = 1440
+# Histórico longo, já reduzido para baldes de 10 min: 1008 = 7 dias
+COARSE_STEP = 600
+COARSE_CAPACITY = 1008
+
+
+class Ring:
+    """Série temporal de tamanho fixo: um array por campo, sobrescreve a mais antiga."""
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = array("d", bytes(8 * capacity))
+        self.values = {f: array("d", bytes(8 * capacity)) for f in FIELDS}
+        self.count = 0
+        self.head = 0
+
+    def append(self, t, sample):
+        i = self.head
+        self.times[i] = t
+        for f in FIELDS:
+            self.values[f][i] = sample[f]
+        self.head = (i + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def indexes(self, start=None, end=None):
+        """Índices em ordem cronológica dentro de [start, end)."""
+        first = (self.head - self.count) % self.capacity
+        for k in range(self.count):
+            i = (first + k) % self.capacity
+            t = self.times[i]
+            if start is not None and t < start:
+                continue
+            if end is not None and t >= end:
+                break
+            yield i
+
+    def oldest(self):
+        if not self.count:
+            return None
+        return self.times[(self.head - self.count) % self.capacity]
+
+
+def _aggregate(samples, step):
+    """Agrupa (ring, índice) em baldes de step segundos: contadores somados, ackr em média."""
+    rows = []
+    bucket = None
+    for ring, i in samples:
+        t = ring.times[i] - ring.times[i] % step if step else ring.times[i]
+        if bucket is None or bucket["time"] != t:
+            if bucket is not None:
+                rows.append(_finish(bucket))
+            bucket = {"time": t, "samples": 0}
+            for f in FIELDS:
+                bucket[f] = 0.0
+        bucket["samples"] += 1
+        for f in FIELDS:
+            bucket[f] += ring.values[f][i]
+    if bucket is not None:
+        rows.append(_finish(bucket))
+    return rows
+
+
+def _finish(bucket):
+    bucket["ackr"] = round(bucket["ackr"] / bucket["samples"], 1)
+    for f in COUNTERS:
+        bucket[f] = int(bucket[f])
+    # fração de pacotes com CRC ruim: rádio saturado / colisões
+    bucket["rx_bad"] = round(1 - bucket["rxok"] / bucket["rxnb"], 3) if bucket["rxnb"] else 0.0
+    return bucket
+
+
+class GatewayStats:
+    """Séries por gateway EUI (ex. B827EBFFFE295E58) dos stat do lora_pkt_fwd:
+    amostras cruas por RAW_CAPACITY intervalos e baldes de COARSE_STEP por mais tempo."""
+
+    def __init__(self, raw_capacity=RAW_CAPACITY, coarse_step=COARSE_STEP,
+                 coarse_capacity=COARSE_CAPACITY):
+        self.raw_capacity = raw_capacity
+        self.coarse_step = coarse_step
+        self.coarse_capacity = coarse_capacity
+        self.raw = {}
+        self.coarse = {}
+        # balde grosso ainda aberto de cada gateway
+        self._open = {}
+
+    def record(self, gateway, stat, now):
+        """Guarda um objeto stat (dict do JSON) recebido em now (time.time())."""
+        try:
+            sample = {f: float(stat.get(f, 0)) for f in FIELDS}
+        except (TypeError, ValueError):
+            return False
+        if gateway not in self.raw:
+            self.raw[gateway] = Ring(self.raw_capacity)
+            self.coarse[gateway] = Ring(self.coarse_capacity)
+        self.raw[gateway].append(now, sample)
+        self._downsample(gateway, now, sample)
+        return True
+
+    def _downsample(self, gateway, now, sample):
+        start = now - now % self.coarse_step
+        bucket = self._open.get(gateway)
+        if bucket is not None and bucket["time"] != start:
+            # fecha o balde anterior; ackr guardado já como média
+            bucket["ackr"] /= bucket["samples"]
+            self.coarse[gateway].append(bucket["time"], bucket)
+            bucket = None
+        if bucket is None:
+            bucket = {"time": start, "samples": 0}
+            for f in FIELDS:
+                bucket[f] = 0.0
+            self._open[gateway] = bucket
+        bucket["samples"] += 1
+        for f in FIELDS:
+            bucket[f] += sample[f]
+
+    def gateways(self):
+        return sorted(self.raw)
+
+    def query(self, gateway, start=None, end=None, step=None):
+        """Linhas {time, rxnb, ..., ackr, rx_bad, samples} de [start, end),
+        agregadas em baldes de step segundos (None = amostras cruas). Usa as
+        amostras cruas quando cobrem o intervalo, senão o histórico reduzido."""
+        raw = self.raw.get(gateway)
+        if raw is None:
+            return []
+        oldest = raw.oldest()
+        if start is None or start >= oldest or raw.count < raw.capacity:
+            return _aggregate(((raw, i) for i in raw.indexes(start, end)), step)
+        step = max(step or 0, self.coarse_step)
+        coarse = self.coarse[gateway]
+        older = list(coarse.indexes(start, min(oldest, end or oldest)))
+        # O balde grosso que contém a amostra crua mais antiga já soma as
+        # cruas até o fim dele: elas só entram a partir de onde o histórico acaba
+        cut = coarse.times[older[-1]] + self.coarse_step if older else oldest
+        recent = raw.indexes(max(start, cut), end)
+        return _aggregate(chain(((coarse, i) for i in older), ((raw, i) for i in recent)), step)
+
+    def at(self, gateway, t):
+        """Última amostra crua até t: para cruzar com uma linha do log do trial."""
+        raw = self.raw.get(gateway)
+        if raw is None:
+            return None
+        found = None
+        for i in raw.indexes(None, t):
+            found = i
+        if found is None:
+            return None
+        return _aggregate(((raw, found),), None)[0]
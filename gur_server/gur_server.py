@@ -4,9 +4,20 @@ import time
 import math
 import base64
 import csv
-from threading import Timer
+import os
+import sys
 from datetime import datetime
 
+# Formatos dos payloads compartilhados com o nodo (end-node/codec.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "end-node"))
+from codec import SATISFACTION_V1
+from session_store import SessionStore
+from target_schedule import load_schedule
+from pipeline import Pipeline
+from console import Console
+from buckets import BucketRing
+from clock import RealClock
+
 APP_ID = "pfc-game-theory"
 TTN_REGION = "au1"
 MQTT_BROKER = f"{TTN_REGION}.cloud.thethings.network"
@@ -14,57 +25,76 @@ API_KEY = "NNSXS.S3YLGCMJFMONQOHBRJ665U4ZSJNSJN7KOKS2VAA.HROWPD2TPDVW4IEY2FI2E4V
 
 WINDOW_SECONDS = 1800  # 15 min
 LOG_FILE = "gur_log.csv"
+STORE_FILE = "gur_sessao.db"  # janela em andamento, para retomar após crash
+# fila entre o thread do paho e o processamento; um worker mantém a ordem
+PIPELINE_QUEUE = 1024
+PIPELINE_POLICY = "shed"
+# terminal: resumo a cada CONSOLE_INTERVAL s e 1 linha a cada CONSOLE_SAMPLE mensagens
+CONSOLE_INTERVAL = 10
+CONSOLE_SAMPLE = 100
+CONSOLE_QUIET = False
 
 # === capacidade física (2 nós, 6/min cada) ===
 MAX_RATE_PER_MIN = 12
 WINDOW_CAPACITY = MAX_RATE_PER_MIN * (WINDOW_SECONDS // 60)  # = 180
 
 # === cronograma de alvos (em segundos desde o início do experimento) ===
-TARGET_SCHEDULE = [
-    (0,   40),   # fase 1: fácil
-    (1800, 60),   # fase 2: médio
-    (2400, 90),  # fase 3: agressivo
-    (3000, 40)   # fase 4: relaxa
-]
+# fase 1: fácil (40) | fase 2: médio (60) | fase 3: agressivo (90) | fase 4: relaxa (40)
+TARGET_SCHEDULE = load_schedule("gur.json")
+
+# relógio de horários e Timers (clock.py); o replay troca por um VirtualClock
+clock = RealClock()
 
 nodes = {}
-window_start = time.time()
-experiment_start = time.time()
-TARGET_MESSAGES = TARGET_SCHEDULE[0][1]  # inicial
+store = None
+pipeline = None
+# carga deslizante de 1/5/30 min ao lado da janela fixa de 30 min
+load = BucketRing()
+console = Console("gur", CONSOLE_INTERVAL, CONSOLE_SAMPLE, CONSOLE_QUIET)
+window_start = clock.time()
+experiment_start = clock.time()
+TARGET_MESSAGES = TARGET_SCHEDULE.target(0)  # inicial
 
 def calc_satisfaction(recebido, n):
     """Grau de satisfação (0–100), com saturação."""
     val = 20 + 80 * math.exp(-0.002 * (recebido - n)**2)
     return round(max(0.0, min(100.0, val)), 2)
 
-def log_event(device_id, total, satisfaction):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+def log_event(device_id, total, satisfaction, quiet=False):
+    timestamp = datetime.fromtimestamp(clock.time()).strftime("%Y-%m-%d %H:%M:%S")
     with open(LOG_FILE, mode="a", newline="") as f:
         csv.writer(f).writerow([timestamp, device_id, total, satisfaction])
-    print(f"📝 Log salvo: {timestamp} | {device_id} | total={total} | sat={satisfaction}")
+    if console.event("log") and not quiet:
+        print(f"📝 Log salvo: {timestamp} | {device_id} | total={total} | sat={satisfaction}")
 
-def send_downlink(client, device_id, satisfaction):
+def send_downlink(client, device_id, satisfaction, quiet=False):
     payload = {
         "downlinks": [{
             "f_port": 2,
-            "frm_payload": base64.b64encode(bytes([int(satisfaction)])).decode(),
+            "frm_payload": base64.b64encode(SATISFACTION_V1.encode(int(satisfaction))).decode(),
             "confirmed": False
         }]
     }
     topic = f"v3/{APP_ID}@ttn/devices/{device_id}/down/push"
     client.publish(topic, json.dumps(payload))
-    print(f"[↓] Downlink enviado para {device_id}: satisfação={satisfaction}")
+    if console.event("downlink") and not quiet:
+        print(f"[↓] Downlink enviado para {device_id}: satisfação={satisfaction}")
 
 def reset_window():
     global nodes, window_start
     nodes = {}
-    window_start = time.time()
+    window_start = clock.time()
+    if store is not None:
+        store.clear_devices()
+        store.set_state("window", {"start": window_start})
     print(f"\n🕒 Nova janela iniciada às {time.strftime('%H:%M:%S')}\n")
-    Timer(WINDOW_SECONDS, reset_window).start()
+    clock.timer(WINDOW_SECONDS, reset_window)
 
 def status_global_tick():
+    # resumo do console pendente: sem tráfego nenhum event() o imprimiria
+    console.flush()
     total_received = sum(nodes.values())
-    elapsed_min = (time.time() - window_start) / 60.0
+    elapsed_min = (clock.time() - window_start) / 60.0
     sat = calc_satisfaction(total_received, TARGET_MESSAGES)
 
     print(
@@ -73,25 +103,30 @@ def status_global_tick():
         f" | capacidade={WINDOW_CAPACITY}"
         f" | satisfação={sat:.2f}%"
     )
-    Timer(60, status_global_tick).start()  # atualiza a cada 60 s
+    now = clock.time()
+    print(
+        f"📈 CARGA | 1 min={load.count(60, now)} | 5 min={load.count(300, now)}"
+        f" | 30 min deslizante={load.count(WINDOW_SECONDS, now)}"
+        f" | EWMA 30 min={load.ewma_rate(1800, now) * 60:.2f} msg/min"
+    )
+    if pipeline is not None:
+        print(f"📥 FILA | {pipeline.summary()}")
+    clock.timer(60, status_global_tick)  # atualiza a cada 60 s
 
 def update_target_tick():
     global TARGET_MESSAGES
-    elapsed = time.time() - experiment_start
-    # acha o último target cujo tempo <= elapsed
-    new_target = TARGET_MESSAGES
-    for t, v in TARGET_SCHEDULE:
-        if elapsed >= t:
-            new_target = v
-        else:
-            break
+    elapsed = clock.time() - experiment_start
+    new_target = TARGET_SCHEDULE.target(elapsed)
 
     if new_target != TARGET_MESSAGES:
         TARGET_MESSAGES = new_target
         warn = " ⚠️(maior que capacidade!)" if TARGET_MESSAGES > WINDOW_CAPACITY else ""
         print(f"\n🎯 Novo setpoint de janela: TARGET_MESSAGES={TARGET_MESSAGES}{warn}\n")
 
-    Timer(5, update_target_tick).start()  # checa a cada 5 s
+    # acorda só na próxima mudança do cronograma
+    next_change = TARGET_SCHEDULE.next_change(elapsed)
+    if next_change is not None:
+        clock.timer(next_change - elapsed, update_target_tick)
 
 def on_connect(client, userdata, flags, rc, properties=None):
     if rc == 0:
@@ -103,42 +138,84 @@ def on_connect(client, userdata, flags, rc, properties=None):
         print(f"⚠️ Falha na conexão (rc={rc})")
 
 def on_message(client, userdata, msg):
+    # só enfileira: CSV, SQLite e publish ficam no worker, não no thread de rede
+    if pipeline is None:
+        handle_uplink((client, msg.payload), False)
+    else:
+        pipeline.submit(msg.topic, (client, msg.payload))
+
+def handle_uplink(item, shedding):
     global nodes
-    data = json.loads(msg.payload.decode())
+    client, raw = item
+    data = json.loads(raw.decode())
     device_id = data["end_device_ids"]["device_id"]
 
     nodes[device_id] = nodes.get(device_id, 0) + 1
+    load.add(clock.time())
+    if store is not None:
+        store.save_device(device_id, {"uplinks": nodes[device_id]})
     total_received = sum(nodes.values())
     satisfaction = calc_satisfaction(total_received, TARGET_MESSAGES)
 
-    print(f"[↑] Uplink de {device_id} | total={total_received} | alvo={TARGET_MESSAGES} | satisfação={satisfaction}")
-    log_event(device_id, total_received, satisfaction)
-    send_downlink(client, device_id, satisfaction)
-
-# header CSV
-with open(LOG_FILE, mode="a", newline="") as f:
-    if f.tell() == 0:
-        csv.writer(f).writerow(["timestamp", "device_id", "total_received", "satisfaction"])
-
-client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
-client.username_pw_set(APP_ID, API_KEY)
-client.tls_set()
-client.tls_insecure_set(False)
-client.on_connect = on_connect
-client.on_message = on_message
-
-print(f"🔗 Conectando a {MQTT_BROKER} ...")
-client.connect(MQTT_BROKER, 8883, 60)
-client.loop_start()
-
-reset_window()
-status_global_tick()
-update_target_tick()
-
-try:
-    while True:
-        time.sleep(1)
-except KeyboardInterrupt:
-    print("Encerrando servidor...")
-    client.loop_stop()
-    client.disconnect()
+    if console.event("uplink") and not shedding:
+        print(f"[↑] Uplink de {device_id} | total={total_received} | alvo={TARGET_MESSAGES} | satisfação={satisfaction}")
+    log_event(device_id, total_received, satisfaction, shedding)
+    send_downlink(client, device_id, satisfaction, shedding)
+
+def main():
+    global store, window_start, experiment_start, nodes, pipeline
+    # header CSV
+    with open(LOG_FILE, mode="a", newline="") as f:
+        if f.tell() == 0:
+            csv.writer(f).writerow(["timestamp", "device_id", "total_received", "satisfaction"])
+
+    store = SessionStore(STORE_FILE)
+    saved = store.get_state("window")
+    # o experimento continua mesmo que a janela salva já tenha expirado:
+    # o cronograma de alvos não volta à fase 1 depois de um crash.
+    # --novo começa outro experimento
+    new = "--novo" in sys.argv
+    experiment = store.get_state("experiment")
+    if experiment is None and saved and "experiment_start" in saved:
+        experiment = {"start": saved["experiment_start"]}
+    if experiment is not None and not new:
+        experiment_start = experiment["start"]
+        print(f"♻️ Experimento retomado em T={int(clock.time() - experiment_start)}s")
+    store.set_state("experiment", {"start": experiment_start})
+
+    # retoma a janela interrompida, se ainda não terminou
+    if saved and not new and clock.time() - saved["start"] < WINDOW_SECONDS:
+        window_start = saved["start"]
+        nodes = {dev: d["uplinks"] for dev, d in store.load_devices().items()}
+        remaining = WINDOW_SECONDS - (clock.time() - window_start)
+        print(f"♻️ Janela retomada: {sum(nodes.values())} msgs, faltam {remaining / 60:.1f} min")
+        clock.timer(remaining, reset_window)
+    else:
+        reset_window()
+
+    pipeline = Pipeline(handle_uplink, 1, PIPELINE_QUEUE, PIPELINE_POLICY)
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    client.username_pw_set(APP_ID, API_KEY)
+    client.tls_set()
+    client.tls_insecure_set(False)
+    client.on_connect = on_connect
+    client.on_message = on_message
+
+    print(f"🔗 Conectando a {MQTT_BROKER} ...")
+    client.connect(MQTT_BROKER, 8883, 60)
+    client.loop_start()
+
+    status_global_tick()
+    update_target_tick()
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("Encerrando servidor...")
+        client.loop_stop()
+        client.disconnect()
+        pipeline.stop()
+
+if __name__ == "__main__":
+    main()
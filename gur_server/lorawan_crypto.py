@@ -0,0 +1,154 @@
+from cryptography.hazmat.primitives import cmac
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+# === LoRaWAN 1.0 (mesmos valores de end-node/encryption_aes.py) ===
+# Direção, byte 5 dos blocos A_i e B0
+UPLINK = 0
+DOWNLINK = 1
+# Tipos de mensagem no MHDR
+MTYPE_UNCONFIRMED_UP = 0x40
+MTYPE_UNCONFIRMED_DOWN = 0x60
+MTYPE_CONFIRMED_UP = 0x80
+MTYPE_CONFIRMED_DOWN = 0xA0
+# MHDR (1) + FHDR sem FOpts (7) + MIC (4)
+MIN_FRAME_LENGTH = 12
+# FCnt mais que isso à frente do último aceito é rejeitado
+MAX_FCNT_GAP = 16384
+# Motivo da última rejeição de decrypt_payload, em FrameCrypto.rejected
+REJECT_FRAME = "frame"
+REJECT_MIC = "mic"
+REJECT_FCNT = "fcnt"
+
+
+def ecb(key):
+    """AES-ECB de uma chave: encrypt(blocos) -> bytes, uma chamada para N blocos."""
+    return Cipher(algorithms.AES(bytes(key)), modes.ECB()).encryptor().update
+
+
+class FrameCrypto:
+    """Chaves de sessão ABP de um nodo no servidor: MIC (AES-CMAC da NwkSKey)
+    e FRMPayload (AES-CTR dos blocos A_i) com o pacote cryptography, sem os
+    shims do MicroPython de end-node/host. Mesma interface do AES do nodo
+    (decrypt_payload, encrypt_payload, calculate_mic) e os campos do último
+    quadro aceito em mtype, fctrl, fopts/fopts_length e fport. O contexto
+    ECB não é thread-safe: um FrameCrypto por thread que o usa.
+    relax_fcnt: o nodo ABP não guarda o FCnt e volta a contar do 0 a cada
+    boot (end-node/main.py). Um quadro com MIC válido para o FCnt de 16 bits
+    sem a parte alta é aceito como reset do contador, como o skip FCnt check
+    do ChirpStack; sem a opção ele é rejeitado como replay."""
+
+    def __init__(self, device_address, app_key, network_key, relax_fcnt=False):
+        # DevAddr como vai no quadro, LSB primeiro
+        self._address = bytes(device_address)[::-1]
+        self._app = ecb(app_key)
+        self._network = ecb(network_key)
+        self._network_key = algorithms.AES(bytes(network_key))
+        self.relax_fcnt = relax_fcnt
+        # último FCnt aceito em cada direção, None até o primeiro
+        self.frame_counter_up = None
+        self.frame_counter_down = None
+        # None ou REJECT_*, e se o último quadro aceito reiniciou o FCnt
+        self.rejected = None
+        self.fcnt_reset = False
+        self.mtype = 0
+        self.fctrl = 0
+        self.fopts = b""
+        self.fopts_length = 0
+        self.fport = None
+
+    def decrypt_payload(self, packet, packet_length=None, direction=UPLINK):
+        """Valida DevAddr, MIC e FCnt de um PHYPayload e devolve o FRMPayload
+        decifrado (bytes), ou None se o quadro foi rejeitado (motivo em rejected)."""
+        self.rejected = REJECT_FRAME
+        if packet_length is None:
+            packet_length = len(packet)
+        if packet_length < MIN_FRAME_LENGTH:
+            return None
+        mtype = packet[0] & 0xE0
+        if direction == DOWNLINK:
+            if mtype not in (MTYPE_UNCONFIRMED_DOWN, MTYPE_CONFIRMED_DOWN):
+                return None
+        elif mtype not in (MTYPE_UNCONFIRMED_UP, MTYPE_CONFIRMED_UP):
+            return None
+        if packet[1:5] != self._address:
+            return None
+        fctrl = packet[5]
+        fopts_length = fctrl & 0x0F
+        port_index = 8 + fopts_length
+        mic_index = packet_length - 4
+        if port_index > mic_index:
+            return None
+
+        # FCnt de 32 bits a partir dos 16 bits do ar
+        last = self.frame_counter_down if direction == DOWNLINK else self.frame_counter_up
+        received = packet[6] | (packet[7] << 8)
+        frame_counter = received
+        if last is not None:
+            frame_counter |= last & 0xFFFF0000
+            if frame_counter <= last:
+                frame_counter += 0x10000
+
+        # MIC antes da política de FCnt: só um quadro autêntico vira replay ou reset
+        mic = bytes(packet[mic_index:packet_length])
+        reset = False
+        if self._mic(packet, mic_index, direction, frame_counter) != mic:
+            if frame_counter == received or self._mic(packet, mic_index, direction, received) != mic:
+                self.rejected = REJECT_MIC
+                return None
+            # autêntico com o FCnt desde 0: o nodo reiniciou (ou é um replay)
+            frame_counter = received
+            reset = True
+        if reset:
+            valid = self.relax_fcnt
+        else:
+            valid = last is None or frame_counter - last <= MAX_FCNT_GAP
+        if not valid:
+            self.rejected = REJECT_FCNT
+            return None
+
+        self.rejected = None
+        self.fcnt_reset = reset
+        if direction == DOWNLINK:
+            self.frame_counter_down = frame_counter
+        else:
+            self.frame_counter_up = frame_counter
+        self.mtype = mtype
+        self.fctrl = fctrl
+        self.fopts_length = fopts_length
+        self.fopts = bytes(packet[8:port_index])
+        # sem FPort não há FRMPayload
+        if port_index == mic_index:
+            self.fport = None
+            return b""
+        self.fport = packet[port_index]
+        data = bytearray(packet[port_index + 1:mic_index])
+        # FPort 0 leva comandos MAC, cifrados com a NwkSKey
+        self._cipher(data, self._network if self.fport == 0 else self._app, direction, frame_counter)
+        return bytes(data)
+
+    def encrypt_payload(self, data, direction=UPLINK, frame_counter=0):
+        """Cifra o FRMPayload (bytearray) no lugar com a AppSKey."""
+        self._cipher(data, self._app, direction, frame_counter)
+
+    def calculate_mic(self, packet, packet_length, mic, direction=UPLINK, frame_counter=0):
+        """MIC de packet[:packet_length] copiado para mic (4 bytes), que é devolvido."""
+        mic[0:4] = self._mic(packet, packet_length, direction, frame_counter)
+        return mic
+
+    def _cipher(self, data, cipher, direction, frame_counter):
+        """XOR de data com o keystream dos blocos A_i, todos numa chamada ECB."""
+        n = len(data)
+        if not n:
+            return
+        a = (b"\x01\x00\x00\x00\x00" + bytes((direction,)) + self._address +
+             frame_counter.to_bytes(4, "little") + b"\x00")
+        stream = cipher(b"".join(a + bytes((i,)) for i in range(1, (n + 15) // 16 + 1)))
+        data[:] = (int.from_bytes(data, "big") ^ int.from_bytes(stream[:n], "big")).to_bytes(n, "big")
+
+    def _mic(self, packet, length, direction, frame_counter):
+        """4 primeiros bytes da AES-CMAC(NwkSKey, B0 | packet[:length])."""
+        b0 = (b"\x49\x00\x00\x00\x00" + bytes((direction,)) + self._address +
+              frame_counter.to_bytes(4, "little") + b"\x00" + bytes((length,)))
+        mac = cmac.CMAC(self._network_key)
+        mac.update(b0 + bytes(packet[:length]))
+        return mac.finalize()[:4]
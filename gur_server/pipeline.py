@@ -0,0 +1,107 @@
+import queue
+import threading
+import time
+import zlib
+
+# === CONFIGURAÇÕES ===
+QUEUE_SIZE = 1024
+WORKERS = 1
+# Políticas quando a fila do worker enche:
+#   drop_oldest: descarta a mensagem mais antiga da fila e enfileira a nova
+#   block: segura o thread que chamou submit() até abrir espaço (back-pressure)
+#   shed: acima de SHED_LEVEL da fila o handler é avisado para cortar o log
+#         não essencial (terminal); se ainda assim encher, drop_oldest
+POLICIES = ("drop_oldest", "block", "shed")
+SHED_LEVEL = 0.5
+
+
+class Pipeline:
+    """Estágio entre o thread de rede do MQTT e o processamento.
+    submit() só enfileira; os workers chamam handler(item, shedding). Cada
+    chave (tópico do dispositivo) cai sempre no mesmo worker, o que mantém
+    a ordem das mensagens de um dispositivo com mais de um worker."""
+
+    def __init__(self, handler, workers=WORKERS, maxsize=QUEUE_SIZE, policy="drop_oldest", name="pipeline"):
+        if policy not in POLICIES:
+            raise ValueError(f"Política de overload desconhecida: {policy}")
+        self.handler = handler
+        self.policy = policy
+        self.maxsize = maxsize
+        self.queues = [queue.Queue(maxsize) for _ in range(workers)]
+        self.lock = threading.Lock()
+        self.stats = {"submitted": 0, "processed": 0, "dropped": 0, "shed": 0, "errors": 0, "max_depth": 0}
+        self.threads = [threading.Thread(target=self._run, args=(q,), name=f"{name}-{k}", daemon=True)
+                        for k, q in enumerate(self.queues)]
+        for t in self.threads:
+            t.start()
+
+    def _queue(self, key):
+        if len(self.queues) == 1:
+            return self.queues[0]
+        return self.queues[zlib.crc32(key.encode()) % len(self.queues)]
+
+    def submit(self, key, item):
+        """Chamado pelo thread de rede: nunca toca disco."""
+        q = self._queue(key)
+        if self.policy == "block":
+            q.put(item)
+        else:
+            while True:
+                try:
+                    q.put_nowait(item)
+                    break
+                except queue.Full:
+                    try:
+                        q.get_nowait()
+                        q.task_done()
+                        with self.lock:
+                            self.stats["dropped"] += 1
+                    except queue.Empty:
+                        pass
+        depth = q.qsize()
+        # vários produtores: o máximo só muda sob o lock, junto com a contagem
+        with self.lock:
+            self.stats["submitted"] += 1
+            if depth > self.stats["max_depth"]:
+                self.stats["max_depth"] = depth
+
+    def _run(self, q):
+        while True:
+            item = q.get()
+            if item is None:
+                q.task_done()
+                return
+            shedding = self.policy == "shed" and q.qsize() >= SHED_LEVEL * self.maxsize
+            try:
+                self.handler(item, shedding)
+            except Exception as e:
+                with self.lock:
+                    self.stats["errors"] += 1
+                print(f"❌ Erro no worker: {e}")
+            with self.lock:
+                self.stats["processed"] += 1
+                if shedding:
+                    self.stats["shed"] += 1
+            q.task_done()
+
+    def depth(self):
+        return sum(q.qsize() for q in self.queues)
+
+    def join(self):
+        """Espera as filas esvaziarem (testes, encerramento)."""
+        for q in self.queues:
+            q.join()
+
+    def stop(self, timeout=5.0):
+        """Processa o que já está na fila e encerra os workers."""
+        for q in self.queues:
+            q.put(None)
+        deadline = time.time() + timeout
+        for t in self.threads:
+            t.join(max(0.0, deadline - time.time()))
+
+    def summary(self):
+        s = self.stats
+        return (f"fila={self.depth()} (máx {s['max_depth']}/{self.maxsize}) | "
+                f"processadas={s['processed']} | descartadas={s['dropped']} | "
+                f"log cortado={s['shed']} | erros={s['errors']}")
@@ -0,0 +1,208 @@
+import argparse
+import base64
+import csv
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime
+
+from clock import VirtualClock
+from session_store import SessionStore
+
+END_NODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "end-node")
+sys.path.insert(0, END_NODE_DIR)
+from codec import GAME_THEORY
+
+# === CONFIGURAÇÕES ===
+# Traces do CSV só têm Sim_Time: o trial recomeça neste horário virtual
+REPLAY_EPOCH = 1_700_000_000.0
+CHIRP_TOPIC = "application/replay/device/{}/event/up"
+TTN_TOPIC = "v3/replay@ttn/devices/{}/up"
+
+
+class Message:
+    """Mensagem MQTT gravada: o que o paho entregaria ao on_message."""
+
+    def __init__(self, t, topic, payload):
+        self.t = t
+        self.topic = topic
+        self.payload = payload
+
+
+class ReplayClient:
+    """Cliente MQTT do replay: conta os downlinks que seriam publicados."""
+
+    def __init__(self):
+        self.published = 0
+
+    def publish(self, topic, payload):
+        self.published += 1
+
+
+def chirp_payload(dev_eui, f_cnt, data):
+    return json.dumps({"fPort": 2, "fCnt": f_cnt, "deviceInfo": {"devEui": dev_eui}, "data": data}).encode()
+
+
+def ttn_payload(device_id):
+    return json.dumps({"end_device_ids": {"device_id": device_id}}).encode()
+
+
+def from_experiment_csv(path, trial=None):
+    """Uplinks de um CSV do log_data (dados_experimento_*.csv): o payload do
+    nodo é reempacotado a partir das colunas Node_*. Retorna o trial usado."""
+    with open(path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    trial = trial or rows[-1]["Trial_ID"]
+    messages = []
+    for row in rows:
+        if row["Trial_ID"] != str(trial):
+            continue
+        data = ""
+        if row["Node_ID"] != "ERR":
+            raw = GAME_THEORY.encode(
+                int(row["Node_ID"]), int(row["Node_State"]), int(row["Node_Last_Sat"]),
+                int(round(float(row["Node_P_Rew"]) * 100)), 1 if row["Node_Action"] == "REWARD" else 0,
+                int(row["Node_Period"]))
+            data = base64.b64encode(raw).decode()
+        f_cnt = int(row["F_Cnt"]) if row["F_Cnt"] not in ("", "None") else None
+        messages.append(Message(REPLAY_EPOCH + float(row["Sim_Time"]),
+                                CHIRP_TOPIC.format(row["Dev_EUI"]),
+                                chirp_payload(row["Dev_EUI"], f_cnt, data)))
+    return trial, messages
+
+
+def _parse_time(text):
+    # ChirpStack/TTN mandam até nanossegundos; datetime aceita microssegundos
+    text = re.sub(r"(\.\d{6})\d+", r"\1", text.replace("Z", "+00:00"))
+    return datetime.fromisoformat(text).timestamp()
+
+
+def from_jsonl(path):
+    """Eventos de uplink gravados, um JSON por linha: o evento do ChirpStack
+    (campo "time") ou do TTN (campo "received_at"), como veio do broker."""
+    messages = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            if "end_device_ids" in event:
+                t = _parse_time(event["received_at"])
+                topic = TTN_TOPIC.format(event["end_device_ids"]["device_id"])
+            else:
+                t = _parse_time(event["time"])
+                topic = CHIRP_TOPIC.format(event.get("deviceInfo", {}).get("devEui", "unk"))
+            messages.append(Message(t, topic, json.dumps(event).encode()))
+    messages.sort(key=lambda m: m.t)
+    return messages
+
+
+def synthetic(server, nodes, period, duration):
+    """nodes nodos a cada period s, defasados, por duration s."""
+    messages = []
+    raw = base64.b64encode(GAME_THEORY.encode(0, 0, 0, 50, 1, int(period))).decode()
+    for i in range(nodes):
+        dev = f"{i:016x}"
+        t = period * i / nodes
+        f_cnt = 0
+        while t < duration:
+            if server == "gur":
+                messages.append(Message(REPLAY_EPOCH + t, TTN_TOPIC.format(dev), ttn_payload(dev)))
+            else:
+                messages.append(Message(REPLAY_EPOCH + t, CHIRP_TOPIC.format(dev), chirp_payload(dev, f_cnt, raw)))
+            t += period
+            f_cnt += 1
+    messages.sort(key=lambda m: m.t)
+    return messages
+
+
+def start_chirp(out, start):
+    """Novo trial no CSV de saída. O TRIAL_ID do import veio do LOG_FILE
+    padrão, então é recalculado sobre out; o início fica no "trial" de um
+    SessionStore ao lado dele (out.db), como no restore_session."""
+    import chirp_satisfaction_server as server
+    server.check_config()
+    server.clock = VirtualClock(start)
+    server.START_TIME = start
+    server.LOG_FILE = out
+    server.init_log_file()
+    server.TRIAL_ID = server.get_next_trial_id()
+    server.store = SessionStore(os.path.splitext(out)[0] + ".db")
+    server.store.set_state("trial", {"id": server.TRIAL_ID, "start": start})
+    server.periodic_status()
+    server.compaction_tick()
+    return server
+
+
+def start_gur(out, start):
+    import gur_server as server
+    server.clock = VirtualClock(start)
+    server.window_start = server.experiment_start = start
+    server.LOG_FILE = out
+    with open(out, mode="a", newline="") as f:
+        if f.tell() == 0:
+            csv.writer(f).writerow(["timestamp", "device_id", "total_received", "satisfaction"])
+    server.reset_window()
+    server.status_global_tick()
+    server.update_target_tick()
+    return server
+
+
+def replay(server, messages, speed=None):
+    """Entrega as mensagens ao on_message do servidor no horário gravado.
+    speed=None roda tão rápido quanto possível; speed=N segura o ritmo em
+    N vezes o relógio de parede."""
+    clock = server.clock
+    client = ReplayClient()
+    first = messages[0].t
+    started = time.perf_counter()
+    for msg in messages:
+        if speed:
+            delay = (msg.t - first) / speed - (time.perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+        clock.advance_to(msg.t)
+        server.on_message(client, None, msg)
+    return client, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay de uplinks gravados ou sintéticos com relógio virtual.")
+    parser.add_argument("source", nargs="?", help="CSV do experimento (chirp) ou JSON-lines de eventos")
+    parser.add_argument("--server", choices=("chirp", "gur"), default="chirp")
+    parser.add_argument("--trial", help="trial do CSV (padrão: o último)")
+    parser.add_argument("--synthetic", metavar="NODOS,PERIODO,DURACAO",
+                        help="gera o tráfego em vez de ler um arquivo, ex.: 7,60,10800")
+    parser.add_argument("--speed", type=float, help="fator sobre o relógio de parede (padrão: sem espera)")
+    parser.add_argument("-o", "--out", required=True, help="CSV de saída do servidor")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        nodes, period, duration = args.synthetic.split(",")
+        messages = synthetic(args.server, int(nodes), float(period), float(duration))
+        start = REPLAY_EPOCH
+    elif args.source and args.source.endswith(".csv"):
+        trial, messages = from_experiment_csv(args.source, args.trial)
+        start = REPLAY_EPOCH
+        print(f"📂 Trial {trial} de {args.source}")
+    elif args.source:
+        messages = from_jsonl(args.source)
+        start = messages[0].t if messages else REPLAY_EPOCH
+    else:
+        parser.error("informe um arquivo ou --synthetic")
+    if not messages:
+        parser.error("nenhuma mensagem para o replay")
+
+    server = start_chirp(args.out, start) if args.server == "chirp" else start_gur(args.out, start)
+    client, elapsed = replay(server, messages, args.speed)
+    if server.store is not None:
+        server.store.close()
+    span = messages[-1].t - start
+    print(f"⏩ {len(messages)} uplinks, {span:.0f} s virtuais em {elapsed:.2f} s"
+          f" ({span / max(elapsed, 1e-9):.0f}x) | downlinks={client.published} | CSV: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import json
+import sqlite3
+import threading
+
+# === CONFIGURAÇÕES ===
+STORE_FILE = "sessao_servidor.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (t REAL NOT NULL, dev TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS events_t ON events (t);
+CREATE TABLE IF NOT EXISTS devices (dev TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+class SessionStore:
+    """Estado do servidor em SQLite com journal WAL: log append-only dos
+    uplinks da janela, contadores por dispositivo e um snapshot chave/valor
+    (trial, início da janela...). Cada escrita é um commit; com WAL e
+    synchronous=NORMAL isso é um append no -wal, sem fsync por mensagem.
+    Usado pelas callbacks do MQTT e pelos Timers, daí o lock."""
+
+    def __init__(self, path=STORE_FILE):
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def append_event(self, t, dev):
+        with self.lock, self.db:
+            self.db.execute("INSERT INTO events VALUES (?, ?)", (t, dev))
+
+    def events_since(self, cutoff):
+        """Uplinks com t >= cutoff, em ordem: o que ainda conta na janela."""
+        with self.lock:
+            return self.db.execute(
+                "SELECT t, dev FROM events WHERE t >= ? ORDER BY t", (cutoff,)).fetchall()
+
+    def compact(self, cutoff):
+        """Descarta eventos que já saíram da janela."""
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM events WHERE t < ?", (cutoff,))
+
+    def save_device(self, dev, data):
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO devices VALUES (?, ?)", (dev, json.dumps(data)))
+
+    def load_devices(self):
+        with self.lock:
+            rows = self.db.execute("SELECT dev, data FROM devices").fetchall()
+        return {dev: json.loads(data) for dev, data in rows}
+
+    def clear_devices(self):
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM devices")
+
+    def set_state(self, key, value):
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO state VALUES (?, ?)", (key, json.dumps(value)))
+
+    def get_state(self, key, default=None):
+        with self.lock:
+            row = self.db.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def close(self):
+        with self.lock:
+            self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.db.close()
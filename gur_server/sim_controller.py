@@ -0,0 +1,126 @@
+import argparse
+import heapq
+import math
+import random
+import time
+from controller import MAX_PERIOD, MIN_PERIOD, RateController
+from fairness import WindowCounter
+from target_schedule import load_schedule
+
+# === CONFIGURAÇÕES ===
+WINDOW_SECONDS = 300
+SAMPLE_INTERVAL = 10
+# O cronograma de game_theory_v3 foi feito para o testbed de 7 nodos;
+# o alvo é escalado para a população simulada
+TESTBED_NODES = 7
+INITIAL_PERIOD = 60
+# Fração de nodos que começam falando HEAVY_FACTOR vezes mais rápido
+HEAVY_FRACTION = 0.1
+HEAVY_FACTOR = 4
+# Modelo simplificado do nodo game theory: a cada downlink o período anda
+# um passo multiplicativo, para cima em overload e para baixo em underload
+GAME_STEP = 0.1
+# Sorteio de ±10% no período, como o jitter dos nodos reais
+JITTER = 0.1
+SETTLE_BAND = 0.05
+
+
+def simulate(nodes, mode, schedule, duration, uplink_loss, downlink_loss, seed):
+    """Simulação por eventos de `nodes` nodos contra o servidor.
+    mode: "game" (período só reage à flag de overload global), "share" ou
+    "maxmin" (a mesma resposta, com a flag por dispositivo de fairness) ou "pi"
+    (nodo adota o período recomendado pelo RateController).
+    Retorna ([(t, janela, alvo)], índice de Jain no fim)."""
+    rng = random.Random(seed)
+    scale = nodes / TESTBED_NODES
+    controller = RateController(WINDOW_SECONDS)
+    heavy = int(nodes * HEAVY_FRACTION)
+    periods = [INITIAL_PERIOD / HEAVY_FACTOR] * heavy + [float(INITIAL_PERIOD)] * (nodes - heavy)
+    heap = [(rng.uniform(0, periods[i]), i) for i in range(nodes)]
+    heapq.heapify(heap)
+    window = WindowCounter(WINDOW_SECONDS)
+    samples = []
+    next_sample = SAMPLE_INTERVAL
+    while heap:
+        t, i = heapq.heappop(heap)
+        if t > duration:
+            break
+        window.expire(t)
+        while next_sample <= t:
+            samples.append((next_sample, window.total, schedule.target(next_sample) * scale))
+            next_sample += SAMPLE_INTERVAL
+        if rng.random() >= uplink_loss:
+            window.add(t, i)
+            controller.observe(t)
+            target = schedule.target(t) * scale
+            if mode == "pi":
+                period = controller.update(t, target, window.active)
+                overload = False
+            else:
+                overload = window.overload(i, target, None if mode == "game" else mode, t)
+            if rng.random() >= downlink_loss:
+                if mode == "pi":
+                    periods[i] = period
+                elif overload:
+                    periods[i] = min(periods[i] * (1 + GAME_STEP), MAX_PERIOD)
+                else:
+                    periods[i] = max(periods[i] / (1 + GAME_STEP), MIN_PERIOD)
+        heapq.heappush(heap, (t + periods[i] * rng.uniform(1 - JITTER, 1 + JITTER), i))
+    return samples, window.jain()
+
+
+def phase_metrics(samples, start, end):
+    """Acomodação (s até ficar na faixa de ±5% até o fim da fase), overshoot
+    (% do alvo além dele, no sentido do degrau), erro RMS (%) e excesso
+    médio acima do alvo (%, uplinks que só gastam airtime) da fase."""
+    phase = [(t, n, target) for t, n, target in samples if start <= t < end]
+    if not phase:
+        return None
+    target = phase[-1][2]
+    before = [n for t, n, _ in samples if t < start]
+    direction = 1 if not before or target >= before[-1] else -1
+    settled = None
+    for t, n, _ in reversed(phase):
+        if abs(n - target) > SETTLE_BAND * target:
+            break
+        settled = t - start
+    overshoot = max(0.0, max(direction * (n - target) / target for _, n, _ in phase)) * 100
+    rms = math.sqrt(sum(((n - target) / target) ** 2 for _, n, _ in phase) / len(phase)) * 100
+    excess = sum(max(0, n - target) for _, n, _ in phase) / (target * len(phase)) * 100
+    return settled, overshoot, rms, excess
+
+
+def report(nodes, mode, schedule, samples, jain, duration, elapsed):
+    edges = [t for t in schedule.times if t < duration] + [duration]
+    for k, (start, end) in enumerate(zip(edges, edges[1:])):
+        metrics = phase_metrics(samples, start, end)
+        if metrics is None:
+            continue
+        settled, overshoot, rms, excess = metrics
+        settled = f"{settled:6.0f} s" if settled is not None else "  nunca"
+        print(f"{nodes:6d} {mode:5s} fase {k} | acomodação {settled} | "
+              f"overshoot {overshoot:6.1f}% | RMS {rms:6.1f}% | excesso {excess:5.1f}%")
+    print(f"{nodes:6d} {mode:5s} Jain no fim {jain:.3f} ({elapsed:.1f} s de simulação)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara o controlador de taxa com a resposta game theory.")
+    parser.add_argument("--nodes", default="1000,10000", help="populações, separadas por vírgula")
+    parser.add_argument("--modes", default="game,share,maxmin,pi", help="game, share, maxmin e/ou pi")
+    parser.add_argument("--schedule", default="game_theory_v3.json")
+    parser.add_argument("--duration", type=float, default=3 * 3600)
+    parser.add_argument("--uplink-loss", type=float, default=0.05)
+    parser.add_argument("--downlink-loss", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    schedule = load_schedule(args.schedule)
+    for nodes in (int(n) for n in args.nodes.split(",")):
+        for mode in args.modes.split(","):
+            started = time.perf_counter()
+            samples, jain = simulate(nodes, mode, schedule, args.duration,
+                                     args.uplink_loss, args.downlink_loss, args.seed)
+            report(nodes, mode, schedule, samples, jain, args.duration, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import json
+import math
+import os
+from bisect import bisect_right
+
+# === CONFIGURAÇÕES ===
+SCHEDULE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schedules")
+KINDS = ("piecewise", "ramp")
+# Numa rampa o next_change() fica esse tanto (s) depois do cruzamento de
+# k + 0.5: descendo, no próprio cruzamento floor(v + 0.5) ainda dá o valor
+# antigo, e com horários de 1.7e9 s um Timer pode acordar um erro de
+# arredondamento antes dele
+CROSSING_MARGIN = 1e-3
+
+
+class Schedule:
+    """Alvo de mensagens por janela em função do tempo do experimento (s).
+    points: [(t, alvo), ...] compilados em tuplas ordenadas; target() é uma
+    busca binária e next_change() diz quando reagendar, sem polling.
+      piecewise: degraus, vale o último ponto com t <= tempo
+      ramp: interpolação linear entre pontos, arredondada para inteiro
+      period: repete os pontos a cada period segundos (ciclos); antes do
+              primeiro ponto do ciclo vale o último do ciclo anterior"""
+
+    def __init__(self, points, kind="piecewise", period=None):
+        if kind not in KINDS:
+            raise ValueError(f"Tipo de cronograma desconhecido: {kind}")
+        if not points:
+            raise ValueError("Cronograma sem pontos")
+        points = sorted((float(t), v) for t, v in points)
+        self.kind = kind
+        self.period = period
+        self.times = tuple(t for t, _ in points)
+        self.values = tuple(v for _, v in points)
+        if period is not None and self.times[-1] >= period:
+            raise ValueError("Pontos além do período")
+
+    def _segment(self, t):
+        """(tempo dentro do ciclo, início do ciclo, índice do ponto em vigor)."""
+        base = 0.0
+        if self.period:
+            base = t - t % self.period
+            t -= base
+        return t, base, bisect_right(self.times, t) - 1
+
+    def target(self, t):
+        t, _, i = self._segment(t)
+        if i < 0:
+            return self.values[-1] if self.period else self.values[0]
+        if self.kind == "ramp" and i + 1 < len(self.times):
+            return math.floor(self._ramp(i, t) + 0.5)
+        return self.values[i]
+
+    def _ramp(self, i, t):
+        t0, t1 = self.times[i], self.times[i + 1]
+        v0, v1 = self.values[i], self.values[i + 1]
+        return v0 + (v1 - v0) * (t - t0) / (t1 - t0)
+
+    def next_change(self, t):
+        """Próximo instante (> t) em que o alvo pode mudar, None se nunca mais."""
+        local, base, i = self._segment(t)
+        n = len(self.times)
+        if self.kind == "ramp" and 0 <= i < n - 1:
+            t0, t1 = self.times[i], self.times[i + 1]
+            slope = (self.values[i + 1] - self.values[i]) / (t1 - t0)
+            if slope:
+                # próximo cruzamento de k + 0.5, onde o arredondamento muda
+                v = self._ramp(i, local)
+                if slope > 0:
+                    crossing = math.floor(v + 0.5) + 0.5
+                else:
+                    crossing = math.ceil(v - 0.5) - 0.5
+                at = t0 + (crossing - self.values[i]) / slope + CROSSING_MARGIN
+                if local < at < t1:
+                    return base + at
+            return base + t1
+        if i + 1 < n:
+            return base + self.times[i + 1]
+        if self.period:
+            return base + self.period + self.times[0]
+        return None
+
+    def to_dict(self):
+        spec = {"type": self.kind, "points": [[t, v] for t, v in zip(self.times, self.values)]}
+        if self.period:
+            spec["period"] = self.period
+        return spec
+
+
+def check(schedule, until):
+    """Segue next_change() de 0 até until como o Timer do servidor e devolve
+    os instantes em que ele acordou tarde: o alvo já tinha mudado antes."""
+    late = []
+    t = 0.0
+    value = schedule.target(t)
+    while True:
+        wake = schedule.next_change(t)
+        if wake is None or wake > until:
+            return late
+        if schedule.target(wake - 2 * CROSSING_MARGIN) != value:
+            late.append(wake)
+        t = wake
+        value = schedule.target(t)
+
+
+def load_schedule(path):
+    """Lê um cronograma JSON: {"type": "piecewise"|"ramp", "points": [[t, alvo], ...],
+    "period": opcional}. Caminhos relativos são procurados em schedules/."""
+    if not os.path.isabs(path) and not os.path.exists(path):
+        path = os.path.join(SCHEDULE_DIR, path)
+    with open(path) as f:
+        spec = json.load(f)
+    return Schedule(spec["points"], spec.get("type", "piecewise"), spec.get("period"))
+
+
+if __name__ == "__main__":
+    # python target_schedule.py [cronograma.json ...]: confere que nenhuma
+    # mudança de alvo acontece antes do next_change() que a anuncia
+    import sys
+    schedules = [("rampa subindo", Schedule([[0, 0], [100, 10]], "ramp")),
+                 ("rampa descendo", Schedule([[0, 10], [100, 0]], "ramp")),
+                 ("rampa periódica", Schedule([[0, 10], [50, 0]], "ramp", period=100)),
+                 ("degraus periódicos a partir de t>0", Schedule([[10, 5], [20, 9]], period=30))]
+    schedules += [(path, load_schedule(path)) for path in sys.argv[1:]]
+    failed = False
+    for name, schedule in schedules:
+        late = check(schedule, 1000 + 2 * max(schedule.times))
+        failed |= bool(late)
+        print(f"{'❌' if late else '✅'} {name}: " + (f"{len(late)} mudanças atrasadas, a 1ª vista em t={late[0]:.3f}"
+                                                     if late else "nenhuma mudança atrasada"))
+    sys.exit(1 if failed else 0)
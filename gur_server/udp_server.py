@@ -0,0 +1,263 @@
+import asyncio
+import base64
+import json
+
+import chirp_satisfaction_server as satisfaction
+from adr import AdrEngine, link_from_rxpk
+from channel_load import from_rxpk
+from dedup import Deduplicator, frame_key
+from devices import DEVICES
+from downlink import DownlinkScheduler, build_frame
+from gateway_stats import GatewayStats
+from lorawan_crypto import REJECT_FCNT, UPLINK, FrameCrypto
+from pipeline import Pipeline
+
+# === CONFIGURAÇÕES ===
+# Aponte server_address / serv_port_up / serv_port_down do global_conf.json
+# do lora_pkt_fwd para cá no lugar do TTN / ChirpStack
+UDP_HOST = "0.0.0.0"
+UDP_PORT = 1700
+SATISFACTION_FPORT = 2
+# Nodos ABP voltam ao FCnt 0 a cada boot (end-node/main.py) e o FCntUp vem
+# do SQLite: aceita o reset quando o MIC confere (skip FCnt check do ChirpStack).
+# Um dispositivo pode sobrescrever com "relax_fcnt" em devices.py
+RELAX_FCNT = True
+# Plano de frequências do gateway (global_conf.json aponta para au1)
+REGION = "AU"
+# Sub-banda dos nodos (end-node/config.py), mantida nos LinkADRReq
+SUB_BAND = 2
+# ADR da rede: LinkADRReq no FOpts do downlink quando a margem de SNR permite
+ADR_ENABLED = True
+STATS_INTERVAL = 60
+# Fila entre o loop asyncio e o processamento dos uplinks (CSV, SQLite, lock
+# da janela): no loop ficam só a deduplicação e o envio dos PULL_RESP
+PIPELINE_WORKERS = 1
+PIPELINE_QUEUE = 4096
+PIPELINE_POLICY = "shed"
+
+# === PROTOCOLO SEMTECH (packet_forwarder/PROTOCOL.TXT) ===
+PROTOCOL_VERSION = 2
+PUSH_DATA = 0x00
+PUSH_ACK = 0x01
+PULL_DATA = 0x02
+PULL_RESP = 0x03
+PULL_ACK = 0x04
+TX_ACK = 0x05
+
+
+class Session:
+    """Sessão ABP de um nodo: contexto AES em cache e FCntDown."""
+    def __init__(self, dev_addr, nwkskey, appskey, dev_id=None, relax_fcnt=RELAX_FCNT):
+        self.dev_addr = dev_addr
+        self.dev_id = dev_id or dev_addr
+        address = bytes.fromhex(dev_addr)
+        self.aes = FrameCrypto(address, bytes.fromhex(appskey), bytes.fromhex(nwkskey), relax_fcnt)
+        # Contexto só do downlink: o frame é montado no worker enquanto o loop
+        # decifra uplinks, e o contexto ECB não é thread-safe
+        self.downlink_aes = FrameCrypto(address, bytes.fromhex(appskey), bytes.fromhex(nwkskey))
+        # DevAddr como aparece no frame (LSB primeiro), chave do lookup
+        self.key = address[::-1]
+        self.fcnt_down = 0
+
+
+class SemtechUDPServer(asyncio.DatagramProtocol):
+    """Endpoint UDP do lora_pkt_fwd: confirma PUSH_DATA/PULL_DATA,
+    valida MIC, decifra os rxpk e entrega um Uplink deduplicado para
+    on_uplink(server, uplink, shedding), chamado num worker do Pipeline.
+    on_uplink devolve (fport, payload, fopts) do downlink ou None; o frame
+    é montado e os contadores salvos no worker, e o loop só o agenda."""
+
+    def __init__(self, devices, on_uplink, region=REGION, store=None, workers=PIPELINE_WORKERS,
+                 queue_size=PIPELINE_QUEUE, policy=PIPELINE_POLICY):
+        self.sessions = {}
+        for dev_addr, keys in devices.items():
+            session = Session(dev_addr, keys["nwkskey"], keys["appskey"], keys.get("dev_id"),
+                              keys.get("relax_fcnt", RELAX_FCNT))
+            self.sessions[session.key] = session
+        self.on_uplink = on_uplink
+        # FCntUp/FCntDown persistidos: o nodo rejeita FCntDown repetido após um restart
+        self.store = store
+        if store is not None:
+            self.restore(store.load_devices())
+        # gateway EUI -> endereço UDP do último PULL_DATA (downlinks)
+        self.gateways = {}
+        self.transport = None
+        self.loop = None
+        self.dedup = None
+        self.downlink = DownlinkScheduler(self, region)
+        self.adr = AdrEngine(region, SUB_BAND)
+        # séries dos objetos "stat" de cada gateway (rxnb, rxok, ackr, txnb...)
+        self.gateway_stats = GatewayStats()
+        # um dispositivo sempre no mesmo worker: FCnt e FCntDown em ordem
+        self.pipeline = Pipeline(self.process, workers, queue_size, policy, name="udp")
+        self.stats = {
+            "push_data": 0, "pull_data": 0, "rxpk": 0, "uplinks": 0,
+            "crc_error": 0, "unknown_devaddr": 0, "duplicate": 0,
+            "mic_fail": 0, "fcnt_rejected": 0, "fcnt_reset": 0, "bad_packet": 0,
+        }
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.loop = asyncio.get_running_loop()
+        self.dedup = Deduplicator(self.loop, self.emit)
+
+    def datagram_received(self, data, addr):
+        if len(data) < 4 or data[0] != PROTOCOL_VERSION:
+            self.stats["bad_packet"] += 1
+            return
+        ident = data[3]
+        if ident == PUSH_DATA:
+            # ACK antes de processar, o gateway só espera o ACK
+            self.transport.sendto(data[:3] + b"\x01", addr)
+            self.stats["push_data"] += 1
+            self.handle_push_data(data[4:12].hex().upper(), data[12:])
+        elif ident == PULL_DATA:
+            self.transport.sendto(data[:3] + b"\x04", addr)
+            self.stats["pull_data"] += 1
+            self.gateways[data[4:12].hex().upper()] = addr
+        elif ident == TX_ACK:
+            self.downlink.handle_tx_ack((data[1] << 8) | data[2], data[12:])
+        else:
+            self.stats["bad_packet"] += 1
+
+    def handle_push_data(self, gateway, body):
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            self.stats["bad_packet"] += 1
+            return
+        stat = payload.get("stat")
+        if stat:
+            self.gateway_stats.record(gateway, stat, satisfaction.clock.time())
+        for rxpk in payload.get("rxpk", ()):
+            self.handle_rxpk(gateway, rxpk)
+
+    def handle_rxpk(self, gateway, rxpk):
+        self.stats["rxpk"] += 1
+        if rxpk.get("stat", 1) != 1:
+            self.stats["crc_error"] += 1
+            return
+        try:
+            phy = base64.b64decode(rxpk["data"])
+        except (KeyError, ValueError):
+            self.stats["bad_packet"] += 1
+            return
+        session = self.sessions.get(phy[1:5])
+        if session is None:
+            self.stats["unknown_devaddr"] += 1
+            return
+        # mesmo frame ouvido por mais de um gateway: só junta os metadados
+        key = frame_key(phy)
+        if self.dedup.merge(key, gateway, rxpk):
+            self.stats["duplicate"] += 1
+            return
+        aes = session.aes
+        payload = aes.decrypt_payload(phy, len(phy), UPLINK)
+        if payload is None:
+            # MIC válido mas FCnt repetido ou muito à frente não é falha de MIC
+            self.stats["fcnt_rejected" if aes.rejected == REJECT_FCNT else "mic_fail"] += 1
+            return
+        if aes.fcnt_reset:
+            self.stats["fcnt_reset"] += 1
+        uplink = self.dedup.open(key, phy, gateway, rxpk)
+        uplink.session = session
+        uplink.fport = aes.fport
+        uplink.f_cnt = aes.frame_counter_up
+        uplink.payload = payload
+        uplink.fopts = aes.fopts
+
+    def emit(self, uplink):
+        """Fim da janela de coleta: um evento por frame, com todos os gateways."""
+        self.stats["uplinks"] += 1
+        self.pipeline.submit(uplink.session.dev_addr, uplink)
+
+    def process(self, uplink, shedding):
+        """Worker do Pipeline: aplicação, frame do downlink e contadores em disco."""
+        session = uplink.session
+        answer = self.on_uplink(self, uplink, shedding)
+        frame = build_frame(session, *answer) if answer is not None else None
+        if self.store is not None:
+            self.store.save_device(session.dev_addr, {"f_cnt_up": uplink.f_cnt,
+                                                      "f_cnt_down": session.fcnt_down})
+        if frame is not None:
+            self.loop.call_soon_threadsafe(self.downlink.send, session, uplink, frame)
+
+    def restore(self, saved):
+        for session in self.sessions.values():
+            counters = saved.get(session.dev_addr)
+            if counters:
+                session.aes.frame_counter_up = counters["f_cnt_up"]
+                session.fcnt_down = counters["f_cnt_down"]
+
+
+def feed_satisfaction(server, uplink, shedding=False):
+    """Entrega o uplink direto para a lógica de satisfação, sem broker MQTT.
+    Roda no worker do Pipeline; devolve (fport, payload, fopts) do downlink."""
+    if uplink.fport != SATISFACTION_FPORT:
+        return None
+    session = uplink.session
+    rxpk = uplink.best()[1]
+    node_data = satisfaction.unpack_node_bytes(uplink.payload)
+    sat, is_overload, period = satisfaction.process_uplink(session.dev_id, uplink.f_cnt, node_data,
+                                                           quiet=shedding, airtime=from_rxpk(rxpk))
+    server.adr.answer(session.dev_id, uplink.fopts)
+    server.adr.add(session.dev_id, link_from_rxpk(rxpk, server.adr.region))
+    fopts = server.adr.link_adr_req(session.dev_id) if ADR_ENABLED else b""
+    return SATISFACTION_FPORT, satisfaction.downlink_payload(sat, is_overload, period), fopts
+
+
+async def stats_tick(server):
+    last = dict(server.stats)
+    while True:
+        await asyncio.sleep(STATS_INTERVAL)
+        # resumo do console da satisfação pendente, mesmo sem tráfego
+        satisfaction.console.flush()
+        now = dict(server.stats)
+        rate = (now["rxpk"] - last["rxpk"]) / STATS_INTERVAL
+        print(f"📡 UDP | rxpk={now['rxpk']} ({rate:.1f}/s) | válidos={now['uplinks']}"
+              f" | MIC={now['mic_fail']} | FCnt={now['fcnt_rejected']} (resets {now['fcnt_reset']})"
+              f" | dup={now['duplicate']} | gateways={len(server.gateways)}")
+        down = server.downlink.stats
+        errors = ", ".join(f"{e}={n}" for e, n in server.downlink.errors.items()) or "-"
+        print(f"📤 Downlink | RX1={down['rx1']} RX2={down['rx2']} | ok={down['acked']}"
+              f" | reenvios={down['retried']} | perdidos={down['missed']} | erros: {errors}")
+        spread = server.dedup.latency()["spread"]
+        print(f"🔁 Dedup | cópias/frame={server.dedup.stats['copies'] / max(1, now['uplinks']):.2f}"
+              f" | atrasadas={server.dedup.stats['late']} | espalhamento p50={spread['p50']}ms"
+              f" p95={spread['p95']}ms max={spread['max']}ms")
+        print(f"📻 ADR | {server.adr.summary()}")
+        print(f"📥 Fila | {server.pipeline.summary()}")
+        for gateway in server.gateway_stats.gateways():
+            row = server.gateway_stats.query(gateway, satisfaction.clock.time() - STATS_INTERVAL, step=STATS_INTERVAL)
+            if row:
+                row = row[-1]
+                print(f"📶 GW {gateway} | rxnb={row['rxnb']} rxok={row['rxok']} (ruins {row['rx_bad']:.0%})"
+                      f" | ackr={row['ackr']}% | dwnb={row['dwnb']} txnb={row['txnb']}")
+        last = now
+
+
+async def serve(host=UDP_HOST, port=UDP_PORT):
+    loop = asyncio.get_running_loop()
+    server = SemtechUDPServer(DEVICES, feed_satisfaction, store=satisfaction.store)
+    transport, _ = await loop.create_datagram_endpoint(lambda: server, local_addr=(host, port))
+    print(f"✅ Servidor UDP Semtech em {host}:{port}. Iniciando Trial {satisfaction.TRIAL_ID}.")
+    try:
+        await stats_tick(server)
+    finally:
+        transport.close()
+        server.pipeline.stop()
+
+
+def main():
+    satisfaction.check_config()
+    satisfaction.init_log_file()
+    satisfaction.restore_session()
+    satisfaction.compaction_tick()
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print("Encerrando servidor...")
+
+
+if __name__ == "__main__":
+    main()